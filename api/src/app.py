@@ -1,9 +1,16 @@
 import os
+import hmac
 import logging
-from flask import Flask, send_from_directory, request, jsonify
-from data_processing import process_uploaded_file
+import json
+import time
+from flask import Flask, Response, g, send_from_directory, request, jsonify, stream_with_context
+from data_processing import UploadTooLarge, iter_uploaded_products
 from matching_engine import match_products_with_vector_search_in_batches
-from utils import load_internal_products_from_gcs  # Import the utility function
+from jobs import JobManager, create_job_store, group_job_results
+from metrics import HTTP_REQUEST_SECONDS, MATCH_TRACE, metrics_response, start_trace
+from startup import WARM_UP_ON_START, get_warm_up
+from clients import get_client_registry
+from catalog import get_catalog_manager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -12,18 +19,91 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 static_path = os.path.join(os.path.dirname(__file__), "../frontend/public")
 app = Flask(__name__, static_folder=static_path)
 
-# Load internal products from GCS
-PROJECT_ID = "genai-product-matching"  # Replace with your GCP project ID
-BUCKET_NAME = "genai-product-matching-data"  # Replace with your GCS bucket name
-FILE_NAME = "Data_Internal_cleaned.csv"  # Replace with your file name in GCS
+# Load the catalog metadata, indexes and clients in the background so the server starts accepting
+# connections right away; /readyz reports when they are available
+if WARM_UP_ON_START:
+    get_warm_up().start()
 
-try:
-    logging.info("Loading internal products from GCS...")
-    internal_products = load_internal_products_from_gcs(PROJECT_ID, BUCKET_NAME, FILE_NAME)
-    logging.info("Internal products loaded successfully.")
-except Exception as e:
-    logging.error(f"Failed to load internal products from GCS: {str(e)}")
-    internal_products = None
+# Shared secret expected in the X-Admin-Token header of the /api/admin routes (unset: the routes answer 403)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Background match jobs
+job_manager = JobManager(create_job_store(), match_products_with_vector_search_in_batches)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    # Label by route pattern rather than raw path to keep the number of series bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(
+        time.perf_counter() - g.get("request_started", time.perf_counter())
+    )
+    return response
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    readiness = get_warm_up().readiness()
+    return jsonify(readiness), 200 if readiness["ready"] else 503
+
+@app.route("/healthz/clients")
+def client_health():
+    health = get_client_registry().check_health()
+    healthy = all(client["status"] != "failed" for client in health.values())
+    return jsonify(health), 200 if healthy else 503
+
+@app.route("/api/warmup", methods=["POST"])
+def warm_up():
+    logging.info("Received request to /api/warmup")
+    timeout = float(request.args.get("timeout", 60))
+    get_warm_up().wait(timeout)
+    readiness = get_warm_up().readiness()
+    return jsonify(readiness), 200 if readiness["ready"] else 503
+
+def admin_authorized():
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+
+@app.route("/api/admin/catalog", methods=["GET"])
+def catalog_status():
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(get_catalog_manager().status())
+
+@app.route("/api/admin/catalog/reload", methods=["POST"])
+def reload_catalog():
+    logging.info("Received request to /api/admin/catalog/reload")
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    # Optional JSON body overriding the catalog source (see catalog.build_catalog_snapshot);
+    # without one, the active snapshot's source is loaded again
+    source = request.get_json(silent=True)
+    if source is not None and not isinstance(source, dict):
+        return jsonify({"error": "The request body must be a JSON object."}), 400
+    manager = get_catalog_manager()
+    try:
+        started = manager.reload(source)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not started:
+        return jsonify(dict(manager.status(), error="A catalog reload is already running.")), 409
+    # The swap happens in the background; ?wait=true returns once the new snapshot is active (or failed)
+    if request.args.get("wait", "").lower() == "true":
+        manager.wait(float(request.args.get("timeout", 300)))
+    status = manager.status()
+    if status["reloading"]:
+        return jsonify(status), 202
+    return jsonify(status), 200 if status["lastReload"]["status"] == "succeeded" else 500
+
+@app.route("/metrics")
+def metrics():
+    body, content_type = metrics_response()
+    return Response(body, mimetype=content_type)
 
 # Serve index.html for root path
 @app.route("/")
@@ -56,23 +136,24 @@ def match_product():
         logging.warning("No file uploaded in the request.")
         return jsonify({"error": "No file uploaded"}), 400
 
+    # Attach the per-stage timing summary to the response when MATCH_TRACE is set or ?trace=true is passed
+    include_trace = MATCH_TRACE or request.args.get("trace", "").lower() == "true"
     try:
-        # Process and clean the uploaded file
-        logging.info("Processing uploaded file...")
-        df = process_uploaded_file(file)
-        external_products = df["text"].tolist()
-        logging.info(f"Extracted {len(external_products)} products from the uploaded file.")
-
-        # Call the matching engine
-        logging.info("Calling the matching engine...")
-        results = match_products_with_vector_search_in_batches(
-            external_products=external_products,
-            batch_size=250,
-            max_calls_per_minute=5
-        )
+        with start_trace() as trace:
+            # The uploaded file is parsed and cleaned chunk by chunk while the first batches are matched
+            logging.info("Calling the matching engine...")
+            results = match_products_with_vector_search_in_batches(
+                external_products=iter_uploaded_products(file),
+                batch_size=250
+            )
         logging.info("Matching engine returned results successfully.")
+        if include_trace:
+            results["trace"] = trace.summary()
         return jsonify(results)
 
+    except UploadTooLarge as e:
+        logging.error(f"Upload rejected: {str(e)}")
+        return jsonify({"error": str(e)}), 413
     except ValueError as e:
         logging.error(f"ValueError occurred: {str(e)}")
         return jsonify({"error": str(e)}), 400
@@ -80,6 +161,52 @@ def match_product():
         logging.error(f"An unexpected error occurred: {str(e)}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+@app.route("/api/jobs", methods=["POST"])
+def create_match_job():
+    logging.info("Received request to /api/jobs")
+    file = request.files.get("external")
+    if not file:
+        logging.warning("No file uploaded in the request.")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        # The job outlives the request, so the upload is read completely before it is queued
+        external_products = list(iter_uploaded_products(file))
+        job_id = job_manager.submit(external_products)
+        return jsonify({"jobId": job_id, "status": "queued", "total": len(external_products)}), 202
+    except UploadTooLarge as e:
+        logging.error(f"Upload rejected: {str(e)}")
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        logging.error(f"ValueError occurred: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_match_job(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "completed":
+        job["result"] = group_job_results(job_manager.store.get_results(job_id))
+    return jsonify(job)
+
+@app.route("/api/jobs/<job_id>/stream", methods=["GET"])
+def stream_match_job(job_id):
+    if job_manager.store.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def generate():
+        for result in job_manager.stream_results(job_id):
+            yield json.dumps(result) + "\n"
+        job = job_manager.store.get(job_id)
+        if job is None:
+            # Pruned or evicted while it was being streamed
+            yield json.dumps({"event": "end", "jobId": job_id, "status": "expired", "error": None}) + "\n"
+            return
+        yield json.dumps({"event": "end", "jobId": job_id, "status": job["status"], "error": job["error"]}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 # Main entrypoint
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from bigquery_client import CatalogMetadataStore
+from normalization import char_ngrams, normalize_product_text
+
+# Local, deterministic stand-ins for the Google services used by matching_engine.py.
+# Each one has a configurable latency (fixed + uniform jitter, in seconds) and quota error rate,
+# and records the latency of every call it serves.
+
+FakeEmbedding = namedtuple("FakeEmbedding", ["values"])
+FakeEmbedResponse = namedtuple("FakeEmbedResponse", ["embeddings"])
+FakeMessage = namedtuple("FakeMessage", ["content"])
+
+QUOTA_ERROR_MESSAGE = "429 RESOURCE_EXHAUSTED: quota exceeded (simulated)"
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class FakeUpstream:
+    """
+    Latency and quota error behaviour shared by the stand-ins.
+    """
+
+    def __init__(self, name, latency=0.0, jitter=0.0, quota_error_rate=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_error_rate = quota_error_rate
+        self.calls = 0
+        self.quota_errors = 0
+        self.latencies = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next_call(self):
+        """
+        Return (delay in seconds, True if the call must fail with a quota error).
+        """
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.quota_error_rate
+            if failed:
+                self.quota_errors += 1
+        return delay, failed
+
+    def _record(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def _call(self, function):
+        delay, failed = self._next_call()
+        start = time.perf_counter()
+        if delay:
+            time.sleep(delay)
+        try:
+            if failed:
+                raise RuntimeError(QUOTA_ERROR_MESSAGE)
+            return function()
+        finally:
+            self._record(time.perf_counter() - start)
+
+    async def _acall(self, function):
+        delay, failed = self._next_call()
+        start = time.perf_counter()
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            if failed:
+                raise RuntimeError(QUOTA_ERROR_MESSAGE)
+            return function()
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.quota_errors = 0
+            self.latencies = []
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+            return {
+                "calls": self.calls,
+                "quota_errors": self.quota_errors,
+                "p50_seconds": float(np.percentile(latencies, 50)),
+                "p99_seconds": float(np.percentile(latencies, 99)),
+            }
+
+
+class FakeEmbedder(FakeUpstream):
+    """
+    Stand-in for genai.Client: the embedding of a text is the normalized sum of hash-seeded random
+    vectors of its tokens and character trigrams, so it is deterministic and names sharing words
+    and spellings are close, as with the real model.
+    """
+
+    def __init__(self, dimensionality=768, **kwargs):
+        super().__init__("embeddings", **kwargs)
+        self.dimensionality = dimensionality
+        self.models = self
+        self._features = {}
+
+    def _feature(self, feature):
+        vector = self._features.get(feature)
+        if vector is None:
+            rng = np.random.default_rng(_stable_hash(feature))
+            vector = rng.standard_normal(self.dimensionality).astype(np.float32)
+            self._features[feature] = vector
+        return vector
+
+    def embed(self, texts):
+        """
+        Embed texts directly, without latency or errors (used to build the catalog index).
+        Returns:
+            ndarray: One L2-normalized row per text.
+        """
+        matrix = np.zeros((len(texts), self.dimensionality), dtype=np.float32)
+        for row, text in enumerate(texts):
+            key = normalize_product_text(text)
+            for token in key.split():
+                matrix[row] += self._feature(f"w:{token}")
+            for gram in char_ngrams(key):
+                matrix[row] += 0.5 * self._feature(f"g:{gram}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_content(self, model, contents, config=None):
+        return self._call(lambda: FakeEmbedResponse([FakeEmbedding(row.tolist()) for row in self.embed(contents)]))
+
+
+class FakeNeighborSearch(FakeUpstream):
+    """
+    Stand-in for the Vertex index endpoint, answering from a local index.
+    """
+
+    def __init__(self, index, **kwargs):
+        super().__init__("vector_search", **kwargs)
+        self.index = index
+
+    def find_neighbors(self, embeddings, neighbor_count=10):
+        return self._call(lambda: self.index.find_neighbors(embeddings, neighbor_count))
+
+    def similarities(self, embeddings, candidate_ids):
+        return self.index.similarities(embeddings, candidate_ids)
+
+
+class FakeCatalogStore(CatalogMetadataStore):
+    """
+    Stand-in for the BigQuery id -> name table, serving an in-memory map.
+    Every load or batched fetch pays the configured latency and may fail with a quota error.
+    """
+
+    def __init__(self, records, preload=True, **kwargs):
+        super().__init__(table="fake", preload=preload)
+        self.backing_records = dict(records)
+        self.upstream = FakeUpstream("catalog", **kwargs)
+
+    def _table_version(self):
+        return "fake"
+
+    def load_all(self):
+        self.upstream._call(lambda: None)
+        with self._lock:
+            self._records = dict(self.backing_records)
+            self.version = "fake"
+            self._loaded = True
+            self._last_version_check = time.monotonic()
+
+    def fetch_missing(self, datapoint_ids):
+        missing = sorted({i for i in datapoint_ids if i not in self._records})
+        if not missing:
+            return
+        self.upstream._call(lambda: None)
+        with self._lock:
+            for datapoint_id in missing:
+                self._records[datapoint_id] = self.backing_records.get(datapoint_id)
+
+    def reset(self):
+        self.upstream.reset()
+
+    def stats(self):
+        return self.upstream.stats()
+
+
+_CANDIDATE_ROW = re.compile(r"^\s*\| (\S+) \| (.*) \|\s*$", re.MULTILINE)
+
+
+class ScriptedLLM(FakeUpstream):
+    """
+    Stand-in for the Gemini chat model. A fixed, hash-chosen share of the uploaded products
+    (`confident_rate`) is confirmed against the first possible match; the others are rejected.
+    """
+
+    def __init__(self, confident_rate=0.6, **kwargs):
+        super().__init__("llm", **kwargs)
+        self.confident_rate = confident_rate
+
+    def _verdict(self, section, stop):
+        uploaded = section.split("Uploaded Product:", 1)[1].split("\n", 1)[0].strip()
+        table = section.split("Possible Matches:", 1)[1].split(stop, 1)[0]
+        candidates = [m for m in _CANDIDATE_ROW.findall(table) if m[0] != "datapoint_id"]
+        confident = bool(candidates) and _stable_hash(uploaded) % 1000 < self.confident_rate * 1000
+        return {
+            "is_confident": confident,
+            "matched_datapoint_id": candidates[0][0] if confident else None,
+            "long_name": candidates[0][1].strip() if confident else None,
+            "reason": "Scripted answer.",
+        }
+
+    def _answer(self, prompt):
+        if "### Product " not in prompt:
+            return FakeMessage(json.dumps(self._verdict(prompt, "Here are examples")))
+        # Batched prompt: one verdict per product section, as a JSON array
+        sections = prompt.split("### Product ")[1:]
+        answers = [
+            dict(self._verdict(section, "Now, compare"), product_index=int(section.split("\n", 1)[0]))
+            for section in sections
+        ]
+        return FakeMessage(json.dumps(answers))
+
+    def invoke(self, prompt):
+        return self._call(lambda: self._answer(prompt))
+
+    async def ainvoke(self, prompt):
+        return await self._acall(lambda: self._answer(prompt))
+
+
+_ABBREVIATIONS = {"chocolate": "choc", "extra": "xtra", "original": "orig", "strawberry": "strwb", "peanut": "pnut"}
+
+
+def synthetic_uploads(long_names, count, seed=0):
+    """
+    Generate uploaded product names from catalog names, mixing exact copies, reformatted copies
+    (case, brackets, unit spacing), lossy variants (abbreviated or dropped words) and names
+    stitched from two unrelated products.
+    Args:
+        long_names (list): Catalog LONG_NAME values.
+        count (int): Number of names to generate.
+        seed (int): Random seed.
+
+    Returns:
+        list: The uploaded product names.
+    """
+    rng = random.Random(seed)
+    uploads = []
+    for _ in range(count):
+        name = rng.choice(long_names)
+        kind = rng.random()
+        if kind < 0.15:
+            uploads.append(name)
+        elif kind < 0.4:
+            uploads.append(re.sub(r"\((\d+(?:\.\d+)?)(\w+)\)", r"\1 \2", name).upper())
+        elif kind < 0.85:
+            words = normalize_product_text(name).split()
+            words = [_ABBREVIATIONS.get(word, word) for word in words]
+            droppable = [i for i, word in enumerate(words) if not any(c.isdigit() for c in word)]
+            if len(droppable) > 2:
+                del words[rng.choice(droppable)]
+            uploads.append(" ".join(words).upper())
+        else:
+            other = rng.choice(long_names).split()
+            words = name.split()
+            uploads.append(" ".join(words[:len(words) // 2] + other[len(other) // 2:]))
+    return uploads
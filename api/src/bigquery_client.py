@@ -1,26 +1,266 @@
 # BigQuery integration
+import csv
+import logging
+import os
+import threading
+import time
 from google.cloud import bigquery
+from utils import download_gcs_file_cached
+from clients import CLIENT_HEALTH_CHECK_TIMEOUT, get_client, mount_http_pool, register_client
+
+PROJECT_ID = "genai-product-matching"
+LOCATION = "northamerica-northeast1"
+EMBEDDING_TABLE = "genai-product-matching.embedding_dataset.embedding"
+
+# Load the whole id -> name map at startup (default) or only fetch the ids each batch needs
+CATALOG_PRELOAD = os.environ.get("CATALOG_PRELOAD", "true").lower() == "true"
+# Optional local id/metadata table (e.g. id_embedding_table.csv) used instead of BigQuery
+CATALOG_METADATA_PATH = os.environ.get("CATALOG_METADATA_PATH")
+# Optional "bucket/path" of the same table in GCS (e.g. the `.ids.csv` sidecar of an embedding store),
+# cached on local disk and revalidated with the object generation instead of querying BigQuery
+CATALOG_SNAPSHOT_GCS = os.environ.get("CATALOG_SNAPSHOT_GCS")
+# Minimum number of seconds between two table version checks
+CATALOG_REFRESH_INTERVAL = int(os.environ.get("CATALOG_REFRESH_INTERVAL", 300))
+
+register_client(
+    "bigquery",
+    lambda: mount_http_pool(bigquery.Client(project=PROJECT_ID, location=LOCATION)),
+    lambda client: list(client.list_datasets(max_results=1, timeout=CLIENT_HEALTH_CHECK_TIMEOUT)),
+)
+
+
+def get_bigquery_client():
+    """
+    Return the process-wide BigQuery client, creating it on first use.
+    """
+    return get_client("bigquery")
+
+
+def query_bigquery(query, query_parameters=None):
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters) if query_parameters else None
+    return get_bigquery_client().query(query, job_config=job_config).result()
+
+
+class CatalogMetadataStore:
+    """
+    In-memory map of catalog datapoint ids to their NAME, OCS_NAME and LONG_NAME.
+    Either preloads the whole table once, or fetches missing ids with one query per batch.
+    The map is reloaded when the table's last-modified version changes.
+    """
+
+    def __init__(self, table=EMBEDDING_TABLE, preload=CATALOG_PRELOAD, refresh_interval=CATALOG_REFRESH_INTERVAL):
+        self.table = table
+        self.preload = preload
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self._records = {}
+        self._loaded = False
+        self._last_version_check = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Build a store from a local CSV with `id`, `NAME`, `OCS_NAME` and `LONG_NAME` columns.
+        Args:
+            path (str): Path to the CSV file (e.g. id_embedding_table.csv).
+
+        Returns:
+            CatalogMetadataStore: A fully loaded store that never queries BigQuery.
+        """
+        records = {}
+        with open(path, mode="r", encoding="utf-8") as csv_file:
+            for row in csv.DictReader(csv_file):
+                records[row["id"]] = {
+                    "name": row.get("NAME") or None,
+                    "ocs_name": row.get("OCS_NAME") or None,
+                    "long_name": row.get("LONG_NAME") or None,
+                }
+        logging.info(f"Loaded {len(records)} catalog records from {path}.")
+        return cls.from_records(records, f"file:{os.path.getmtime(path)}")
+
+    @classmethod
+    def from_records(cls, records, version="memory"):
+        """
+        Build a fully loaded store from an in-memory map of id -> {name, ocs_name, long_name}.
+        """
+        store = cls(table=None, preload=True)
+        store._records = dict(records)
+        store.version = version
+        store._loaded = True
+        return store
+
+    def _table_version(self):
+        table = get_bigquery_client().get_table(self.table)
+        return table.modified.isoformat() if table.modified else table.etag
+
+    def load_all(self):
+        """
+        Load every catalog record from BigQuery in a single query.
+        """
+        version = self._table_version()
+        query = f"""
+            SELECT id, NAME AS name, OCS_NAME AS ocs_name, LONG_NAME AS long_name
+            FROM `{self.table}`
+        """
+        records = {
+            row.id: {"name": row.name, "ocs_name": row.ocs_name, "long_name": row.long_name}
+            for row in query_bigquery(query)
+        }
+        with self._lock:
+            self._records = records
+            self.version = version
+            self._loaded = True
+            self._last_version_check = time.monotonic()
+        logging.info(f"Loaded {len(records)} catalog records from BigQuery (version {version}).")
+
+    def source_version(self):
+        """
+        Return the current version of the BigQuery table behind the store, or None for file-based stores.
+        """
+        return self._table_version() if self.table is not None else None
+
+    def refresh_if_stale(self):
+        """
+        Reload the records if the BigQuery table changed since they were loaded.
+        The version is checked at most once every `refresh_interval` seconds (never if it is None).
+        """
+        if (self.table is None or self.refresh_interval is None
+                or time.monotonic() - self._last_version_check < self.refresh_interval):
+            return
+        self._last_version_check = time.monotonic()
+        try:
+            version = self._table_version()
+        except Exception as e:
+            logging.warning(f"Could not check the catalog table version: {str(e)}")
+            return
+        if version == self.version:
+            return
+        logging.info(f"Catalog table version changed ({self.version} -> {version}). Refreshing metadata.")
+        if self.preload:
+            self.load_all()
+        else:
+            with self._lock:
+                self._records = {}
+                self.version = version
+
+    def fetch_missing(self, datapoint_ids):
+        """
+        Fetch the records that are not cached yet with a single `IN UNNEST(@ids)` query.
+        Ids that do not exist in the table are remembered as missing so they are not queried again.
+        Args:
+            datapoint_ids (iterable): Datapoint ids to make available.
+        """
+        missing = sorted({i for i in datapoint_ids if i not in self._records})
+        if not missing or self.table is None:
+            return
+        query = f"""
+            SELECT id, NAME AS name, OCS_NAME AS ocs_name, LONG_NAME AS long_name
+            FROM `{self.table}`
+            WHERE id IN UNNEST(@ids)
+        """
+        rows = query_bigquery(query, [bigquery.ArrayQueryParameter("ids", "STRING", missing)])
+        fetched = {row.id: {"name": row.name, "ocs_name": row.ocs_name, "long_name": row.long_name} for row in rows}
+        with self._lock:
+            for datapoint_id in missing:
+                self._records[datapoint_id] = fetched.get(datapoint_id)
+        logging.info(f"Fetched {len(fetched)} of {len(missing)} missing catalog records from BigQuery.")
+
+    def prefetch(self, datapoint_ids):
+        """
+        Make sure the records for the given ids are in memory before they are looked up one by one.
+        Args:
+            datapoint_ids (iterable): Datapoint ids that are about to be looked up.
+        """
+        self.refresh_if_stale()
+        if self.preload and not self._loaded:
+            try:
+                self.load_all()
+            except Exception as e:
+                logging.error(f"Failed to preload catalog metadata, falling back to batched fetches: {str(e)}")
+                self.preload = False
+        if not self.preload:
+            self.fetch_missing(datapoint_ids)
+
+    def get_record(self, datapoint_id):
+        """
+        Return the cached record for a datapoint id, fetching it if needed.
+        Args:
+            datapoint_id (str): The datapoint ID to look up.
+
+        Returns:
+            dict: The `name`, `ocs_name` and `long_name` of the datapoint, or None if not found.
+        """
+        if datapoint_id not in self._records:
+            self.prefetch([datapoint_id])
+        return self._records.get(datapoint_id)
+
+    def get_long_name(self, datapoint_id):
+        record = self.get_record(datapoint_id)
+        return record["long_name"] if record else None
+
+    def records(self):
+        """
+        Return a snapshot of all cached records as a dict of id -> record.
+        """
+        with self._lock:
+            return {k: v for k, v in self._records.items() if v is not None}
+
+
+_catalog_store = None
+_catalog_store_lock = threading.Lock()
+
+
+def create_catalog_store(metadata_path=CATALOG_METADATA_PATH, snapshot_gcs=CATALOG_SNAPSHOT_GCS, refresh_interval=CATALOG_REFRESH_INTERVAL):
+    """
+    Create a new catalog metadata store from the configured source.
+    Args:
+        metadata_path (str): Optional local id/metadata CSV.
+        snapshot_gcs (str): Optional "bucket/path" of the same CSV in GCS.
+        refresh_interval (int): Seconds between two BigQuery table version checks, or None to never
+            refresh the store in place (catalog snapshots are replaced as a whole instead, see catalog.py).
+
+    Returns:
+        CatalogMetadataStore: The store, loaded if it comes from a file.
+    """
+    if metadata_path:
+        return CatalogMetadataStore.from_csv(metadata_path)
+    if snapshot_gcs:
+        bucket_name, file_name = snapshot_gcs.split("/", 1)
+        try:
+            return CatalogMetadataStore.from_csv(download_gcs_file_cached(bucket_name, file_name))
+        except Exception as e:
+            logging.error(f"Failed to load the catalog snapshot, falling back to BigQuery: {str(e)}")
+    return CatalogMetadataStore(refresh_interval=refresh_interval)
+
+
+def get_catalog_store():
+    """
+    Return the process-wide catalog metadata store.
+    """
+    global _catalog_store
+    with _catalog_store_lock:
+        if _catalog_store is None:
+            _catalog_store = create_catalog_store()
+        return _catalog_store
+
+
+def set_catalog_store(store):
+    """
+    Replace the process-wide catalog metadata store, e.g. with an in-memory table for benchmarks.
+    """
+    global _catalog_store
+    with _catalog_store_lock:
+        _catalog_store = store
 
-def query_bigquery(query):
-    client = bigquery.Client(project="genai-product-matching", location="northamerica-northeast1")
-    return client.query(query).result()
 
 def get_long_name_by_datapoint_id(datapoint_id):
     """
-    Query BigQuery to retrieve the LONG_NAME for a given datapoint_id.
+    Retrieve the LONG_NAME for a given datapoint_id from the catalog metadata store.
     Args:
         datapoint_id (str): The datapoint ID to query.
 
     Returns:
         str: The LONG_NAME value for the datapoint_id, or None if not found.
     """
-    query = f"""
-        SELECT long_name
-        FROM `genai-product-matching.embedding_dataset.embedding`
-        WHERE id = '{datapoint_id}'
-        LIMIT 1
-    """
-    results = query_bigquery(query)
-    for row in results:
-        return row.long_name  # Return the LONG_NAME value
-    return None  # Return None if no matching datapoint_id is found
\ No newline at end of file
+    return get_catalog_store().get_long_name(datapoint_id)
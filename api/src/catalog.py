@@ -0,0 +1,324 @@
+import logging
+import os
+import threading
+import time
+from bigquery_client import CatalogMetadataStore, create_catalog_store, get_catalog_store, set_catalog_store
+from embedding_store import sidecar_path
+from hybrid_retrieval import create_bm25_index, get_bm25_index, set_bm25_index
+from lexical_index import create_lexical_index, get_lexical_index, set_lexical_index
+from metrics import record_catalog_reload
+from size_attributes import create_size_table, get_size_table, set_size_table
+from utils import download_gcs_file_cached
+from vector_search import (
+    DEPLOYED_INDEX_ID, INDEX_ENDPOINT, LOCAL_INDEX_PATH, VECTOR_SEARCH_BACKEND, VertexNeighborSearch,
+    get_neighbor_search, load_local_index, set_neighbor_search,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Build and swap in a new snapshot when the BigQuery catalog table changes, instead of refreshing
+# the metadata in place under the indexes derived from it
+CATALOG_RELOAD_WATCH = os.environ.get("CATALOG_RELOAD_WATCH", "true").lower() == "true"
+# Minimum number of seconds between two table version checks
+CATALOG_WATCH_INTERVAL = int(os.environ.get("CATALOG_WATCH_INTERVAL", os.environ.get("CATALOG_REFRESH_INTERVAL", 300)))
+
+# Comma-separated local directories or gs://bucket/prefix locations a reload source may read the
+# metadata and local index from (empty: only the environment configuration can be reloaded)
+CATALOG_SOURCE_PREFIXES = [
+    prefix.strip().rstrip("/") for prefix in os.environ.get("CATALOG_SOURCE_PREFIXES", "").split(",") if prefix.strip()
+]
+
+# Keys of a reload source; every key is optional and defaults to the environment configuration
+SOURCE_KEYS = {"metadataPath", "backend", "localIndexPath", "indexEndpoint", "deployedIndexId"}
+
+
+def _local_copy(path):
+    """
+    Return a local path for a catalog file, downloading it first if it is a gs://bucket/path URL
+    (with the `.ids.csv` sidecar of a binary embedding store).
+    """
+    if not path.startswith("gs://"):
+        return path
+    bucket_name, file_name = path[len("gs://"):].split("/", 1)
+    local_path = download_gcs_file_cached(bucket_name, file_name)
+    if file_name.endswith(".npy"):
+        download_gcs_file_cached(bucket_name, sidecar_path(file_name))
+    return local_path
+
+
+def _allowed_path(path):
+    # Local paths are resolved first, so ".." or symlinks cannot leave an allowed directory
+    if path.startswith("gs://"):
+        if ".." in path.split("/"):
+            return False
+    else:
+        path = os.path.realpath(path)
+    for prefix in CATALOG_SOURCE_PREFIXES:
+        if not prefix.startswith("gs://"):
+            prefix = os.path.realpath(prefix)
+        if path.startswith(prefix + "/"):
+            return True
+    return False
+
+
+def validate_source(source):
+    """
+    Raise ValueError if a reload source has unknown keys or an unknown backend, reads files outside
+    CATALOG_SOURCE_PREFIXES, or names an index endpoint of another project or location.
+    """
+    unknown = set(source) - SOURCE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown catalog source keys: {', '.join(sorted(unknown))}")
+    if source.get("backend", VECTOR_SEARCH_BACKEND) not in ("vertex", "local"):
+        raise ValueError(f"Unknown vector search backend: {source['backend']}")
+    for key in ("metadataPath", "localIndexPath"):
+        if source.get(key) is not None and not _allowed_path(str(source[key])):
+            raise ValueError(f"{key} must be under one of the CATALOG_SOURCE_PREFIXES locations.")
+    endpoint = source.get("indexEndpoint")
+    if endpoint is not None and not str(endpoint).startswith(INDEX_ENDPOINT.rsplit("/", 1)[0] + "/"):
+        raise ValueError("indexEndpoint must be in the project and location of VECTOR_SEARCH_INDEX_ENDPOINT.")
+
+
+class CatalogSnapshot:
+    """
+    One version of everything the matching flow reads about the catalog: the id -> name metadata,
+    the neighbor search over the embeddings, and the lexical, BM25 and size indexes derived from the metadata.
+    A match takes the active snapshot once and uses it until it is done, so a reload never changes the
+    catalog under a running request; a replaced snapshot is freed when its last request finishes.
+    """
+
+    def __init__(self, store, neighbor_search, lexical_index=None, bm25_index=None, size_table=None, source=None):
+        self.store = store
+        self.neighbor_search = neighbor_search
+        self.lexical_index = lexical_index
+        self.bm25_index = bm25_index
+        self.size_table = size_table
+        # The reload source overrides this snapshot was built from ({} for the environment configuration)
+        self.source = dict(source or {})
+        # Seconds build_catalog_snapshot took (None for the snapshot wrapping the process-wide catalog)
+        self.build_seconds = None
+        self.loaded_at = time.time()
+        self.version = f"{store.version}|{getattr(neighbor_search, 'version', None)}"
+        self.entries = len(store.records()) if store.preload else None
+
+    @classmethod
+    def from_process(cls):
+        """
+        Wrap the process-wide store, neighbor search and indexes, so the first snapshot reuses
+        what the warm-up already loaded (or a benchmark installed).
+        """
+        store = get_catalog_store()
+        return cls(store, get_neighbor_search(), get_lexical_index(), get_bm25_index(), get_size_table())
+
+    def describe(self):
+        """
+        Return a JSON-serializable summary of the snapshot.
+        """
+        index_ids = getattr(self.neighbor_search, "ids", None)
+        return {
+            "version": self.version,
+            "catalogVersion": self.store.version,
+            "indexVersion": getattr(self.neighbor_search, "version", None),
+            "entries": self.entries,
+            "indexEntries": len(index_ids) if index_ids is not None else None,
+            "indexes": {
+                "lexical": self.lexical_index is not None,
+                "bm25": self.bm25_index is not None,
+                "size": self.size_table is not None,
+            },
+            "source": self.source,
+            "loadedAt": self.loaded_at,
+            "buildSeconds": self.build_seconds,
+        }
+
+
+def build_catalog_snapshot(source=None):
+    """
+    Load a new catalog snapshot, without touching the active one.
+    Args:
+        source (dict): Optional overrides of the environment configuration:
+            `metadataPath` (id/metadata CSV, local path or gs://bucket/path; default: CATALOG_METADATA_PATH,
+            CATALOG_SNAPSHOT_GCS or BigQuery), `backend` ("vertex" or "local"), `localIndexPath` (embeddings of
+            the local backend, local path or gs://bucket/path), `indexEndpoint` and `deployedIndexId` (Vertex).
+
+    Returns:
+        CatalogSnapshot: The loaded snapshot.
+
+    Raises:
+        ValueError: If the source is invalid or the loaded catalog is empty.
+    """
+    source = dict(source or {})
+    validate_source(source)
+    start = time.perf_counter()
+
+    if source.get("metadataPath"):
+        store = CatalogMetadataStore.from_csv(_local_copy(source["metadataPath"]))
+    else:
+        store = create_catalog_store()
+    preload = store.preload
+    store.prefetch([])
+    if preload and not store.preload:
+        raise ValueError("Failed to load the catalog metadata.")
+    if store.preload:
+        if not store.records():
+            raise ValueError("The catalog metadata is empty.")
+        # Preloaded metadata is never refreshed in place under its derived indexes: a new version is a new snapshot
+        store.refresh_interval = None
+
+    if source.get("backend", VECTOR_SEARCH_BACKEND) == "local":
+        neighbor_search = load_local_index(_local_copy(source.get("localIndexPath", LOCAL_INDEX_PATH)))
+        if not neighbor_search.ids:
+            raise ValueError("The local index is empty.")
+    else:
+        neighbor_search = VertexNeighborSearch(
+            source.get("indexEndpoint", INDEX_ENDPOINT), source.get("deployedIndexId", DEPLOYED_INDEX_ID)
+        )
+
+    snapshot = CatalogSnapshot(
+        store, neighbor_search, create_lexical_index(store), create_bm25_index(store), create_size_table(store),
+        source=source,
+    )
+    snapshot.build_seconds = round(time.perf_counter() - start, 3)
+    logging.info(f"Built catalog snapshot {snapshot.version} in {snapshot.build_seconds} seconds.")
+    return snapshot
+
+
+class CatalogManager:
+    """
+    Holds the active catalog snapshot and replaces it without downtime: a reload builds the new
+    snapshot in a background thread while requests keep being served from the active one, then
+    swaps it in with a single assignment. With `watch`, a reload also starts when the BigQuery
+    catalog table changes (checked at most every `watch_interval` seconds).
+    """
+
+    def __init__(self, watch=CATALOG_RELOAD_WATCH, watch_interval=CATALOG_WATCH_INTERVAL):
+        self.watch = watch
+        self.watch_interval = watch_interval
+        # Outcome of the last reload, reported by status()
+        self.last_reload = None
+        self._active = None
+        self._last_watch_check = time.monotonic()
+        self._reload_thread = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the active snapshot, wrapping the process-wide catalog on first use.
+        """
+        snapshot = self._active
+        if snapshot is None:
+            with self._lock:
+                if self._active is None:
+                    self._active = CatalogSnapshot.from_process()
+                    if self.watch and self._active.store.preload:
+                        # The watcher replaces the whole snapshot when the table changes
+                        self._active.store.refresh_interval = None
+                snapshot = self._active
+        # Metadata fetched id by id (CATALOG_PRELOAD=false) has no derived indexes and keeps refreshing in place
+        if (self.watch and snapshot.store.preload
+                and time.monotonic() - self._last_watch_check >= self.watch_interval):
+            self._last_watch_check = time.monotonic()
+            self.reload(only_if_changed=True)
+        return snapshot
+
+    def activate(self, snapshot):
+        """
+        Make a snapshot the active one. Requests already running keep the snapshot they started with.
+        """
+        with self._lock:
+            previous, self._active = self._active, snapshot
+        # Code reading the process-wide singletons directly sees the new version too
+        set_catalog_store(snapshot.store)
+        set_neighbor_search(snapshot.neighbor_search)
+        set_lexical_index(snapshot.lexical_index)
+        set_bm25_index(snapshot.bm25_index)
+        set_size_table(snapshot.size_table)
+        logging.info(f"Catalog snapshot {snapshot.version} is active (previous: {previous.version if previous else None}).")
+
+    def reload(self, source=None, only_if_changed=False):
+        """
+        Build a new snapshot in a background thread and activate it once it is loaded.
+        Args:
+            source (dict): Reload source (see build_catalog_snapshot); None reloads the active snapshot's source.
+            only_if_changed (bool): Skip the reload if the BigQuery table version did not change.
+
+        Returns:
+            bool: False if a reload is already running.
+
+        Raises:
+            ValueError: If the source is invalid.
+        """
+        if source is not None:
+            validate_source(source)
+        with self._lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self._reload_thread = threading.Thread(
+                target=self._reload, args=(source, only_if_changed), name="catalog-reload", daemon=True
+            )
+            self._reload_thread.start()
+            return True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the running reload, if any, to finish.
+        """
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _reload(self, source, only_if_changed):
+        active = self.get()
+        if source is None:
+            source = active.source
+        if only_if_changed:
+            try:
+                version = active.store.source_version()
+            except Exception as e:
+                logging.warning(f"Could not check the catalog table version: {str(e)}")
+                return
+            if version is None or version == active.store.version:
+                return
+            logging.info(f"Catalog table version changed ({active.store.version} -> {version}). Reloading the catalog.")
+
+        self.last_reload = {"status": "running", "source": source, "startedAt": time.time(), "error": None}
+        start = time.perf_counter()
+        try:
+            snapshot = build_catalog_snapshot(source)
+        except Exception as e:
+            logging.error(f"Catalog reload failed, keeping snapshot {active.version}: {str(e)}")
+            record_catalog_reload("failed", time.perf_counter() - start)
+            self.last_reload = dict(self.last_reload, status="failed", error=str(e))
+            return
+        self.activate(snapshot)
+        record_catalog_reload("success", time.perf_counter() - start)
+        self.last_reload = dict(self.last_reload, status="succeeded", version=snapshot.version)
+
+    def status(self):
+        """
+        Return the active snapshot and the outcome of the last reload.
+        """
+        running = self._reload_thread is not None and self._reload_thread.is_alive()
+        return {
+            "active": self.get().describe(),
+            "reloading": running,
+            "lastReload": dict(self.last_reload) if self.last_reload else None,
+        }
+
+
+_catalog_manager = CatalogManager()
+
+
+def get_catalog_manager():
+    """
+    Return the process-wide catalog manager.
+    """
+    return _catalog_manager
+
+
+def get_catalog():
+    """
+    Return the active catalog snapshot. Take it once per request and use it throughout.
+    """
+    return _catalog_manager.get()
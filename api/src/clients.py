@@ -0,0 +1,177 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# gRPC keepalive pings keep idle channels open through load balancers and detect dead connections early
+GRPC_KEEPALIVE_TIME_MS = int(os.environ.get("GRPC_KEEPALIVE_TIME_MS", 30000))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.environ.get("GRPC_KEEPALIVE_TIMEOUT_MS", 10000))
+# Maximum number of pooled HTTP connections per host for the REST clients (BigQuery, Cloud Storage)
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 32))
+# Maximum number of seconds a health check may take
+CLIENT_HEALTH_CHECK_TIMEOUT = float(os.environ.get("CLIENT_HEALTH_CHECK_TIMEOUT", 5))
+
+GRPC_KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+def mount_http_pool(client, size=HTTP_POOL_SIZE):
+    """
+    Give a google-cloud REST client a connection pool large enough for every request thread,
+    so concurrent calls reuse open TLS connections instead of opening new ones.
+    """
+    from requests.adapters import HTTPAdapter
+
+    session = getattr(client, "_http", None)
+    if session is not None and hasattr(session, "mount"):
+        session.mount("https://", HTTPAdapter(pool_connections=size, pool_maxsize=size))
+    return client
+
+
+def grpc_channel_ready(channel, timeout=CLIENT_HEALTH_CHECK_TIMEOUT):
+    """
+    Health check for gRPC clients: wait until the channel is connected.
+    """
+    import grpc
+
+    grpc.channel_ready_future(channel).result(timeout=timeout)
+
+
+class ClientPool:
+    """
+    A fixed number of clients handed out round-robin, so concurrent calls spread over several
+    gRPC channels (and HTTP/2 connections) instead of queueing on one.
+    """
+
+    def __init__(self, clients):
+        self.clients = list(clients)
+        self._cycle = itertools.cycle(self.clients)
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            return next(self._cycle)
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of upstream clients. Each client is created once, on first use,
+    and shared by every request thread; creation is serialized per client.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._health_checks = {}
+        self._clients = {}
+        # Clients installed with set(); they have no factory to be recreated with
+        self._installed = set()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, health_check=None):
+        """
+        Args:
+            name (str): Client name, e.g. "bigquery".
+            factory (callable): Creates the client. Returning a ClientPool makes get() round-robin over it.
+            health_check (callable): Optional function raising if the client cannot reach its service.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._health_checks[name] = health_check
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """
+        Return the client registered under `name`, creating it on first use.
+        """
+        client = self._clients.get(name)
+        if client is None:
+            with self._locks[name]:
+                client = self._clients.get(name)
+                if client is None:
+                    start = time.perf_counter()
+                    client = self._factories[name]()
+                    self._clients[name] = client
+                    logging.info(f"Created client '{name}' in {time.perf_counter() - start:.2f} seconds.")
+        return client.get() if isinstance(client, ClientPool) else client
+
+    def set(self, name, client):
+        """
+        Replace a client, e.g. with a local stand-in for benchmarks.
+        """
+        with self._locks.setdefault(name, threading.Lock()):
+            self._clients[name] = client
+            self._installed.add(name)
+
+    def reset(self, name):
+        """
+        Drop a client so the next get() creates a new one (e.g. after its health check failed).
+        """
+        with self._locks[name]:
+            client = self._clients.pop(name, None)
+            self._installed.discard(name)
+        if client is None:
+            return
+        clients = client.clients if isinstance(client, ClientPool) else [client]
+        for dropped in clients:
+            transport = getattr(dropped, "transport", None)
+            close = getattr(transport, "close", None) or getattr(dropped, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    logging.warning(f"Failed to close client '{name}': {str(e)}")
+
+    def check_health(self):
+        """
+        Run the health check of every created client. A client that fails it is dropped, so the next
+        request creates a new one (with fresh channels) instead of reusing a broken connection.
+        Returns:
+            dict: name -> {"status": "ok", "failed" or "not_created", "seconds", "error"}.
+        """
+        results = {}
+        for name in list(self._factories):
+            client = self._clients.get(name)
+            if client is None:
+                results[name] = {"status": "not_created", "seconds": None, "error": None}
+                continue
+            health_check = self._health_checks.get(name)
+            clients = client.clients if isinstance(client, ClientPool) else [client]
+            start = time.perf_counter()
+            try:
+                if health_check:
+                    for pooled in clients:
+                        health_check(pooled)
+                results[name] = {"status": "ok", "seconds": round(time.perf_counter() - start, 3), "error": None}
+            except Exception as e:
+                results[name] = {"status": "failed", "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+                logging.warning(f"Health check failed for client '{name}': {str(e)}")
+                if name not in self._installed:
+                    self.reset(name)
+        return results
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry():
+    """
+    Return the process-wide client registry.
+    """
+    return _registry
+
+
+def register_client(name, factory, health_check=None):
+    _registry.register(name, factory, health_check)
+
+
+def get_client(name):
+    return _registry.get(name)
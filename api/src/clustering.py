@@ -0,0 +1,59 @@
+import logging
+import os
+from normalization import expand_abbreviations, normalize_product_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Group duplicate uploaded rows so only one of them goes through embedding, neighbor search and the LLM
+MATCH_CLUSTERING = os.environ.get("MATCH_CLUSTERING", "true").lower() == "true"
+# Maximum number of clusters tracked per upload; later distinct rows are matched on their own
+CLUSTER_MAX_REPRESENTATIVES = int(os.environ.get("CLUSTER_MAX_REPRESENTATIVES", 100000))
+
+
+def cluster_key(text):
+    """
+    Key shared by the uploaded names that are the same product: their normalized words with abbreviations
+    expanded, in any order, so "DIET LIPTON GRN TEA 20 OZ" and "Lipton Diet Green Tea (20oz)" share it.
+    Names with any extra, missing or repeated word ("Red Bull Sugar Free" and "Red Bull Sugar Free Pear",
+    "Chocolate Chip Muffin" and "Chocolate Chocolate Chip Muffin") do not.
+    Returns:
+        tuple: The sorted words, empty for an empty name.
+    """
+    return tuple(sorted(expand_abbreviations(normalize_product_text(text).split())))
+
+
+class ProductClusterer:
+    """
+    Online duplicate clustering of uploaded product names.
+    The first row of a cluster is its representative; a later row joins it when both names have the same
+    cluster_key, i.e. the same words once normalized and expanded, in any order. The representative's
+    decision is reused for every member, so names that are only similar are never grouped.
+    """
+
+    def __init__(self, max_representatives=CLUSTER_MAX_REPRESENTATIVES):
+        self.max_representatives = max_representatives
+        # cluster_key -> cluster id
+        self._clusters = {}
+
+    def assign(self, text):
+        """
+        Assign an uploaded product to a cluster.
+        Args:
+            text (str): The uploaded product name.
+
+        Returns:
+            tuple: (cluster id, True if the product is the cluster representative), or (None, True) if
+            the product is not clustered (empty name or cluster limit reached).
+        """
+        key = cluster_key(text)
+        if not key:
+            return None, True
+        cluster_id = self._clusters.get(key)
+        if cluster_id is not None:
+            return cluster_id, False
+        if len(self._clusters) >= self.max_representatives:
+            return None, True
+        cluster_id = len(self._clusters)
+        self._clusters[key] = cluster_id
+        return cluster_id, True
@@ -1,42 +1,141 @@
+import gzip
+import hashlib
+import io
+import logging
+import os
 import pandas as pd
+from metrics import timed_stage
 
-def process_uploaded_file(file):
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Upload limits: rows (before de-duplication) and uncompressed bytes
+MAX_UPLOAD_ROWS = int(os.environ.get("MAX_UPLOAD_ROWS", 1000000))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 256 * 1024 * 1024))
+# Number of CSV rows parsed at a time
+UPLOAD_CHUNK_ROWS = int(os.environ.get("UPLOAD_CHUNK_ROWS", 50000))
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class UploadTooLarge(ValueError):
+    """
+    Raised when an upload exceeds the row or byte limit.
     """
-    Process and clean the uploaded file.
-    - Validates that the file has only one column.
-    - Removes duplicates and empty rows.
-    - Normalizes text data.
 
-    Args:
-        file: The uploaded file (e.g., from Flask's request.files).
 
-    Returns:
-        A cleaned pandas DataFrame.
+class _StreamReader(io.RawIOBase):
     """
-    try:
-        # Load the uploaded file into a DataFrame
-        df = pd.read_csv(file)
+    Read-only raw stream over a file object, optionally stopping with UploadTooLarge after `max_bytes`.
+    """
+
+    def __init__(self, fileobj, max_bytes=None):
+        self.fileobj = fileobj
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(len(buffer))
+        self.bytes_read += len(data)
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            raise UploadTooLarge(f"Uploaded file exceeds the limit of {self.max_bytes} bytes.")
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _open_upload(file, max_bytes):
+    """
+    Open an uploaded file as a text stream, decompressing it if it is gzip-compressed
+    (detected from its first bytes, whatever the file name).
+    """
+    stream = io.BufferedReader(_StreamReader(getattr(file, "stream", file)))
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    # The limit applies to the uncompressed CSV, so a small compressed upload cannot expand without bound
+    limited = io.BufferedReader(_StreamReader(stream, max_bytes))
+    return io.TextIOWrapper(limited, encoding="utf-8", errors="replace", newline="")
+
 
-        # Validate that the file has only one column
-        if df.shape[1] != 1:
-            raise ValueError("Uploaded file must contain exactly one column.")
+def clean_products(values, seen):
+    """
+    Clean a chunk of product names: strip, lowercase, drop empty values and the products already seen.
+    Args:
+        values (Series): Raw product names.
+        seen (set): 8-byte hashes of the products yielded so far, updated in place.
 
-        # Rename the column for consistency
-        df.columns = ["text"]
+    Yields:
+        str: The cleaned product names, in order.
+    """
+    for product in values.dropna().astype(str).str.strip().str.lower():
+        if not product:
+            continue
+        key = hashlib.blake2b(product.encode("utf-8"), digest_size=8).digest()
+        if key in seen:
+            continue
+        seen.add(key)
+        yield product
 
-        # Drop rows with empty or null values
-        df = df.dropna()
 
-        # Strip whitespace from text entries
-        df["text"] = df["text"].str.strip()
+def iter_uploaded_products(file, max_rows=MAX_UPLOAD_ROWS, max_bytes=MAX_UPLOAD_BYTES, chunk_rows=UPLOAD_CHUNK_ROWS):
+    """
+    Read an uploaded CSV chunk by chunk and yield its cleaned products as they are parsed.
+    - Validates that the file has only one column.
+    - Removes duplicates and empty rows.
+    - Normalizes text data (strip, lowercase).
+    Memory stays bounded by the chunk size and one 8-byte hash per distinct product.
 
-        # Convert text to lowercase for normalization
-        df["text"] = df["text"].str.lower()
+    Args:
+        file: The uploaded file (e.g., from Flask's request.files), plain or gzip-compressed.
+        max_rows (int): Maximum number of data rows.
+        max_bytes (int): Maximum number of uncompressed bytes.
+        chunk_rows (int): Number of rows parsed at a time.
 
-        # Drop duplicate rows after normalization
-        df = df.drop_duplicates()
+    Yields:
+        str: The cleaned product names, in upload order, without duplicates.
 
-        return df
+    Raises:
+        UploadTooLarge: If the upload exceeds the row or byte limit.
+        ValueError: If the file cannot be parsed or does not have exactly one column.
+    """
+    seen = set()
+    rows = 0
+    try:
+        text = _open_upload(file, max_bytes)
+        chunks = pd.read_csv(text, chunksize=chunk_rows, dtype=str)
+        while True:
+            with timed_stage("parse"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            # Validate that the file has only one column
+            if chunk.shape[1] != 1:
+                raise ValueError("Uploaded file must contain exactly one column.")
+            rows += len(chunk)
+            if rows > max_rows:
+                raise UploadTooLarge(f"Uploaded file exceeds the limit of {max_rows} rows.")
 
+            yield from clean_products(chunk.iloc[:, 0], seen)
+    except UploadTooLarge:
+        raise
     except Exception as e:
-        raise ValueError(f"Error processing file: {e}")
\ No newline at end of file
+        raise ValueError(f"Error processing file: {e}")
+    logging.info(f"Read {rows} rows and {len(seen)} distinct products from the uploaded file.")
+
+
+def process_uploaded_file(file):
+    """
+    Process and clean the uploaded file.
+    - Validates that the file has only one column.
+    - Removes duplicates and empty rows.
+    - Normalizes text data.
+
+    Args:
+        file: The uploaded file (e.g., from Flask's request.files).
+
+    Returns:
+        A cleaned pandas DataFrame.
+    """
+    return pd.DataFrame({"text": list(iter_uploaded_products(file))}, dtype=object)
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# On-disk store (":memory:" keeps the cache in RAM only) and size limits
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 500000))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", 20000))
+
+
+def normalize_cache_text(text):
+    """
+    Normalize text for cache keys: Unicode NFKC and collapsed whitespace.
+    Case is preserved because it changes the embedding.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def make_cache_key(text, model, task_type, dimensionality):
+    """
+    Build the content-addressed key of an embedding.
+    Args:
+        text (str): The embedded text.
+        model (str): Embedding model name.
+        task_type (str): Embedding task type.
+        dimensionality (int): Output dimensionality.
+
+    Returns:
+        str: A SHA-256 hex digest identifying the embedding.
+    """
+    payload = "\x1f".join([model, task_type, str(dimensionality), normalize_cache_text(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache: an in-memory LRU of float32 arrays in front of a SQLite table of float32 blobs.
+    The SQLite table is kept under `max_entries` rows, dropping the least recently used ones.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            # Worker processes of match_cli.py may share the file: let readers and one writer work concurrently
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._connection.commit()
+        # Upper bound of the row count: every put adds its keys, replaced ones included; the table is only
+        # counted again once the bound passes max_entries
+        self._rows = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        Look up several embeddings at once.
+        Args:
+            keys (list): Cache keys built with make_cache_key.
+
+        Returns:
+            dict: key -> embedding (list of floats) for every key found in the cache.
+        """
+        found = {}
+        with self._lock:
+            disk_keys = []
+            for key in dict.fromkeys(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key].tolist()
+                else:
+                    disk_keys.append(key)
+
+            for start in range(0, len(disk_keys), 500):
+                chunk = disk_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector.tolist()
+                    self._remember(key, vector)
+                if rows:
+                    now = time.time()
+                    self._connection.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key, _ in rows]
+                    )
+            self._connection.commit()
+
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        Store several embeddings and evict the least recently used rows above the size limit.
+        Args:
+            items (dict): key -> embedding (list of floats).
+        """
+        if not items:
+            return
+        now = time.time()
+        # The memory level holds float32 arrays (3 KiB per 768-d vector, against 24 KiB as a list of floats)
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, vector.tobytes(), now) for key, vector in vectors.items()]
+            )
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+
+            self._rows += len(items)
+            if self._rows > self.max_entries:
+                self._rows = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._rows > self.max_entries:
+                    # Trim 5% below the limit so the next count is thousands of inserts away
+                    excess = self._rows - (self.max_entries - self.max_entries // 20)
+                    self._connection.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                        (excess,)
+                    )
+                    self._rows -= excess
+                    self.evictions += excess
+                    logging.info(f"Evicted {excess} embeddings from the cache.")
+            self._connection.commit()
+
+    def stats(self):
+        """
+        Return the hit/miss counters of the cache.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Return the process-wide embedding cache.
+    """
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,141 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+METADATA_COLUMNS = ["NAME", "OCS_NAME", "LONG_NAME"]
+
+
+def sidecar_path(npy_path):
+    """
+    Return the path of the id/metadata CSV stored next to an embedding matrix.
+    """
+    return os.path.splitext(npy_path)[0] + ".ids.csv"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingStoreWriter:
+    """
+    Streams embeddings into a binary store: a contiguous `.npy` matrix (float32 or float16)
+    of L2-normalized rows, plus a `.ids.csv` sidecar with the id and catalog columns of each row.
+    """
+
+    def __init__(self, npy_path, count, dimensionality, dtype="float32"):
+        self.npy_path = npy_path
+        self.count = count
+        self.row = 0
+        self.matrix = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.dtype(dtype), shape=(count, dimensionality))
+        self._sidecar_file = open(sidecar_path(npy_path), mode="w", encoding="utf-8", newline="")
+        self._sidecar = csv.writer(self._sidecar_file)
+        self._sidecar.writerow(["id"] + METADATA_COLUMNS)
+
+    def write(self, datapoint_id, embedding, metadata=None):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        self.matrix[self.row] = _normalize_rows(vector)[0]
+        metadata = metadata or {}
+        self._sidecar.writerow([datapoint_id] + [metadata.get(column, "") for column in METADATA_COLUMNS])
+        self.row += 1
+
+    def close(self):
+        if self.row != self.count:
+            raise ValueError(f"Expected {self.count} embeddings, got {self.row}.")
+        self.matrix.flush()
+        del self.matrix
+        self._sidecar_file.close()
+        logging.info(f"Wrote {self.count} embeddings to {self.npy_path}.")
+
+
+def load_embedding_store(npy_path, mmap=True):
+    """
+    Load a binary embedding store.
+    With mmap=True the matrix is memory-mapped read-only: nothing is copied, and every process
+    mapping the same file shares one copy in the page cache.
+    Args:
+        npy_path (str): Path to the `.npy` matrix.
+        mmap (bool): Memory-map the matrix instead of reading it into memory.
+
+    Returns:
+        tuple: (list of ids, matrix of L2-normalized embeddings, dict of id -> metadata record).
+    """
+    matrix = np.load(npy_path, mmap_mode="r" if mmap else None)
+    ids = []
+    records = {}
+    with open(sidecar_path(npy_path), mode="r", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            ids.append(row["id"])
+            records[row["id"]] = {column: row.get(column, "") for column in METADATA_COLUMNS}
+    if len(ids) != matrix.shape[0]:
+        raise ValueError(f"{npy_path} has {matrix.shape[0]} rows but its sidecar has {len(ids)} ids.")
+    logging.info(f"Loaded {len(ids)} embeddings ({matrix.dtype}, {'memory-mapped' if mmap else 'in memory'}) from {npy_path}.")
+    return ids, matrix, records
+
+
+def _count_lines(path):
+    with open(path, mode="r", encoding="utf-8") as file:
+        return sum(1 for line in file if line.strip())
+
+
+def convert_csv_to_store(csv_path, npy_path, dtype="float32"):
+    """
+    Convert the id/embedding table written by generate_and_upload_embeddings.py
+    (`id`, `embedding` as a JSON list, catalog columns) to a binary store, one row at a time.
+    """
+    with open(csv_path, mode="r", encoding="utf-8") as csv_file:
+        reader = csv.DictReader(csv_file)
+        first = next(reader)
+        count = 1 + sum(1 for _ in reader)
+    writer = EmbeddingStoreWriter(npy_path, count, len(json.loads(first["embedding"])), dtype)
+    with open(csv_path, mode="r", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            writer.write(row["id"], json.loads(row["embedding"]), row)
+    writer.close()
+
+
+def convert_jsonl_to_store(jsonl_path, npy_path, dtype="float32", metadata_csv=None):
+    """
+    Convert a JSONL file of {"id", "embedding"} records (the vector index input) to a binary store.
+    Catalog columns are taken from `metadata_csv` (any CSV with an `id` column) when given.
+    """
+    metadata = {}
+    if metadata_csv:
+        with open(metadata_csv, mode="r", encoding="utf-8") as csv_file:
+            metadata = {row["id"]: row for row in csv.DictReader(csv_file)}
+    count = _count_lines(jsonl_path)
+    writer = None
+    with open(jsonl_path, mode="r", encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if writer is None:
+                writer = EmbeddingStoreWriter(npy_path, count, len(record["embedding"]), dtype)
+            writer.write(record["id"], record["embedding"], metadata.get(record["id"]))
+    if writer is not None:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert catalog embeddings to a memory-mappable binary store.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-csv", help="id_embedding_table.csv written by generate_and_upload_embeddings.py")
+    source.add_argument("--from-jsonl", help="JSONL file of {\"id\", \"embedding\"} records")
+    parser.add_argument("--metadata-csv", help="CSV with id and catalog columns, used with --from-jsonl")
+    parser.add_argument("--out", required=True, help="Output .npy path; the sidecar is written next to it")
+    parser.add_argument("--float16", action="store_true", help="Store half-precision vectors")
+    args = parser.parse_args()
+
+    dtype = "float16" if args.float16 else "float32"
+    if args.from_csv:
+        convert_csv_to_store(args.from_csv, args.out, dtype)
+    else:
+        convert_jsonl_to_store(args.from_jsonl, args.out, dtype, args.metadata_csv)
@@ -0,0 +1,128 @@
+import argparse
+import json
+import logging
+import time
+from itertools import product
+from reranker import (
+    DEFAULT_THRESHOLDS, RERANKER_THRESHOLDS_PATH, RERANKER_VERDICT_LOG, candidate_features, decide, score_margin,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Candidate threshold values searched by the fit
+ACCEPT_SCORES = [round(0.5 + 0.05 * i, 2) for i in range(41)]
+ACCEPT_MARGINS = [round(0.05 * i, 2) for i in range(13)]
+REJECT_SCORES = [round(0.05 * i, 2) for i in range(1, 31)]
+
+
+def load_verdicts(path):
+    """
+    Read the LLM verdicts logged by the matching flow.
+    Returns:
+        list: (features, verdict) pairs, where features are the scored candidates (best first) and
+        verdict is the datapoint_id the LLM confirmed, or None.
+    """
+    verdicts = []
+    with open(path, mode="r", encoding="utf-8") as log_file:
+        for line in log_file:
+            if line.strip():
+                record = json.loads(line)
+                verdicts.append((candidate_features(record["uploaded"], record["candidates"]), record["verdict"]))
+    logging.info(f"Loaded {len(verdicts)} LLM verdicts from {path}.")
+    return verdicts
+
+
+def evaluate(verdicts, thresholds):
+    """
+    Compare the reranker decisions with the LLM verdicts.
+    Returns:
+        dict: Share of the products decided locally, and the precision of the accept and reject decisions
+        (an accept is right when the LLM confirmed the same candidate, a reject when it confirmed none).
+    """
+    counts = {"accept": 0, "accept_right": 0, "reject": 0, "reject_right": 0, "escalate": 0}
+    for features, verdict in verdicts:
+        decision, datapoint_id = decide(features, thresholds)
+        counts[decision] += 1
+        if decision == "accept":
+            counts["accept_right"] += datapoint_id == verdict
+        elif decision == "reject":
+            counts["reject_right"] += verdict is None
+    total = max(len(verdicts), 1)
+    return {
+        "verdicts": len(verdicts),
+        "accepted": counts["accept"] / total,
+        "rejected": counts["reject"] / total,
+        "escalated": counts["escalate"] / total,
+        "accept_precision": counts["accept_right"] / counts["accept"] if counts["accept"] else None,
+        "reject_precision": counts["reject_right"] / counts["reject"] if counts["reject"] else None,
+    }
+
+
+def fit_thresholds(verdicts, target_precision=0.98, min_support=20):
+    """
+    Pick the thresholds that decide the most products locally while the accept and the reject
+    decisions each agree with the LLM at least `target_precision` of the time.
+    The accept and reject thresholds are fitted separately and need at least `min_support` logged
+    verdicts on their side; a decision no threshold makes precisely enough is disabled (None), so those
+    products keep going to the LLM.
+    Args:
+        verdicts (list): (features, verdict) pairs from load_verdicts.
+        target_precision (float): Minimum agreement with the LLM of each local decision.
+        min_support (int): Minimum number of verdicts behind a fitted threshold.
+
+    Returns:
+        dict: The thresholds.
+    """
+    thresholds = {"accept_score": None, "accept_margin": DEFAULT_THRESHOLDS["accept_margin"], "reject_score": None}
+
+    best_accepted = 0
+    for accept_score, accept_margin in product(ACCEPT_SCORES, ACCEPT_MARGINS):
+        accepted = right = 0
+        for features, verdict in verdicts:
+            best = features[0] if features else None
+            if (best and best.score >= accept_score and score_margin(features) >= accept_margin
+                    and best.size_agreement >= 0):
+                accepted += 1
+                right += best.datapoint_id == verdict
+        if accepted >= min_support and right >= target_precision * accepted and accepted > best_accepted:
+            best_accepted = accepted
+            thresholds.update(accept_score=accept_score, accept_margin=accept_margin)
+
+    best_rejected = 0
+    for reject_score in REJECT_SCORES:
+        rejected = right = 0
+        for features, verdict in verdicts:
+            if not features or features[0].score < reject_score:
+                rejected += 1
+                right += verdict is None
+        if rejected >= min_support and right >= target_precision * rejected and rejected > best_rejected:
+            best_rejected = rejected
+            thresholds["reject_score"] = reject_score
+
+    if None not in (thresholds["accept_score"], thresholds["reject_score"]):
+        # Never reject a product the accept threshold would take
+        thresholds["reject_score"] = min(thresholds["reject_score"], thresholds["accept_score"])
+    return thresholds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the local reranker thresholds from logged LLM verdicts.")
+    parser.add_argument("--verdicts", default=RERANKER_VERDICT_LOG, required=not RERANKER_VERDICT_LOG,
+                        help="JSON Lines verdict log written with RERANKER_VERDICT_LOG")
+    parser.add_argument("--output", default=RERANKER_THRESHOLDS_PATH, help="Thresholds file read by the matching flow")
+    parser.add_argument("--target-precision", type=float, default=0.98,
+                        help="Minimum agreement with the LLM of the accept and reject decisions")
+    parser.add_argument("--min-support", type=int, default=20, help="Minimum verdicts behind a fitted threshold")
+    args = parser.parse_args()
+
+    verdicts = load_verdicts(args.verdicts)
+    thresholds = fit_thresholds(verdicts, args.target_precision, args.min_support)
+    stats = evaluate(verdicts, thresholds)
+    print(f"Thresholds: {thresholds}")
+    print(f"Defaults:   {evaluate(verdicts, DEFAULT_THRESHOLDS)}")
+    print(f"Fitted:     {stats}")
+    with open(args.output, mode="w", encoding="utf-8") as output_file:
+        json.dump({"thresholds": thresholds, "stats": stats, "fitted_at": time.time(),
+                   "target_precision": args.target_precision}, output_file, indent=2)
+    logging.info(f"Wrote reranker thresholds to {args.output}.")
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from bigquery_client import get_catalog_store
+from lexical_index import CATALOG_NAME_FIELDS
+from normalization import char_ngrams, normalize_product_text
+from vector_search import Neighbor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Fuse a BM25 ranking of the catalog names with the dense neighbors before the confidence thresholds run
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "true").lower() == "true"
+# Number of catalog entries taken from the BM25 ranking per uploaded product
+HYBRID_LEXICAL_K = int(os.environ.get("HYBRID_LEXICAL_K", 10))
+# Reciprocal-rank fusion constant: higher values flatten the difference between the top ranks
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def index_terms(text):
+    """
+    Terms of a product name for BM25: its normalized words, plus its character trigrams
+    so abbreviations ("chs", "choc") still share terms with the spelled-out words.
+    """
+    key = normalize_product_text(text)
+    return [f"w:{word}" for word in key.split()] + [f"g:{gram}" for gram in char_ngrams(key)]
+
+
+class BM25Index:
+    """
+    BM25 index over the NAME, OCS_NAME and LONG_NAME of every catalog entry (one document per entry).
+    Postings are stored in flat NumPy arrays with the BM25 weight of every (term, entry) pair
+    precomputed, so a query is a few vectorized additions.
+    """
+
+    def __init__(self, records, fields=CATALOG_NAME_FIELDS, k1=BM25_K1, b=BM25_B):
+        """
+        Args:
+            records (dict): datapoint_id -> dict with `name`, `ocs_name` and `long_name`.
+            fields (tuple): Record fields indexed.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+        """
+        self.ids = []
+        self.vocabulary = {}
+        postings = defaultdict(list)
+        lengths = []
+        for datapoint_id, record in records.items():
+            names = {normalize_product_text(record[field]) for field in fields if record.get(field)}
+            counts = Counter(term for name in names if name for term in index_terms(name))
+            if not counts:
+                continue
+            document = len(self.ids)
+            self.ids.append(datapoint_id)
+            lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                postings[self.vocabulary.setdefault(term, len(self.vocabulary))].append((document, frequency))
+
+        lengths = np.asarray(lengths, dtype=np.float32)
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        documents = []
+        weights = []
+        for term_id in range(len(self.vocabulary)):
+            term_postings = postings[term_id]
+            self.offsets[term_id + 1] = self.offsets[term_id] + len(term_postings)
+            term_documents = np.fromiter((d for d, _ in term_postings), dtype=np.int32, count=len(term_postings))
+            frequencies = np.fromiter((f for _, f in term_postings), dtype=np.float32, count=len(term_postings))
+            idf = np.log(1 + (len(self.ids) - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            norm = k1 * (1 - b + b * lengths[term_documents] / average_length)
+            documents.append(term_documents)
+            weights.append((idf * frequencies * (k1 + 1) / (frequencies + norm)).astype(np.float32))
+        self.documents = np.concatenate(documents) if documents else np.zeros(0, dtype=np.int32)
+        self.weights = np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32)
+        logging.info(f"Built BM25 index with {len(self.vocabulary)} terms for {len(self.ids)} catalog entries.")
+
+    def search(self, text, k=HYBRID_LEXICAL_K):
+        """
+        Rank the catalog entries for a product name.
+        Args:
+            text (str): The uploaded product name.
+            k (int): Number of entries to return.
+
+        Returns:
+            list: Up to k (datapoint_id, score) pairs, best first.
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(index_terms(text)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # Every entry appears at most once in a term's postings, so plain fancy-index addition is safe
+            scores[self.documents[start:end]] += self.weights[start:end]
+        k = min(k, len(self.ids))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse several rankings of ids: every id scores the sum of 1 / (k + rank) over the rankings it appears in.
+    Args:
+        rankings (list): Lists of ids, best first.
+        k (int): Fusion constant.
+
+    Returns:
+        list: (id, fused score) pairs, best first; ties keep the order of the first ranking.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: -pair[1])
+
+
+def fuse_neighbors(neighbor_search, embeddings, batch_neighbors, lexical_rankings, k=RRF_K):
+    """
+    Reorder the dense neighbors of every query by reciprocal-rank fusion with its BM25 ranking.
+    Entries found only by BM25 are added with their exact cosine similarity when the neighbor search
+    can compute it (local indexes); otherwise the fusion only reorders the dense neighbors.
+    Args:
+        neighbor_search: The neighbor-search backend that produced `batch_neighbors`.
+        embeddings (list): Query embeddings.
+        batch_neighbors (list): One list of Neighbor tuples per query, closest first.
+        lexical_rankings (list): One list of (datapoint_id, score) pairs per query, best first.
+        k (int): Fusion constant.
+
+    Returns:
+        list: One list of Neighbor tuples per query, in fused order. The `distance` of every
+        neighbor stays its cosine similarity, so the confidence thresholds keep their meaning.
+    """
+    missing = []
+    for neighbors, ranking in zip(batch_neighbors, lexical_rankings):
+        found = {n.datapoint_id for n in neighbors}
+        missing.append([datapoint_id for datapoint_id, _ in ranking if datapoint_id not in found])
+    similarities = [[] for _ in missing]
+    if hasattr(neighbor_search, "similarities") and any(missing):
+        similarities = neighbor_search.similarities(embeddings, missing)
+
+    fused = []
+    for neighbors, ranking, missing_ids, missing_similarities in zip(batch_neighbors, lexical_rankings, missing, similarities):
+        distances = {n.datapoint_id: n.distance for n in neighbors}
+        for datapoint_id, similarity in zip(missing_ids, missing_similarities):
+            if similarity is not None:
+                distances[datapoint_id] = similarity
+        order = reciprocal_rank_fusion(
+            [[n.datapoint_id for n in neighbors], [datapoint_id for datapoint_id, _ in ranking]], k
+        )
+        fused.append([Neighbor(datapoint_id, distances[datapoint_id]) for datapoint_id, _ in order if datapoint_id in distances])
+    return fused
+
+
+_bm25_index = None
+_bm25_index_lock = threading.Lock()
+
+
+def create_bm25_index(store):
+    """
+    Build a new BM25 index from a catalog metadata store, loading the store if needed.
+    Returns None when hybrid retrieval is disabled or the store is not fully loaded.
+    """
+    if not HYBRID_RETRIEVAL:
+        return None
+    store.prefetch([])
+    if not store.preload:
+        logging.warning("Catalog metadata is not preloaded; hybrid retrieval is disabled.")
+        return None
+    return BM25Index(store.records())
+
+
+def get_bm25_index():
+    """
+    Return the process-wide BM25 index, built from the catalog metadata store on first use.
+    Returns None when hybrid retrieval is disabled or the catalog is not fully loaded.
+    """
+    global _bm25_index
+    if not HYBRID_RETRIEVAL:
+        return None
+    with _bm25_index_lock:
+        if _bm25_index is None:
+            _bm25_index = create_bm25_index(get_catalog_store())
+        return _bm25_index
+
+
+def set_bm25_index(index):
+    """
+    Replace the process-wide BM25 index, e.g. with the one of a newly loaded catalog snapshot.
+    """
+    global _bm25_index
+    with _bm25_index_lock:
+        _bm25_index = index
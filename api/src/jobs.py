@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Job store ("memory" or "sqlite"), background workers and how long finished jobs are kept
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "/tmp/match_jobs.sqlite3")
+MATCH_JOB_WORKERS = int(os.environ.get("MATCH_JOB_WORKERS", 2))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 24 * 3600))
+# Seconds between two commits of buffered results and progress in the SQLite job store
+JOB_STORE_FLUSH_SECONDS = float(os.environ.get("JOB_STORE_FLUSH_SECONDS", 0.5))
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class InMemoryJobStore:
+    """
+    Job store keeping job state and per-product results in process memory.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, total):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                "jobId": job_id,
+                "status": "queued",
+                "total": total,
+                "progress": {},
+                "error": None,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            self._results[job_id] = []
+
+    def update_progress(self, job_id, stage, done, total):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["progress"][stage] = {"done": done, "total": total}
+            job["updatedAt"] = time.time()
+
+    def set_status(self, job_id, status, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = status
+            job["error"] = error
+            job["updatedAt"] = time.time()
+
+    def append_result(self, job_id, result):
+        with self._lock:
+            self._results[job_id].append(result)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return dict(job, progress=dict(job["progress"]), completed=len(self._results[job_id]))
+
+    def get_results(self, job_id, offset=0):
+        with self._lock:
+            return list(self._results.get(job_id, [])[offset:])
+
+    def delete_older_than(self, timestamp):
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in FINISHED_STATUSES and job["updatedAt"] < timestamp
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+                del self._results[job_id]
+
+
+def _process_alive(pid):
+    # The current process has just opened the store, so a job recorded under its pid is from an earlier run
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteJobStore:
+    """
+    Job store persisted in SQLite, so job state survives restarts and can be shared by workers on one host.
+    Result rows and progress updates of the jobs run by this process are buffered and committed together,
+    every JOB_STORE_FLUSH_SECONDS, on status changes and before reads.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, flush_seconds=JOB_STORE_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            # Workers on one host may share the file: let readers and one writer work concurrently
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL, progress TEXT NOT NULL,
+                error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, owner INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL, seq INTEGER NOT NULL, payload TEXT NOT NULL, PRIMARY KEY (job_id, seq)
+            );
+            """
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        # Jobs run by this process: next result sequence number and progress
+        self._next_seq = {}
+        self._progress = {}
+        # Buffered (job_id, seq, payload) rows and ids of the jobs whose progress is not written yet
+        self._pending_results = []
+        self._pending_progress = set()
+        self._last_flush = time.monotonic()
+        self._fail_orphaned_jobs()
+        self._connection.commit()
+
+    def _fail_orphaned_jobs(self):
+        # Jobs left queued or running by a process that is gone would never finish, and
+        # stream_results would poll them forever
+        rows = self._connection.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        orphaned = [job_id for job_id, owner in rows if not _process_alive(owner)]
+        if orphaned:
+            now = time.time()
+            self._connection.executemany(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                [("The process running the job exited before it finished.", now, job_id) for job_id in orphaned]
+            )
+            logging.warning(f"Marked {len(orphaned)} interrupted match jobs as failed.")
+
+    def _flush(self):
+        # Write the buffered results and progress in one transaction; the lock must be held
+        if self._pending_results:
+            self._connection.executemany(
+                "INSERT INTO job_results (job_id, seq, payload) VALUES (?, ?, ?)", self._pending_results
+            )
+            self._pending_results = []
+        if self._pending_progress:
+            now = time.time()
+            self._connection.executemany(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                [(json.dumps(self._progress[job_id]), now, job_id) for job_id in self._pending_progress]
+            )
+            self._pending_progress.clear()
+        self._connection.commit()
+        self._last_flush = time.monotonic()
+
+    def _flush_if_due(self):
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self._flush()
+
+    def create(self, job_id, total):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (id, status, total, progress, error, created_at, updated_at, owner) "
+                "VALUES (?, 'queued', ?, '{}', NULL, ?, ?, ?)",
+                (job_id, total, now, now, os.getpid())
+            )
+            self._next_seq[job_id] = 0
+            self._progress[job_id] = {}
+            self._flush()
+
+    def update_progress(self, job_id, stage, done, total):
+        with self._lock:
+            progress = self._progress.get(job_id)
+            if progress is None:
+                (progress,) = self._connection.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                progress = self._progress[job_id] = json.loads(progress)
+            progress[stage] = {"done": done, "total": total}
+            self._pending_progress.add(job_id)
+            self._flush_if_due()
+
+    def set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._flush()
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?", (status, error, time.time(), job_id)
+            )
+            self._connection.commit()
+            if status in FINISHED_STATUSES:
+                self._next_seq.pop(job_id, None)
+                self._progress.pop(job_id, None)
+
+    def append_result(self, job_id, result):
+        with self._lock:
+            seq = self._next_seq.get(job_id)
+            if seq is None:
+                (seq,) = self._connection.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM job_results WHERE job_id = ?", (job_id,)
+                ).fetchone()
+            self._next_seq[job_id] = seq + 1
+            self._pending_results.append((job_id, seq, json.dumps(result)))
+            self._flush_if_due()
+
+    def get(self, job_id):
+        with self._lock:
+            if self._pending_results or self._pending_progress:
+                self._flush()
+            row = self._connection.execute(
+                "SELECT id, status, total, progress, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Sequence numbers are contiguous from 0: the next one is the number of results
+            (completed,) = self._connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM job_results WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return {
+            "jobId": row[0],
+            "status": row[1],
+            "total": row[2],
+            "progress": json.loads(row[3]),
+            "error": row[4],
+            "createdAt": row[5],
+            "updatedAt": row[6],
+            "completed": completed,
+        }
+
+    def get_results(self, job_id, offset=0):
+        with self._lock:
+            if self._pending_results:
+                self._flush()
+            rows = self._connection.execute(
+                "SELECT payload FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, offset)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def delete_older_than(self, timestamp):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM job_results WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?)",
+                (timestamp,)
+            )
+            self._connection.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (timestamp,)
+            )
+            self._connection.commit()
+
+
+def group_job_results(results):
+    """
+    Rebuild the /api/match response shape from a job's per-product results.
+    Args:
+        results (list): Per-product results with a "status" of matched, uncertain or none.
+
+    Returns:
+        dict: A dictionary with matched, uncertain, and no matches.
+    """
+    keys = {"matched": "matchedProducts", "uncertain": "uncertainMatches", "none": "noMatches"}
+    grouped = {key: [] for key in keys.values()}
+    for result in results:
+        entry = {k: v for k, v in result.items() if k != "status"}
+        grouped[keys[result["status"]]].append(entry)
+    return grouped
+
+
+class JobManager:
+    """
+    Runs match jobs on a background thread pool and records their progress and results in a job store.
+    """
+
+    def __init__(self, store, match_function, max_workers=MATCH_JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.store = store
+        self.match_function = match_function
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="match-job")
+
+    def submit(self, external_products):
+        """
+        Queue a match job for a list of external products.
+        Args:
+            external_products (list): List of external product names.
+
+        Returns:
+            str: The id of the new job.
+        """
+        self.store.delete_older_than(time.time() - self.retention_seconds)
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, len(external_products))
+        self._executor.submit(self._run, job_id, external_products)
+        logging.info(f"Queued match job {job_id} with {len(external_products)} products.")
+        return job_id
+
+    def _run(self, job_id, external_products):
+        self.store.set_status(job_id, "running")
+        try:
+            self.match_function(
+                external_products,
+                on_result=lambda result: self.store.append_result(job_id, result),
+                on_progress=lambda stage, done, total: self.store.update_progress(job_id, stage, done, total),
+            )
+            self.store.set_status(job_id, "completed")
+            logging.info(f"Match job {job_id} completed.")
+        except Exception as e:
+            logging.error(f"Match job {job_id} failed: {str(e)}")
+            self.store.set_status(job_id, "failed", error=str(e))
+
+    def stream_results(self, job_id, poll_interval=0.5):
+        """
+        Yield each product result of a job as soon as it is final, until the job finishes.
+        Args:
+            job_id (str): The job id.
+            poll_interval (float): Seconds between two polls of the job store.
+        """
+        offset = 0
+        while True:
+            job = self.store.get(job_id)
+            results = self.store.get_results(job_id, offset)
+            offset += len(results)
+            for result in results:
+                yield result
+            if job is None or job["status"] in FINISHED_STATUSES:
+                # Drain results written between the status check and the read above
+                for result in self.store.get_results(job_id, offset):
+                    yield result
+                return
+            time.sleep(poll_interval)
+
+
+def create_job_store(kind=JOB_STORE):
+    """
+    Create the configured job store ("memory" or "sqlite").
+    """
+    if kind == "sqlite":
+        return SQLiteJobStore(JOB_STORE_PATH)
+    if kind == "memory":
+        return InMemoryJobStore()
+    raise ValueError(f"Unknown job store: {kind}")
@@ -0,0 +1,160 @@
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+from bigquery_client import get_catalog_store
+from normalization import char_ngrams, normalize_product_text, numeric_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Resolve exact and near-exact hits before embedding, and the trigram Jaccard needed for a near-exact hit
+LEXICAL_FAST_PATH = os.environ.get("LEXICAL_FAST_PATH", "true").lower() == "true"
+LEXICAL_MATCH_THRESHOLD = float(os.environ.get("LEXICAL_MATCH_THRESHOLD", 0.9))
+
+CATALOG_NAME_FIELDS = ("name", "ocs_name", "long_name")
+
+
+class LexicalIndex:
+    """
+    Lexical index over the NAME, OCS_NAME and LONG_NAME of every catalog entry.
+    A hash map of normalized names resolves exact hits; a character-trigram inverted index
+    resolves near-exact hits (trigram Jaccard above a threshold and identical sizes).
+    """
+
+    def __init__(self, records, threshold=LEXICAL_MATCH_THRESHOLD):
+        """
+        Args:
+            records (dict): datapoint_id -> dict with `name`, `ocs_name` and `long_name`.
+            threshold (float): Minimum trigram Jaccard similarity for a near-exact hit.
+        """
+        self.threshold = threshold
+        self.long_names = {}
+        self.exact = defaultdict(set)
+        self.keys = []
+        self.key_ids = []
+        self.key_grams = []
+        self.postings = defaultdict(list)
+
+        seen = set()
+        for datapoint_id, record in records.items():
+            self.long_names[datapoint_id] = record.get("long_name")
+            for field in CATALOG_NAME_FIELDS:
+                if not record.get(field):
+                    continue
+                key = normalize_product_text(record[field])
+                if not key or (key, datapoint_id) in seen:
+                    continue
+                seen.add((key, datapoint_id))
+                self.exact[key].add(datapoint_id)
+                grams = char_ngrams(key)
+                entry = len(self.keys)
+                self.keys.append(key)
+                self.key_ids.append(datapoint_id)
+                self.key_grams.append(grams)
+                for gram in grams:
+                    self.postings[gram].append(entry)
+        logging.info(f"Built lexical index with {len(self.keys)} names for {len(self.long_names)} catalog entries.")
+
+    def _match(self, datapoint_id, match_type, score):
+        return {
+            "datapoint_id": datapoint_id,
+            "long_name": self.long_names.get(datapoint_id),
+            "match_type": match_type,
+            "score": score,
+        }
+
+    def lookup_exact(self, text):
+        """
+        Return the catalog entry whose normalized name equals the normalized text, if it is unique.
+        """
+        ids = self.exact.get(normalize_product_text(text))
+        if ids and len(ids) == 1:
+            return self._match(next(iter(ids)), "exact", 1.0)
+        return None
+
+    def lookup_near_exact(self, text):
+        """
+        Return the single catalog entry whose name is a near-exact trigram match of the text.
+        Only the rarest query trigrams are used to generate candidates (prefix filtering),
+        which is enough to find every name above the Jaccard threshold.
+        """
+        key = normalize_product_text(text)
+        query = char_ngrams(key)
+        if not query:
+            return None
+        sizes = numeric_tokens(key)
+        prefix_length = len(query) - math.ceil(self.threshold * len(query)) + 1
+        rare_grams = sorted(query, key=lambda gram: len(self.postings.get(gram, ())))[:prefix_length]
+
+        best_score = 0.0
+        best_ids = set()
+        candidates = {entry for gram in rare_grams for entry in self.postings.get(gram, ())}
+        for entry in candidates:
+            grams = self.key_grams[entry]
+            if not self.threshold * len(query) <= len(grams) <= len(query) / self.threshold:
+                continue
+            score = len(query & grams) / len(query | grams)
+            if score < self.threshold or numeric_tokens(self.keys[entry]) != sizes:
+                continue
+            if score > best_score:
+                best_score, best_ids = score, {self.key_ids[entry]}
+            elif score == best_score:
+                best_ids.add(self.key_ids[entry])
+
+        if len(best_ids) == 1:
+            return self._match(next(iter(best_ids)), "near_exact", best_score)
+        return None
+
+    def lookup(self, text):
+        """
+        Resolve a product name lexically.
+        Args:
+            text (str): The uploaded product name.
+
+        Returns:
+            dict: `datapoint_id`, `long_name`, `match_type` and `score` of the hit, or None.
+        """
+        return self.lookup_exact(text) or self.lookup_near_exact(text)
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def create_lexical_index(store):
+    """
+    Build a new lexical index from a catalog metadata store, loading the store if needed.
+    Returns None when the fast path is disabled or the store is not fully loaded.
+    """
+    if not LEXICAL_FAST_PATH:
+        return None
+    store.prefetch([])
+    if not store.preload:
+        logging.warning("Catalog metadata is not preloaded; the lexical fast path is disabled.")
+        return None
+    return LexicalIndex(store.records())
+
+
+def get_lexical_index():
+    """
+    Return the process-wide lexical index, built from the catalog metadata store on first use.
+    Returns None when the fast path is disabled or the catalog is not fully loaded.
+    """
+    global _lexical_index
+    if not LEXICAL_FAST_PATH:
+        return None
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = create_lexical_index(get_catalog_store())
+        return _lexical_index
+
+
+def set_lexical_index(index):
+    """
+    Replace the process-wide lexical index, e.g. with the one of a newly loaded catalog snapshot.
+    """
+    global _lexical_index
+    with _lexical_index_lock:
+        _lexical_index = index
@@ -0,0 +1,256 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+# Offline runs must not touch the on-disk embedding cache, reuse results across runs or be paced
+# by the production quotas. All of these can still be set explicitly in the environment.
+os.environ.setdefault("EMBEDDING_CACHE_PATH", ":memory:")
+os.environ.setdefault("RESULT_CACHE", "false")
+for _variable in ("EMBEDDING_CALLS_PER_MINUTE", "VECTOR_SEARCH_CALLS_PER_MINUTE", "LLM_CALLS_PER_MINUTE"):
+    os.environ.setdefault(_variable, "1000000")
+
+import numpy as np
+import pandas as pd
+import hybrid_retrieval
+import lexical_index
+import matching_engine
+import reranker
+from benchmark_fakes import FakeCatalogStore, FakeEmbedder, FakeNeighborSearch, ScriptedLLM, synthetic_uploads
+from bigquery_client import set_catalog_store
+from embedding_cache import get_embedding_cache
+from rate_limiter import rate_limiter_stats
+from vector_search import LocalNeighborSearch, set_neighbor_search
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "../../data/processed")
+INTERNAL_CSV = os.path.join(DATA_DIR, "Data_Internal_cleaned.csv")
+EXTERNAL_CSV = os.path.join(DATA_DIR, "Data_External_cleaned.csv")
+
+STAGES = ("lexical", "embedding", "vector_search", "llm")
+
+
+def _percentiles(values):
+    values = np.array(values) if values else np.zeros(1)
+    return float(np.percentile(values, 50)), float(np.percentile(values, 99))
+
+
+class StageTimer:
+    """
+    Wraps the stage functions of the matching flow and records the duration and size of every call.
+    """
+
+    def __init__(self):
+        self.calls = {stage: [] for stage in STAGES}
+
+    def wrap(self, stage, function, count_items):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.calls[stage].append((time.perf_counter() - start, count_items(*args, **kwargs)))
+        return timed
+
+    def report(self):
+        report = {}
+        for stage, calls in self.calls.items():
+            seconds = sum(duration for duration, _ in calls)
+            items = sum(count for _, count in calls)
+            p50, p99 = _percentiles([duration for duration, _ in calls])
+            report[stage] = {
+                "calls": len(calls),
+                "items": items,
+                "seconds": seconds,
+                "items_per_second": items / seconds if seconds else 0.0,
+                "p50_seconds": p50,
+                "p99_seconds": p99,
+            }
+        return report
+
+
+def load_catalog(path=INTERNAL_CSV):
+    """
+    Read the catalog CSV into an id -> {name, ocs_name, long_name} map.
+    """
+    catalog = pd.read_csv(path, dtype=str).fillna("")
+    records = {}
+    for row, (name, ocs_name, long_name) in enumerate(catalog[["NAME", "OCS_NAME", "LONG_NAME"]].itertuples(index=False)):
+        if long_name:
+            records[f"sku-{row:06d}"] = {"name": name or None, "ocs_name": ocs_name or None, "long_name": long_name}
+    return records
+
+
+def install_fakes(records, args):
+    """
+    Point matching_engine at the local stand-ins and return them by name.
+    """
+    embedder = FakeEmbedder(latency=args.embedding_latency, jitter=args.jitter, quota_error_rate=args.quota_error_rate)
+    ids = list(records)
+    logging.info(f"Embedding {len(ids)} catalog names with the fake embedder.")
+    index = LocalNeighborSearch(ids, embedder.embed([records[i]["long_name"] for i in ids]), normalized=True)
+    neighbor_search = FakeNeighborSearch(index, latency=args.vector_search_latency, jitter=args.jitter,
+                                         quota_error_rate=args.quota_error_rate)
+    catalog = FakeCatalogStore(records, preload=args.catalog_mode == "preload", latency=args.catalog_latency,
+                               jitter=args.jitter)
+    llm = ScriptedLLM(confident_rate=args.confident_rate, latency=args.llm_latency, jitter=args.jitter,
+                      quota_error_rate=args.quota_error_rate)
+
+    matching_engine.set_genai_client(embedder)
+    matching_engine.set_llm(llm)
+    set_neighbor_search(neighbor_search)
+    set_catalog_store(catalog)
+    lexical_index.LEXICAL_FAST_PATH = not args.no_lexical
+    matching_engine.MATCH_PIPELINE = not args.sequential
+    matching_engine.MATCH_CLUSTERING = not args.no_clustering
+    hybrid_retrieval.HYBRID_RETRIEVAL = not args.no_hybrid
+    reranker.LOCAL_RERANKER = not args.no_reranker
+    return {"embeddings": embedder, "vector_search": neighbor_search, "catalog": catalog, "llm": llm}
+
+
+def instrument(timer, neighbor_search):
+    """
+    Time the lexical lookups, embedding calls, neighbor searches and LLM adjudication of the matching flow.
+    """
+    index = lexical_index.get_lexical_index()
+    if index is not None:
+        index.lookup = timer.wrap("lexical", index.lookup, lambda text: 1)
+    matching_engine.generate_embeddings_in_batches = timer.wrap(
+        "embedding", matching_engine.generate_embeddings_in_batches, lambda texts, **kwargs: len(texts)
+    )
+    neighbor_search.find_neighbors = timer.wrap(
+        "vector_search", neighbor_search.find_neighbors, lambda embeddings, **kwargs: len(embeddings)
+    )
+    matching_engine.adjudicate_semi_confident_matches = timer.wrap(
+        "llm", matching_engine.adjudicate_semi_confident_matches, lambda items, **kwargs: len(items)
+    )
+
+
+def run_once(label, products, batch_size, fakes):
+    """
+    Run the full matching flow on a list of uploaded names and measure it.
+    Returns:
+        dict: Totals, per-stage timings, time-to-result percentiles and upstream call statistics.
+    """
+    timer = StageTimer()
+    for fake in fakes.values():
+        fake.reset()
+    originals = (matching_engine.generate_embeddings_in_batches, matching_engine.adjudicate_semi_confident_matches,
+                 fakes["vector_search"].find_neighbors)
+    instrument(timer, fakes["vector_search"])
+    result_times = []
+    start = time.perf_counter()
+    try:
+        results = matching_engine.match_products_with_vector_search_in_batches(
+            products, batch_size=batch_size, on_result=lambda result: result_times.append(time.perf_counter() - start)
+        )
+    finally:
+        (matching_engine.generate_embeddings_in_batches, matching_engine.adjudicate_semi_confident_matches,
+         fakes["vector_search"].find_neighbors) = originals
+        index = lexical_index.get_lexical_index()
+        if index is not None:
+            index.__dict__.pop("lookup", None)
+    seconds = time.perf_counter() - start
+    p50, p99 = _percentiles(result_times)
+    return {
+        "label": label,
+        "products": len(products),
+        "seconds": seconds,
+        "products_per_second": len(products) / seconds,
+        "matched": len(results["matchedProducts"]),
+        "uncertain": len(results["uncertainMatches"]),
+        "none": len(results["noMatches"]),
+        "time_to_result_p50_seconds": p50,
+        "time_to_result_p99_seconds": p99,
+        "stages": timer.report(),
+        "upstreams": {name: fake.stats() for name, fake in fakes.items()},
+        "embedding_cache": get_embedding_cache().stats(),
+        "rate_limiters": rate_limiter_stats(),
+    }
+
+
+def print_run(run):
+    print(f"\n== {run['label']}: {run['products']} products in {run['seconds']:.2f}s "
+          f"({run['products_per_second']:.0f}/s) - matched {run['matched']}, uncertain {run['uncertain']}, "
+          f"none {run['none']}")
+    print(f"time to result: p50 {run['time_to_result_p50_seconds']:.3f}s, p99 {run['time_to_result_p99_seconds']:.3f}s")
+    print(f"{'stage':<15}{'calls':>8}{'items':>9}{'seconds':>10}{'items/s':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for stage, row in run["stages"].items():
+        print(f"{stage:<15}{row['calls']:>8}{row['items']:>9}{row['seconds']:>10.2f}{row['items_per_second']:>11.0f}"
+              f"{row['p50_seconds'] * 1000:>9.1f}{row['p99_seconds'] * 1000:>9.1f}")
+    print(f"{'upstream':<15}{'calls':>8}{'quota':>9}{'p50 ms':>10}{'p99 ms':>11}")
+    for name, row in run["upstreams"].items():
+        print(f"{name:<15}{row['calls']:>8}{row['quota_errors']:>9}{row['p50_seconds'] * 1000:>10.1f}"
+              f"{row['p99_seconds'] * 1000:>11.1f}")
+
+
+def compare_with_baseline(runs, baseline_path, tolerance):
+    """
+    Compare the end-to-end and per-stage throughput of each run with a previous report.
+    Returns:
+        list: Descriptions of the regressions larger than `tolerance` (a fraction).
+    """
+    with open(baseline_path, mode="r", encoding="utf-8") as baseline_file:
+        baseline = {run["label"]: run for run in json.load(baseline_file)["runs"]}
+    regressions = []
+    for run in runs:
+        previous = baseline.get(run["label"])
+        if previous is None:
+            continue
+        pairs = [("end to end", previous["products_per_second"], run["products_per_second"])]
+        pairs += [(stage, previous["stages"][stage]["items_per_second"], row["items_per_second"])
+                  for stage, row in run["stages"].items() if row["items"] and previous["stages"][stage]["items"]]
+        for name, before, after in pairs:
+            if before and after < before * (1 - tolerance):
+                regressions.append(f"{run['label']} / {name}: {before:.0f}/s -> {after:.0f}/s")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the matching flow offline against local stand-ins.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated synthetic upload sizes")
+    parser.add_argument("--external-csv", default=EXTERNAL_CSV, help="External sample with a PRODUCT_NAME column")
+    parser.add_argument("--internal-csv", default=INTERNAL_CSV, help="Catalog with NAME, OCS_NAME and LONG_NAME")
+    parser.add_argument("--batch-size", type=int, default=250)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embedding call")
+    parser.add_argument("--vector-search-latency", type=float, default=0.02, help="Seconds per neighbor search call")
+    parser.add_argument("--catalog-latency", type=float, default=0.1, help="Seconds per catalog load or fetch")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency, in seconds")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="Share of upstream calls failing with 429")
+    parser.add_argument("--confident-rate", type=float, default=0.6, help="Share of LLM answers confirming a match")
+    parser.add_argument("--catalog-mode", choices=("preload", "fetch"), default="preload")
+    parser.add_argument("--no-lexical", action="store_true", help="Disable the lexical fast path")
+    parser.add_argument("--sequential", action="store_true", help="Run the stages one batch at a time")
+    parser.add_argument("--no-clustering", action="store_true", help="Disable duplicate clustering")
+    parser.add_argument("--no-hybrid", action="store_true", help="Disable the BM25 + vector fusion")
+    parser.add_argument("--no-reranker", action="store_true", help="Escalate every semi-confident product to the LLM")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    parser.add_argument("--baseline", help="Previous JSON report; exit non-zero on throughput regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop against the baseline")
+    args = parser.parse_args()
+
+    records = load_catalog(args.internal_csv)
+    fakes = install_fakes(records, args)
+    long_names = [record["long_name"] for record in records.values()]
+
+    workloads = [("external sample", pd.read_csv(args.external_csv)["PRODUCT_NAME"].dropna().astype(str).tolist())]
+    workloads += [(f"synthetic {int(size)}", synthetic_uploads(long_names, int(size), seed=int(size)))
+                  for size in args.sizes.split(",") if size]
+    runs = []
+    for label, products in workloads:
+        runs.append(run_once(label, products, args.batch_size, fakes))
+        print_run(runs[-1])
+
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as output_file:
+            json.dump({"settings": vars(args), "runs": runs}, output_file, indent=2)
+    if args.baseline:
+        regressions = compare_with_baseline(runs, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
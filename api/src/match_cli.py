@@ -0,0 +1,390 @@
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+from data_processing import clean_products
+from matching_engine import match_products_with_vector_search_in_batches
+from metrics import start_trace
+from rate_limiter import create_shared_rate_limiters, set_rate_limiters
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Distinct products per shard: the unit of work of a worker process and of checkpointing
+DEFAULT_SHARD_ROWS = 20000
+# Rows read from the input at a time
+READ_CHUNK_ROWS = 50000
+STATUSES = ("matched", "uncertain", "none")
+OUTPUT_COLUMNS = {
+    "matched": ["uploaded", "datapoint_id", "long_name", "cluster_id"],
+    "uncertain": ["uploaded", "possible_matches", "cluster_id"],
+    "none": ["uploaded", "error", "cluster_id"],
+}
+RESULT_KEYS = {"matched": "matchedProducts", "uncertain": "uncertainMatches", "none": "noMatches"}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ValueError("Parquet input and output need pyarrow (pip install pyarrow).")
+
+
+def iter_input_chunks(path, column=None, chunk_rows=READ_CHUNK_ROWS):
+    """
+    Read the product names of a CSV (optionally gzip-compressed) or Parquet file chunk by chunk.
+    Args:
+        path (str): Input file; `.parquet` / `.pq` files are read as Parquet, anything else as CSV.
+        column (str): Column holding the product names; may be omitted if the file has a single column.
+        chunk_rows (int): Rows read at a time.
+
+    Yields:
+        Series: Raw product names.
+    """
+    if path.endswith((".parquet", ".pq")):
+        require_pyarrow()
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names
+        column = _select_column(names, column)
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=[column]):
+            yield batch.column(0).to_pandas()
+        return
+
+    names = pd.read_csv(path, nrows=0).columns.tolist()
+    column = _select_column(names, column)
+    for chunk in pd.read_csv(path, usecols=[column], chunksize=chunk_rows, dtype=str):
+        yield chunk[column]
+
+
+def _select_column(names, column):
+    if column is None:
+        if len(names) != 1:
+            raise ValueError(f"The input has {len(names)} columns ({', '.join(names)}); choose one with --column.")
+        return names[0]
+    if column not in names:
+        raise ValueError(f"Column {column} not found in the input ({', '.join(names)}).")
+    return column
+
+
+def iter_shards(path, column=None, shard_rows=DEFAULT_SHARD_ROWS, report=None):
+    """
+    Split the cleaned, de-duplicated products of an input file into numbered shards.
+    The split only depends on the input and `shard_rows`, so a resumed run sees the same shards.
+    Yields:
+        tuple: (shard number, list of products).
+    """
+    seen = set()
+    shard = []
+    number = 0
+    chunks = iter_input_chunks(path, column)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        products = list(clean_products(chunk, seen))
+        if report is not None:
+            report.add_stage("read", time.perf_counter() - start, len(chunk))
+        for product in products:
+            shard.append(product)
+            if len(shard) == shard_rows:
+                yield number, shard
+                number += 1
+                shard = []
+    if shard:
+        yield number, shard
+
+
+class Checkpoint:
+    """
+    Completed shards of a run, appended to `checkpoint.jsonl` in the output directory once their
+    results are written. A `manifest.json` records the input and settings the shards refer to,
+    so a run is only resumed against the same input.
+    """
+
+    def __init__(self, output_dir, settings, restart=False):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, "checkpoint.jsonl")
+        self.completed = {}
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        if os.path.exists(manifest_path) and not restart:
+            with open(manifest_path, mode="r", encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest != settings:
+                raise ValueError(
+                    f"{output_dir} holds a run with other settings or another version of the input "
+                    f"({manifest}); use --restart to discard it."
+                )
+            if os.path.exists(self.path):
+                with open(self.path, mode="r", encoding="utf-8") as checkpoint_file:
+                    for line in checkpoint_file:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.completed[entry["shard"]] = entry
+            logging.info(f"Resuming: {len(self.completed)} shards already completed.")
+            return
+
+        for part in glob.glob(os.path.join(output_dir, "*", "part-*")):
+            os.remove(part)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        with open(manifest_path, mode="w", encoding="utf-8") as manifest_file:
+            json.dump(settings, manifest_file, indent=2)
+
+    def done(self, shard):
+        return shard in self.completed
+
+    def record(self, stats):
+        """
+        Mark a shard as completed; the line is flushed to disk before returning.
+        """
+        with open(self.path, mode="a", encoding="utf-8") as checkpoint_file:
+            checkpoint_file.write(json.dumps(stats) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        self.completed[stats["shard"]] = stats
+
+
+def result_rows(status, entries, shard):
+    """
+    Flatten the result entries of one status of a shard into output rows.
+    Cluster ids are numbered per shard, so they are written as "<shard>-<cluster id>".
+    """
+    def cluster(entry):
+        return f"{shard}-{entry['clusterId']}" if entry.get("clusterId") is not None else None
+
+    if status == "matched":
+        return [
+            [e["uploaded"], e["matchedWith"]["datapoint_id"], e["matchedWith"]["long_name"], cluster(e)]
+            for e in entries
+        ]
+    if status == "uncertain":
+        return [[e["uploaded"], json.dumps(e["possibleMatches"]), cluster(e)] for e in entries]
+    return [[e["uploaded"], e.get("error"), cluster(e)] for e in entries]
+
+
+def write_part(output_dir, status, shard, rows, output_format):
+    """
+    Write the results of one status of a shard to `<output_dir>/<status>/part-<shard>.<format>`.
+    The file is written under a temporary name and renamed, so a part is either complete or absent.
+    """
+    directory = os.path.join(output_dir, status)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{shard:05d}.{output_format}")
+    frame = pd.DataFrame(rows, columns=OUTPUT_COLUMNS[status])
+    if output_format == "parquet":
+        frame.to_parquet(path + ".tmp", index=False)
+    else:
+        frame.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def match_shard(shard, products, output_dir, output_format, batch_size):
+    """
+    Match one shard in a worker process and write its results.
+    Returns:
+        dict: Shard statistics: rows, rows per status, rows that failed with an error, seconds, per-stage timings
+        and upstream counters (calls, retries, throttling).
+    """
+    start = time.perf_counter()
+    with start_trace() as trace:
+        results = match_products_with_vector_search_in_batches(products, batch_size=batch_size)
+    summary = trace.summary()
+    counts = {}
+    for status in STATUSES:
+        entries = results[RESULT_KEYS[status]]
+        write_part(output_dir, status, shard, result_rows(status, entries, shard), output_format)
+        counts[status] = len(entries)
+    return {
+        "shard": shard,
+        "rows": len(products),
+        "counts": counts,
+        "errors": sum(1 for entry in results["noMatches"] if entry.get("error")),
+        "seconds": round(time.perf_counter() - start, 3),
+        "stages": summary["stages"],
+        "counters": summary["counters"],
+        "pid": os.getpid(),
+    }
+
+
+class ThroughputReport:
+    """
+    Aggregated progress of a run: rows per second overall and per stage.
+    Stage rates are items per second of busy time summed over the workers.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.skipped_rows = 0
+        self.shards = 0
+        self.failed_shards = []
+        self.counts = defaultdict(int)
+        self.stages = defaultdict(lambda: {"seconds": 0.0, "calls": 0, "items": 0})
+
+    def add_stage(self, stage, seconds, items):
+        entry = self.stages[stage]
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        entry["items"] += items
+
+    def add_shard(self, stats):
+        self.shards += 1
+        self.rows += stats["rows"]
+        for status, count in stats["counts"].items():
+            self.counts[status] += count
+        for stage, entry in stats["stages"].items():
+            self.stages[stage]["seconds"] += entry["seconds"]
+            self.stages[stage]["calls"] += entry["calls"]
+            self.stages[stage]["items"] += entry["items"]
+
+    def rows_per_second(self):
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+    def log_progress(self):
+        rates = ", ".join(
+            f"{stage} {entry['items'] / entry['seconds']:.0f}/s"
+            for stage, entry in self.stages.items() if entry["seconds"] > 0 and entry["items"]
+        )
+        logging.info(
+            f"{self.shards} shards, {self.rows} rows in {time.perf_counter() - self.started:.0f}s "
+            f"({self.rows_per_second():.0f} rows/s). Stages: {rates}"
+        )
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "skippedRows": self.skipped_rows,
+            "shards": self.shards,
+            "failedShards": self.failed_shards,
+            "counts": dict(self.counts),
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "rowsPerSecond": round(self.rows_per_second(), 1),
+            "stages": {
+                stage: dict(entry, seconds=round(entry["seconds"], 3),
+                            itemsPerSecond=round(entry["items"] / entry["seconds"], 1) if entry["seconds"] else None)
+                for stage, entry in self.stages.items()
+            },
+        }
+
+
+def print_report(summary):
+    print(f"{summary['rows']} rows matched in {summary['seconds']:.1f}s ({summary['rowsPerSecond']:.0f} rows/s), "
+          f"{summary['skippedRows']} rows resumed from the checkpoint")
+    print(" ".join(f"{status} {count}" for status, count in summary["counts"].items()))
+    print(f"{'stage':<15}{'calls':>8}{'items':>10}{'seconds':>10}{'items/s':>12}")
+    for stage, entry in summary["stages"].items():
+        rate = entry["itemsPerSecond"]
+        print(f"{stage:<15}{entry['calls']:>8}{entry['items']:>10}{entry['seconds']:>10.1f}"
+              f"{f'{rate:.0f}' if rate is not None else '-':>12}")
+    if summary["failedShards"]:
+        print(f"Failed shards: {summary['failedShards']}; run the same command again to retry them.")
+
+
+def run(input_path, output_dir, column=None, output_format="csv", workers=4, shard_rows=DEFAULT_SHARD_ROWS,
+        batch_size=250, accept_errors=False, restart=False):
+    """
+    Match every product of a large input file with a pool of worker processes.
+    Each worker loads its own catalog snapshot (memory-mapped `.npy` local indexes are shared through the
+    page cache) and every upstream call of every worker draws from one shared rate budget.
+    Args:
+        input_path (str): CSV or Parquet input.
+        output_dir (str): Directory receiving `<status>/part-<shard>` files, the checkpoint and the report.
+        column (str): Column with the product names.
+        output_format (str): "csv" or "parquet".
+        workers (int): Worker processes.
+        shard_rows (int): Distinct products per shard.
+        batch_size (int): Batch size of the matching engine.
+        accept_errors (bool): Checkpoint shards in which some products failed with an upstream error
+            (by default they are matched again by the next run).
+        restart (bool): Discard the results and checkpoint of a previous run in `output_dir`.
+
+    Returns:
+        dict: The run summary (see ThroughputReport.summary).
+    """
+    if output_format == "parquet":
+        require_pyarrow()
+    settings = {
+        "input": os.path.abspath(input_path),
+        "inputSize": os.path.getsize(input_path),
+        "inputModified": os.path.getmtime(input_path),
+        "column": column,
+        "shardRows": shard_rows,
+        "format": output_format,
+    }
+    checkpoint = Checkpoint(output_dir, settings, restart=restart)
+    report = ThroughputReport()
+    # Workers are spawned rather than forked: gRPC and HTTP clients must not be shared across a fork
+    context = multiprocessing.get_context("spawn")
+    limiters = create_shared_rate_limiters(context)
+
+    def collect(futures):
+        for future in futures:
+            shard = pending.pop(future)
+            try:
+                stats = future.result()
+            except Exception as e:
+                logging.error(f"Shard {shard} failed: {str(e)}")
+                report.failed_shards.append(shard)
+                continue
+            report.add_shard(stats)
+            if stats["errors"] and not accept_errors:
+                logging.error(f"Shard {shard}: {stats['errors']} products failed; it will be matched again next run.")
+                report.failed_shards.append(shard)
+            else:
+                checkpoint.record(stats)
+            report.log_progress()
+
+    pending = {}
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=set_rate_limiters, initargs=(limiters,)) as pool:
+        for shard, products in iter_shards(input_path, column, shard_rows, report):
+            if checkpoint.done(shard):
+                report.skipped_rows += len(products)
+                continue
+            # Keep at most two shards per worker in flight, so memory stays bounded on huge inputs
+            while len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(match_shard, shard, products, output_dir, output_format, batch_size)] = shard
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    summary = report.summary()
+    with open(os.path.join(output_dir, "report.json"), mode="w", encoding="utf-8") as report_file:
+        json.dump(summary, report_file, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match a large CSV or Parquet file of product names offline.")
+    parser.add_argument("input", help="CSV (optionally .gz) or Parquet file")
+    parser.add_argument("output_dir", help="Directory receiving the results, the checkpoint and the report")
+    parser.add_argument("--column", help="Column with the product names (default: the only column)")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv", help="Output format")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Worker processes")
+    parser.add_argument("--shard-rows", type=int, default=DEFAULT_SHARD_ROWS, help="Distinct products per shard")
+    parser.add_argument("--batch-size", type=int, default=250, help="Batch size of the matching engine")
+    parser.add_argument("--accept-errors", action="store_true",
+                        help="Checkpoint shards with failed products instead of retrying them next run")
+    parser.add_argument("--restart", action="store_true", help="Discard a previous run in the output directory")
+    args = parser.parse_args()
+
+    try:
+        summary = run(args.input, args.output_dir, args.column, args.format, args.workers, args.shard_rows,
+                      args.batch_size, args.accept_errors, args.restart)
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(2)
+    print_report(summary)
+    sys.exit(1 if summary["failedShards"] else 0)
@@ -1,12 +1,34 @@
+import asyncio
+import hashlib
 import logging
+import json
+import os
+import threading
 import time
+from itertools import islice
 from google import genai
 from google.genai.types import EmbedContentConfig
-from google.cloud import aiplatform_v1
-from bigquery_client import get_long_name_by_datapoint_id
 from langchain.chat_models import init_chat_model
 from typing import Optional, List
 from pydantic import BaseModel, Field
+from embedding_cache import get_embedding_cache, make_cache_key
+from rate_limiter import get_rate_limiter, is_quota_error
+from pipeline import run_pipeline
+from catalog import get_catalog
+# Module imports: match_benchmark.py switches these flags at runtime
+import hybrid_retrieval
+import lexical_index
+from clustering import MATCH_CLUSTERING, ProductClusterer
+from hybrid_retrieval import fuse_neighbors
+from clients import get_client, get_client_registry, register_client
+from result_cache import RESULT_CACHE_SCHEMA, get_result_cache
+from size_attributes import SIZE_AUTO_ACCEPT, SIZE_TOLERANCE
+from reranker import SCORE_WEIGHTS, get_reranker, get_verdict_log
+from micro_batcher import get_micro_batcher
+from metrics import (
+    record_classification, record_embedding_cache, record_llm_batch_fallback, record_llm_tokens, record_result,
+    record_retry, record_upstream_call, timed_stage,
+)
 
 class ProductComparison(BaseModel):
     is_confident: bool = Field(alias="is_confident")
@@ -17,23 +39,94 @@ class ProductComparison(BaseModel):
         allow_population_by_field_name = True
         allow_population_by_alias = True
 
+class BatchedProductComparison(ProductComparison):
+    product_index: int = Field(alias="product_index")
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Initialize the GenAI client for embedding generation
-try:
-    genai_client = genai.Client(vertexai=True, project="genai-product-matching", location="northamerica-northeast1")
-    logging.info("GenAI client initialized successfully.")
-except Exception as e:
-    logging.error(f"Failed to initialize GenAI client: {str(e)}")
-    raise
-
-# Initialize the Gemini Flash Pro 1.5 model
-llm = init_chat_model(
-    "gemini-2.0-flash-001",
-    model_provider="google_vertexai"
-)
-import json
+# Embedding model settings (also part of the embedding cache key)
+EMBEDDING_MODEL = "text-embedding-005"
+EMBEDDING_TASK_TYPE = "SEMANTIC_SIMILARITY"
+EMBEDDING_DIMENSIONALITY = 768
+
+# LLM adjudication settings
+LLM_MODEL = "gemini-2.0-flash-001"
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 60))
+# Number of products adjudicated by one LLM call, sharing the instructions and examples (1 disables batching)
+LLM_BATCH_SIZE = int(os.environ.get("LLM_BATCH_SIZE", 8))
+
+# Overlap the embedding, vector search and LLM stages of consecutive batches (false runs them one batch at a time)
+MATCH_PIPELINE = os.environ.get("MATCH_PIPELINE", "true").lower() == "true"
+
+# The GenAI client (embeddings) and the Gemini model (adjudication) are created on first use and
+# shared through the client registry, so importing this module does not require Google credentials
+def _create_genai_client():
+    try:
+        client = genai.Client(vertexai=True, project="genai-product-matching", location="northamerica-northeast1")
+        logging.info("GenAI client initialized successfully.")
+        return client
+    except Exception as e:
+        logging.error(f"Failed to initialize GenAI client: {str(e)}")
+        raise
+
+
+register_client("genai", _create_genai_client)
+register_client("llm", lambda: init_chat_model(LLM_MODEL, model_provider="google_vertexai"))
+
+
+def get_genai_client():
+    """
+    Return the process-wide GenAI client used for embedding generation, creating it on first use.
+    """
+    return get_client("genai")
+
+
+def get_llm():
+    """
+    Return the process-wide Gemini chat model used for adjudication, creating it on first use.
+    """
+    return get_client("llm")
+
+
+def set_genai_client(client):
+    """
+    Replace the GenAI client, e.g. with a local stand-in for benchmarks.
+    The client must expose models.embed_content(model, contents, config).
+    """
+    get_client_registry().set("genai", client)
+
+
+def set_llm(model):
+    """
+    Replace the chat model, e.g. with a scripted stand-in for benchmarks.
+    The model must expose invoke(prompt) and ainvoke(prompt) returning an object with `content`.
+    """
+    get_client_registry().set("llm", model)
+
+# Examples of correct and incorrect matches shared by the single-product and batched prompts
+FEW_SHOT_EXAMPLES = """Here are examples of correct and incorrect matches to guide you:
+
+        #### Correct Matches:
+        | External_Product_Name                     | Internal_Product_Name                          |
+        |-------------------------------------------|-----------------------------------------------|
+        | DIET LIPTON GREEN TEA W/ CITRUS 20 OZ     | Lipton Diet Green Tea with Citrus (20oz)      |
+        | CH-CHERRY CHS CLAW DANISH 4.25 OZ         | Cloverhill Cherry Cheese Bearclaw Danish (4.25oz) |
+
+        Reason for Correct Matches:
+        - The product size matches exactly.
+        - The product name, flavor, brand, and product line are identical or highly similar.
+
+        #### Wrong Matches:
+        | External_Product_Name                     | Internal_Product_Name                          |
+        |-------------------------------------------|-----------------------------------------------|
+        | BodyArmor Strawberry Banana (16oz)        | BodyArmor Lyte Peach Mango (16oz)             |
+        | COOKIE PEANUT BUTTER 2OZ                  | Famous Amos Peanut Butter Cookie (2oz)        |
+
+        Reason for Wrong Matches:
+        - The product size matches, but the flavor or product line is different (e.g., Strawberry Banana vs Peach Mango).
+        - The product size or description does not match (e.g., different flavor, brand, or type)."""
 
 def format_possible_matches_table(possible_matches):
     """
@@ -49,23 +142,30 @@ def format_possible_matches_table(possible_matches):
     rows = ''.join([f"| {match['datapoint_id']} | {match['long_name']} |\n" for match in possible_matches])
     return header + separator + rows
 
-def process_semi_confident_matches(uploaded_product, possible_matches):
+def build_semi_confident_prompt(uploaded_product, possible_matches, sizes_verified=False):
     """
-    Process semi-confident matches using an LLM to determine the most probable match.
+    Build the LLM prompt comparing an uploaded product with its semi-confident matches.
     Args:
         uploaded_product (str): The uploaded product name.
         possible_matches (list): List of possible matches (dicts with 'datapoint_id' and 'long_name').
+        sizes_verified (bool): True if every possible match is already known to have the uploaded product's size,
+            in which case the size extraction instructions are left out.
 
     Returns:
-        dict: A confident match if found, or all possible matches if no confident match is determined.
+        str: The prompt to send to the LLM.
     """
     possible_matches_table = format_possible_matches_table(possible_matches)
+    if sizes_verified:
+        size_instructions = """The product sizes have already been verified to match; focus on the other details.
+        A confident match requires **all key details to match exactly**, including:"""
+    else:
+        size_instructions = """Extract the product size (e.g., '3 OZ', '1lb', '12g') from both the uploaded product and the possible matches.
+        A confident match requires **all key details to match exactly**, including:
+        - Product size (e.g., '16oz', '1lb')."""
     # Prepare the input for the LLM
     prompt = f"""
         You are an expert in product matching. Your task is to compare the uploaded product with possible matches.
-        Extract the product size (e.g., '3 OZ', '1lb', '12g') from both the uploaded product and the possible matches.
-        A confident match requires **all key details to match exactly**, including:
-        - Product size (e.g., '16oz', '1lb').
+        {size_instructions}
         - Flavor (e.g., 'Strawberry Banana', 'Peach Mango').
         - Brand (e.g., 'BodyArmor', 'Lipton').
         - Product line or type (e.g., 'Lyte', 'Diet').
@@ -80,27 +180,7 @@ def process_semi_confident_matches(uploaded_product, possible_matches):
         |--------------|----------------------------------------|
         {possible_matches_table}
 
-        Here are examples of correct and incorrect matches to guide you:
-
-        #### Correct Matches:
-        | External_Product_Name                     | Internal_Product_Name                          |
-        |-------------------------------------------|-----------------------------------------------|
-        | DIET LIPTON GREEN TEA W/ CITRUS 20 OZ     | Lipton Diet Green Tea with Citrus (20oz)      |
-        | CH-CHERRY CHS CLAW DANISH 4.25 OZ         | Cloverhill Cherry Cheese Bearclaw Danish (4.25oz) |
-
-        Reason for Correct Matches:
-        - The product size matches exactly.
-        - The product name, flavor, brand, and product line are identical or highly similar.
-
-        #### Wrong Matches:
-        | External_Product_Name                     | Internal_Product_Name                          |
-        |-------------------------------------------|-----------------------------------------------|
-        | BodyArmor Strawberry Banana (16oz)        | BodyArmor Lyte Peach Mango (16oz)             |
-        | COOKIE PEANUT BUTTER 2OZ                  | Famous Amos Peanut Butter Cookie (2oz)        |
-
-        Reason for Wrong Matches:
-        - The product size matches, but the flavor or product line is different (e.g., Strawberry Banana vs Peach Mango).
-        - The product size or description does not match (e.g., different flavor, brand, or type).
+        {FEW_SHOT_EXAMPLES}
 
         Now, compare the uploaded product with the possible matches and return the result as a JSON object with the following format:
         {{
@@ -110,209 +190,791 @@ def process_semi_confident_matches(uploaded_product, possible_matches):
             "reason": <string>
         }}
         """
+    return prompt
 
-    response = llm.invoke(prompt)
-    logging.info(f"LLM response: {response.content}")
-    # Preprocess the response to remove code block markers
-    raw = response.content.strip()
+def build_batched_semi_confident_prompt(items):
+    """
+    Build one LLM prompt comparing several uploaded products with their own semi-confident matches.
+    The instructions and examples are sent once for the whole batch.
+    Args:
+        items (list): List of (uploaded_product, possible_matches, sizes_verified) tuples.
+
+    Returns:
+        str: The prompt to send to the LLM.
+    """
+    products = "\n".join(
+        f"""        ### Product {index}
+        Uploaded Product: {uploaded_product}
+        Sizes verified: {"yes" if sizes_verified else "no"}
+        Possible Matches:
+        {format_possible_matches_table(possible_matches)}"""
+        for index, (uploaded_product, possible_matches, sizes_verified) in enumerate(items)
+    )
+    prompt = f"""
+        You are an expert in product matching. Your task is to compare each uploaded product below with its own possible matches.
+        Extract the product size (e.g., '3 OZ', '1lb', '12g') from both the uploaded product and the possible matches, unless the product is marked "Sizes verified: yes": its sizes have already been verified to match, so focus on the other details.
+        A confident match requires **all key details to match exactly**, including:
+        - Product size (e.g., '16oz', '1lb').
+        - Flavor (e.g., 'Strawberry Banana', 'Peach Mango').
+        - Brand (e.g., 'BodyArmor', 'Lipton').
+        - Product line or type (e.g., 'Lyte', 'Diet').
+
+        Normalize abbreviations (e.g., 'choc.' to 'chocolate', 'xtra' to 'extra') and handle reordering of words (e.g., '11 oz cans' vs 'Can (11oz)'). Compare each uploaded product with its possible matches and return the most semantically similar match.
+
+        If there is any difference in these details, it should not be considered a confident match, even if the product size matches.
+        Each product can only be matched with one of its own possible matches; judge every product independently.
+
+        {FEW_SHOT_EXAMPLES}
+
+        Products to compare:
+
+{products}
+
+        Now, compare every uploaded product with its possible matches and return the results as a JSON array with exactly one object per product, in the same order, with the following format:
+        [
+            {{
+                "product_index": <integer>,  # The number of the product above
+                "is_confident": <true/false>,
+                "matched_datapoint_id": <string>,  # The datapoint_id of the matched product
+                "long_name": <string>,  # The long name of the matched product
+                "reason": <string>
+            }}
+        ]
+        """
+    return prompt
+
+def strip_code_fence(content):
+    """
+    Remove the Markdown code block markers the LLM sometimes wraps its JSON answer in.
+    """
+    raw = content.strip()
     if raw.startswith("```") and raw.endswith("```"):
         raw = raw.split("\n", 1)[1].rsplit("\n", 1)[0]
+    return raw
+
+def resolve_comparison(comp, uploaded_product, possible_matches):
+    """
+    Turn a validated LLM verdict into the confident match details.
+    Args:
+        comp (ProductComparison): The LLM verdict for one uploaded product.
+        uploaded_product (str): The uploaded product name.
+        possible_matches (list): The possible matches that were sent to the LLM.
+
+    Returns:
+        dict: The confident match details, or None if the LLM did not confirm one of the possible matches.
+    """
+    if comp.is_confident and comp.matched_datapoint_id:
+        logging.info(f"Confident match identified by LLM for uploaded product: {uploaded_product}")
+        candidate = next(
+            (m for m in possible_matches if m["datapoint_id"] == comp.matched_datapoint_id),
+            None
+        )
+        if candidate:
+            # Return the matched product details
+            logging.info(f"Final confident match details: datapoint_id={candidate['datapoint_id']}, long_name={candidate['long_name']}")
+            return {
+                "datapoint_id": candidate["datapoint_id"],
+                "long_name": candidate["long_name"],
+                "reason": comp.reason
+            }
+    return None
+
+def parse_semi_confident_response(content, uploaded_product, possible_matches):
+    """
+    Parse the LLM answer for one uploaded product.
+    Args:
+        content (str): The raw LLM response content.
+        uploaded_product (str): The uploaded product name.
+        possible_matches (list): The possible matches that were sent to the LLM.
+
+    Returns:
+        dict: The confident match details, or None if the LLM did not confirm a match.
+    """
+    logging.info(f"LLM response: {content}")
+    # Preprocess the response to remove code block markers
+    raw = strip_code_fence(content)
     logging.info(f"Raw LLM response: {raw}")    
     try:
         data = json.loads(raw)
         # Normalize keys to snake_case for Pydantic
         comp = ProductComparison.model_validate(data)
-        if comp.is_confident and comp.matched_datapoint_id:
-            logging.info(f"Confident match identified by LLM for uploaded product: {uploaded_product}")
-            candidate = next(
-                (m for m in possible_matches if m["datapoint_id"] == comp.matched_datapoint_id),
-                None
-            )
-            if candidate:
-                # Return the matched product details
-                logging.info(f"Final confident match details: datapoint_id={candidate['datapoint_id']}, long_name={candidate['long_name']}")
-                return {
-                    "datapoint_id": candidate["datapoint_id"],
-                    "long_name": candidate["long_name"],
-                    "reason": comp.reason
-                }
+        return resolve_comparison(comp, uploaded_product, possible_matches)
     except Exception as e:
         logging.error(f"Error parsing LLM response: {e}")
     return None
 
-    
-def generate_embeddings_in_batches(texts, batch_size=250, max_calls_per_minute=5, retries=3, retry_delay=10):
+def parse_batched_semi_confident_response(content, items):
     """
-    Generate embeddings for a list of texts in batches, respecting API limits.
+    Parse the LLM answer for a batch of uploaded products. Every array element is validated on its own,
+    so one malformed element does not discard the verdicts of the other products.
     Args:
-        texts (list): List of texts to generate embeddings for.
-        batch_size (int): Maximum number of texts per batch.
-        max_calls_per_minute (int): Maximum number of API calls allowed per minute.
-        retries (int): Number of retries for transient errors.
-        retry_delay (int): Delay (in seconds) between retries.
+        content (str): The raw LLM response content.
+        items (list): The (uploaded_product, possible_matches, sizes_verified) tuples that were sent to the LLM.
+
+    Returns:
+        dict: product index -> confident match details or None, for every product with a valid verdict.
+
+    Raises:
+        ValueError: If the response is not a JSON array.
+    """
+    logging.info(f"LLM batch response: {content}")
+    data = json.loads(strip_code_fence(content))
+    if not isinstance(data, list):
+        raise ValueError(f"Expected a JSON array, got {type(data).__name__}")
+    results = {}
+    for element in data:
+        try:
+            comp = BatchedProductComparison.model_validate(element)
+            if not 0 <= comp.product_index < len(items) or comp.product_index in results:
+                raise ValueError(f"Unexpected product_index {comp.product_index}")
+            uploaded_product, possible_matches, _ = items[comp.product_index]
+            results[comp.product_index] = resolve_comparison(comp, uploaded_product, possible_matches)
+        except Exception as e:
+            logging.error(f"Error parsing LLM batch response element {element}: {e}")
+    return results
+
+def process_semi_confident_matches(uploaded_product, possible_matches, sizes_verified=False):
+    """
+    Process semi-confident matches using an LLM to determine the most probable match.
+    Args:
+        uploaded_product (str): The uploaded product name.
+        possible_matches (list): List of possible matches (dicts with 'datapoint_id' and 'long_name').
+        sizes_verified (bool): True if the sizes of all possible matches are known to match.
 
     Returns:
-        list: A list of embeddings corresponding to the input texts.
+        dict: A confident match if found, or all possible matches if no confident match is determined.
     """
-    embeddings = []
-    failed_batches = []
-    failed_batches_file = "failed_batches.json"
+    prompt = build_semi_confident_prompt(uploaded_product, possible_matches, sizes_verified)
+    rate_limiter = get_rate_limiter("llm")
+    rate_limiter.acquire()
+    start = time.perf_counter()
+    try:
+        response = get_llm().invoke(prompt)
+    except Exception as e:
+        if is_quota_error(e):
+            rate_limiter.penalize()
+        record_upstream_call("llm", "quota_error" if is_quota_error(e) else "error", time.perf_counter() - start)
+        raise
+    record_upstream_call("llm", "success", time.perf_counter() - start)
+    record_llm_tokens(response)
+    rate_limiter.reward()
+    return parse_semi_confident_response(response.content, uploaded_product, possible_matches)
+
+async def aprocess_semi_confident_matches(uploaded_product, possible_matches, sizes_verified, semaphore, timeout):
+    """
+    Async variant of process_semi_confident_matches used by the concurrent adjudication stage.
+    Args:
+        uploaded_product (str): The uploaded product name.
+        possible_matches (list): List of possible matches (dicts with 'datapoint_id' and 'long_name').
+        sizes_verified (bool): True if the sizes of all possible matches are known to match.
+        semaphore (asyncio.Semaphore): Limits the number of in-flight LLM calls.
+        timeout (float): Maximum number of seconds to wait for the LLM response.
 
-    # Calculate the delay needed between API calls to respect the rate limit
-    delay_between_calls = 60 / max_calls_per_minute
+    Returns:
+        dict: The confident match details, None if the LLM found no confident match,
+        or {"error": ...} if the call timed out or failed.
+    """
+    prompt = build_semi_confident_prompt(uploaded_product, possible_matches, sizes_verified)
+    rate_limiter = get_rate_limiter("llm")
+    async with semaphore:
+        wait = rate_limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(get_llm().ainvoke(prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            record_upstream_call("llm", "timeout", time.perf_counter() - start)
+            logging.warning(f"LLM call timed out after {timeout} seconds for uploaded product: {uploaded_product}")
+            return {"error": f"LLM call timed out after {timeout} seconds"}
+        except Exception as e:
+            if is_quota_error(e):
+                rate_limiter.penalize()
+            record_upstream_call("llm", "quota_error" if is_quota_error(e) else "error", time.perf_counter() - start)
+            logging.error(f"LLM call failed for uploaded product {uploaded_product}: {str(e)}")
+            return {"error": str(e)}
+    record_upstream_call("llm", "success", time.perf_counter() - start)
+    record_llm_tokens(response)
+    rate_limiter.reward()
+    return parse_semi_confident_response(response.content, uploaded_product, possible_matches)
+
+async def aprocess_semi_confident_batch(items, semaphore, timeout):
+    """
+    Adjudicate several products with a single LLM call. Products without a valid verdict in the answer
+    (or all of them, if the call fails or the answer is not a JSON array) fall back to single-product calls.
+    Args:
+        items (list): List of (uploaded_product, possible_matches, sizes_verified) tuples.
+        semaphore (asyncio.Semaphore): Limits the number of in-flight LLM calls.
+        timeout (float): Maximum number of seconds to wait for the LLM response.
 
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        for attempt in range(retries):
+    Returns:
+        list: One result of aprocess_semi_confident_matches per item, in the same order.
+    """
+    if len(items) == 1:
+        return [await aprocess_semi_confident_matches(*items[0], semaphore, timeout)]
+    prompt = build_batched_semi_confident_prompt(items)
+    rate_limiter = get_rate_limiter("llm")
+    results = {}
+    async with semaphore:
+        wait = rate_limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(get_llm().ainvoke(prompt), timeout=timeout)
+            record_upstream_call("llm", "success", time.perf_counter() - start)
+            record_llm_tokens(response)
+            rate_limiter.reward()
             try:
-                logging.info(f"Generating embeddings for batch {i // batch_size + 1} with {len(batch)} texts.")
-                response = genai_client.models.embed_content(
-                    model="text-embedding-005",
-                    contents=batch,
-                    config=EmbedContentConfig(
-                        task_type="SEMANTIC_SIMILARITY",
-                        output_dimensionality=768
-                    )
-                )
-                embeddings.extend([embedding.values for embedding in response.embeddings])
-                break  # Exit retry loop on success
+                results = parse_batched_semi_confident_response(response.content, items)
             except Exception as e:
-                if "RESOURCE_EXHAUSTED" in str(e):
-                    logging.warning(f"Quota exceeded. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{retries})")
+                logging.error(f"Error parsing LLM batch response: {e}")
+        except asyncio.TimeoutError:
+            record_upstream_call("llm", "timeout", time.perf_counter() - start)
+            logging.warning(f"LLM batch call timed out after {timeout} seconds for {len(items)} products.")
+        except Exception as e:
+            if is_quota_error(e):
+                rate_limiter.penalize()
+            record_upstream_call("llm", "quota_error" if is_quota_error(e) else "error", time.perf_counter() - start)
+            logging.error(f"LLM batch call failed for {len(items)} products: {str(e)}")
+
+    # Released the semaphore first: the single-product calls acquire it themselves
+    fallback = [index for index in range(len(items)) if index not in results]
+    if fallback:
+        record_llm_batch_fallback(len(fallback))
+        logging.warning(f"Falling back to single-product LLM calls for {len(fallback)} of {len(items)} products.")
+        single_results = await asyncio.gather(*[
+            aprocess_semi_confident_matches(*items[index], semaphore, timeout) for index in fallback
+        ])
+        results.update(zip(fallback, single_results))
+    return [results[index] for index in range(len(items))]
+
+def adjudicate_semi_confident_matches(items, max_concurrency=None, timeout=None, batch_size=None):
+    """
+    Run the LLM adjudication for several products concurrently.
+    Args:
+        items (list): List of (uploaded_product, possible_matches, sizes_verified) tuples.
+        max_concurrency (int): Maximum number of concurrent LLM calls.
+        timeout (float): Per-call timeout in seconds.
+        batch_size (int): Number of products per LLM call (1 sends one call per product).
+
+    Returns:
+        list: One result of aprocess_semi_confident_matches per item, in the same order.
+    """
+    if not items:
+        return []
+    max_concurrency = max_concurrency or LLM_MAX_CONCURRENCY
+    timeout = timeout or LLM_TIMEOUT_SECONDS
+    batch_size = max(1, batch_size or LLM_BATCH_SIZE)
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        batches = await asyncio.gather(*[
+            aprocess_semi_confident_batch(items[i:i + batch_size], semaphore, timeout)
+            for i in range(0, len(items), batch_size)
+        ])
+        return [result for batch in batches for result in batch]
+
+    logging.info(
+        f"Adjudicating {len(items)} semi-confident products in LLM calls of up to {batch_size} products "
+        f"with up to {max_concurrency} concurrent calls."
+    )
+    return asyncio.run(run_all())
+
+    
+def embed_texts(items, retries=3, retry_delay=10):
+    """
+    Embed texts with one API call, paced by the shared "embeddings" rate limiter, and store them in the embedding cache.
+    Args:
+        items (list): (cache key, text) pairs.
+        retries (int): Number of retries for transient errors.
+        retry_delay (int): Delay (in seconds) between retries.
+
+    Returns:
+        dict: Cache key -> embedding; empty if the call failed after every retry.
+    """
+    rate_limiter = get_rate_limiter("embeddings")
+    genai_client = get_genai_client()
+    for attempt in range(retries):
+        if attempt:
+            record_retry("embeddings")
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            logging.info(f"Generating embeddings for {len(items)} texts.")
+            response = genai_client.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=[text for _, text in items],
+                config=EmbedContentConfig(
+                    task_type=EMBEDDING_TASK_TYPE,
+                    output_dimensionality=EMBEDDING_DIMENSIONALITY
+                )
+            )
+            embedded = {key: embedding.values for (key, _), embedding in zip(items, response.embeddings)}
+            record_upstream_call("embeddings", "success", time.perf_counter() - start)
+            get_embedding_cache().put_many(embedded)
+            rate_limiter.reward()
+            return embedded
+        except Exception as e:
+            record_upstream_call("embeddings", "quota_error" if is_quota_error(e) else "error", time.perf_counter() - start)
+            if is_quota_error(e):
+                # The limiter slows down and delays the retry
+                logging.warning(f"Quota exceeded. Retrying... (Attempt {attempt + 1}/{retries})")
+                rate_limiter.penalize()
+            else:
+                logging.error(f"Error generating embeddings for {len(items)} texts: {str(e)}")
+                if attempt < retries - 1:
                     time.sleep(retry_delay)
                 else:
-                    logging.error(f"Error generating embeddings for batch {i // batch_size + 1}: {str(e)}")
-                    if attempt < retries - 1:
-                        time.sleep(retry_delay)
-                    else:
-                        logging.error(f"Failed to generate embeddings for batch {i // batch_size + 1} after {retries} retries.")
-                        failed_batches.append(batch)
+                    logging.error(f"Failed to generate embeddings for {len(items)} texts after {retries} retries.")
+    return {}
+
 
-        # Respect the API rate limit
-        if i + batch_size < len(texts):
-            logging.info(f"Throttling: Waiting {delay_between_calls} seconds before the next batch...")
-            time.sleep(delay_between_calls)
+def _embed_micro_batch(settings, items):
+    # One call for the cache misses of every request in the micro-batch; a text missed by several requests is sent once
+    retries, retry_delay = settings
+    embedded = embed_texts(list(dict(items).items()), retries, retry_delay)
+    return [embedded.get(key) for key, _ in items]
+
+
+def generate_embeddings_in_batches(texts, batch_size=250, retries=3, retry_delay=10):
+    """
+    Generate embeddings for a list of texts in batches, respecting API limits.
+    Embeddings already in the embedding cache are reused; only cache misses are sent to the API.
+    With MICRO_BATCHING, the misses join those of concurrent requests in shared calls of up to
+    MICRO_BATCH_MAX_SIZE texts; otherwise they are sent in calls of `batch_size` texts.
+    Args:
+        texts (list): List of texts to generate embeddings for.
+        batch_size (int): Maximum number of texts per batch.
+        retries (int): Number of retries for transient errors.
+        retry_delay (int): Delay (in seconds) between retries.
 
-    return embeddings
+    Returns:
+        list: Embeddings aligned with the input texts, with None for texts whose batch failed.
+    """
+    cache = get_embedding_cache()
+    keys = [
+        make_cache_key(text, EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, EMBEDDING_DIMENSIONALITY)
+        for text in texts
+    ]
+    cached = cache.get_many(keys)
+
+    # Embed each distinct missing text once
+    missing = {}
+    for text, key in zip(texts, keys):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    missing_items = list(missing.items())
+    logging.info(f"Embedding cache: {len(texts) - len(missing_items)} of {len(texts)} texts served from cache.")
+    record_embedding_cache(len(texts) - len(missing_items), len(missing_items))
+
+    batcher = get_micro_batcher("embeddings", _embed_micro_batch)
+    if batcher is not None:
+        embeddings = batcher.map(missing_items, key=(retries, retry_delay))
+        cached.update((key, embedding) for (key, _), embedding in zip(missing_items, embeddings) if embedding is not None)
+    else:
+        for i in range(0, len(missing_items), batch_size):
+            cached.update(embed_texts(missing_items[i:i + batch_size], retries, retry_delay))
+
+    return [cached.get(key) for key in keys]
+
+class MatchBatch:
+    """
+    A batch of uploaded products and the state the pipeline stages build up for it.
+    """
 
-def match_products_with_vector_search_in_batches(
-    external_products, batch_size=250, max_calls_per_minute=5
-):
+    def __init__(self, number, products):
+        self.number = number
+        # Products still to be matched by the next stage, and their positions in the batch
+        self.products = list(products)
+        self.rows = list(range(len(self.products)))
+        self.embeddings = []
+        # (status, entry) of the products whose result is final before the LLM stage, in decision order,
+        # with a ("semi", row) placeholder for every product waiting for the LLM
+        self.finals = []
+        self.semi_confident_items = []
+        # Cosine similarity of the candidates of every semi-confident product, for the verdict log
+        self.similarities = {}
+        self.llm_results = []
+        # Positions of the rows whose result has already been reported to on_result; rows rather than
+        # product names, so repeated names each get their own result
+        self.reported = set()
+        # Final results that can be reused by later uploads
+        self.to_cache = {}
+        # Cluster id of every clustered product, and the (row, product) duplicates taking their
+        # representative's result
+        self.cluster_ids = {}
+        self.members = []
+        self.error = None
+
+def decision_settings_version(reranker):
     """
-    Match external products to internal products using Vertex AI Matching Engine in batches.
+    Hash of the settings that change the decision taken for a product: the retrieval and acceptance
+    switches, the reranker thresholds, the LLM model and the prompts. Part of the result cache version,
+    so results computed under other settings are not reused.
     Args:
-        external_products (list): List of external product names.
+        reranker (LocalReranker): The reranker of the request, or None when it is disabled.
+
+    Returns:
+        str: A short hex digest.
+    """
+    settings = {
+        "lexical": [lexical_index.LEXICAL_FAST_PATH, lexical_index.LEXICAL_MATCH_THRESHOLD],
+        "hybrid": [hybrid_retrieval.HYBRID_RETRIEVAL, hybrid_retrieval.HYBRID_LEXICAL_K, hybrid_retrieval.RRF_K],
+        "clustering": MATCH_CLUSTERING,
+        "size": [SIZE_AUTO_ACCEPT, SIZE_TOLERANCE],
+        "reranker": [reranker.thresholds, SCORE_WEIGHTS] if reranker is not None else None,
+        "llm": [LLM_MODEL, LLM_BATCH_SIZE],
+        "prompts": [
+            build_semi_confident_prompt("", [], sizes_verified=False),
+            build_semi_confident_prompt("", [], sizes_verified=True),
+            build_batched_semi_confident_prompt([]),
+        ],
+    }
+    payload = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def build_result_entry(product, status, payload):
+    """
+    Build the response entry of a product from its final status and payload
+    (the matchedWith match, the list of possibleMatches, or None).
+    """
+    if status == "matched":
+        return {"uploaded": product, "matchedWith": payload}
+    if status == "uncertain":
+        return {"uploaded": product, "possibleMatches": payload}
+    return {"uploaded": product}
+
+def match_products_with_vector_search_in_batches(external_products, batch_size=250, on_result=None, on_progress=None):
+    """
+    Match external products to internal products using the configured vector search backend in batches.
+    Args:
+        external_products (iterable): External product names. A generator (e.g. iter_uploaded_products) is
+            consumed batch by batch while the earlier batches are being matched.
         batch_size (int): Number of products to process in each batch.
-        max_calls_per_minute (int): Maximum number of API calls allowed per minute.
+        on_result (callable): Optional callback receiving each product's result as soon as it is final,
+            as a dict with a "status" of "matched", "uncertain" or "none".
+        on_progress (callable): Optional callback receiving (stage, done, total) progress updates.
 
     Returns:
         dict: A dictionary with matched, uncertain, and no matches.
     """
-    # Set variables for the current deployed index
-    API_ENDPOINT = "8241972.northamerica-northeast1-123728674703.vdb.vertexai.goog"
-    INDEX_ENDPOINT = "projects/123728674703/locations/northamerica-northeast1/indexEndpoints/4730925855436439552"
-    DEPLOYED_INDEX_ID = "product_matching_deployment"
-
-    # Configure the Vector Search client
-    client_options = {"api_endpoint": API_ENDPOINT}
-    vector_search_client = aiplatform_v1.MatchServiceClient(client_options=client_options)
+    # The whole request runs against one catalog snapshot, even if a reload swaps in a new one meanwhile
+    catalog = get_catalog()
+    catalog_store = catalog.store
+    # Neighbor-search backend (Vertex AI endpoint or in-process index)
+    neighbor_search = catalog.neighbor_search
+    lexical = catalog.lexical_index
+    bm25_index = catalog.bm25_index
+    size_table = catalog.size_table
+    reranker = get_reranker()
+    verdict_log = get_verdict_log()
+
+    # Final results are reused across requests while the catalog and the index are unchanged
+    result_cache = get_result_cache()
+    catalog_version = catalog_store.version
+    cache_version = (
+        f"{RESULT_CACHE_SCHEMA}|{catalog_version}|{getattr(neighbor_search, 'version', None)}"
+        f"|{decision_settings_version(reranker)}"
+    )
+    if result_cache is not None and catalog_version is None:
+        logging.warning("Catalog version is unknown; the result cache is bypassed.")
+        result_cache = None
 
     matched_products = []
     uncertain_matches = []
     no_matches = []
-
-    # Calculate the delay needed between API calls to respect the rate limit
-    delay_between_calls = 60 / max_calls_per_minute
-
-    try:
-        # Process products in batches
-        for i in range(0, len(external_products), batch_size):
-            batch = external_products[i:i + batch_size]
-            logging.info(f"Processing batch {i // batch_size + 1} with {len(batch)} products.")
-
-            try:
-                # Generate embeddings for the batch
-                logging.info(f"Generating embeddings for batch {i // batch_size + 1}.")
-                batch_embeddings = generate_embeddings_in_batches(
-                    batch, batch_size=batch_size, max_calls_per_minute=max_calls_per_minute
-                )
-
-                # Skip querying if no embeddings were generated
-                if not batch_embeddings:
-                    continue
-
-                # Build the FindNeighborsRequest
-                queries = [
-                    aiplatform_v1.FindNeighborsRequest.Query(
-                        datapoint=aiplatform_v1.IndexDatapoint(feature_vector=embedding),
-                        neighbor_count=10  # Number of nearest neighbors to retrieve
-                    )
-                    for embedding in batch_embeddings
+    result_lists = {"matched": matched_products, "uncertain": uncertain_matches, "none": no_matches}
+    progress = {"lexical": 0, "embedding": 0, "vector_search": 0, "llm": 0, "llm_total": 0, "results": 0}
+    # Unknown while a streamed upload is still being read
+    total = len(external_products) if hasattr(external_products, "__len__") else None
+    # The stages run in their own threads and report results and progress concurrently
+    callback_lock = threading.Lock()
+    # Duplicate clustering spans the whole upload; cluster id -> (status, entry) of its representative
+    clusterer = ProductClusterer() if MATCH_CLUSTERING else None
+    cluster_results = {}
+
+    def notify(work, row, status, entry):
+        work.reported.add(row)
+        cluster_id = work.cluster_ids.get(entry["uploaded"])
+        if cluster_id is not None:
+            entry["clusterId"] = cluster_id
+            cluster_results.setdefault(cluster_id, (status, entry))
+        record_result(status)
+        with callback_lock:
+            progress["results"] += 1
+            if on_result:
+                on_result(dict(entry, status=status))
+            if on_progress:
+                on_progress("results", progress["results"], total)
+
+    def report(stage, done, stage_total):
+        if on_progress:
+            with callback_lock:
+                on_progress(stage, done, stage_total)
+
+    def finalize(work, row, status, entry, cacheable=True):
+        # A result that is final before the LLM stage: reported right away, added to the lists on assembly
+        work.finals.append((status, entry))
+        if cacheable:
+            work.to_cache[entry["uploaded"]] = (status, entry.get("matchedWith") or entry.get("possibleMatches"))
+        notify(work, row, status, entry)
+
+    def guarded(stage):
+        # A failing batch is marked and skipped by the later stages; the other batches carry on
+        def run(work):
+            if work.error is None and work.products:
+                try:
+                    stage(work)
+                except Exception as e:
+                    logging.error(f"Error processing batch {work.number}: {str(e)}")
+                    work.error = e
+            return work
+        return run
+
+    def prepare(work):
+        logging.info(f"Processing batch {work.number} with {len(work.products)} products.")
+        # Serve products resolved by an earlier upload against the same catalog and index
+        if result_cache is not None:
+            cached = result_cache.get_many(work.products, cache_version)
+            remaining = []
+            for row, product in zip(work.rows, work.products):
+                if product in cached:
+                    status, payload = cached[product]
+                    finalize(work, row, status, build_result_entry(product, status, payload), cacheable=False)
+                else:
+                    remaining.append((row, product))
+            record_classification("cached", len(work.products) - len(remaining))
+            work.rows = [row for row, _ in remaining]
+            work.products = [product for _, product in remaining]
+            if not work.products:
+                return
+
+        # Resolve exact and near-exact catalog names without calling any upstream
+        if lexical is not None:
+            remaining = []
+            with timed_stage("lexical", len(work.products)):
+                hits = [lexical.lookup(product) for product in work.products]
+            for row, product, hit in zip(work.rows, work.products, hits):
+                if hit:
+                    entry = {
+                        "uploaded": product,
+                        "matchedWith": {"datapoint_id": hit["datapoint_id"], "long_name": hit["long_name"]}
+                    }
+                    finalize(work, row, "matched", entry, cacheable=False)
+                    logging.info(f"Lexical ({hit['match_type']}) match found for product: {product}")
+                else:
+                    remaining.append((row, product))
+            record_classification("lexical", len(work.products) - len(remaining))
+            progress["lexical"] += len(work.products) - len(remaining)
+            report("lexical", progress["lexical"], total)
+            work.rows = [row for row, _ in remaining]
+            work.products = [product for _, product in remaining]
+
+        # Only the first row of each group of duplicates goes through the upstream stages
+        if clusterer is not None:
+            remaining = []
+            for row, product in zip(work.rows, work.products):
+                cluster_id, representative = clusterer.assign(product)
+                if cluster_id is not None:
+                    work.cluster_ids[product] = cluster_id
+                if representative:
+                    remaining.append((row, product))
+                else:
+                    work.members.append((row, product))
+            record_classification("clustered", len(work.members))
+            work.rows = [row for row, _ in remaining]
+            work.products = [product for _, product in remaining]
+
+    def embed(work):
+        # Generate embeddings for the batch
+        logging.info(f"Generating embeddings for batch {work.number}.")
+        with timed_stage("embedding", len(work.products)):
+            embeddings = generate_embeddings_in_batches(work.products, batch_size=batch_size)
+        progress["embedding"] += len(work.products)
+        report("embedding", progress["embedding"], total)
+
+        # Products whose embedding could not be generated cannot be matched
+        for row, product, embedding in zip(work.rows, work.products, embeddings):
+            if embedding is None:
+                finalize(work, row, "none", {"uploaded": product, "error": "Failed to generate embedding"}, cacheable=False)
+        work.rows = [row for row, embedding in zip(work.rows, embeddings) if embedding is not None]
+        work.products = [product for product, embedding in zip(work.products, embeddings) if embedding is not None]
+        work.embeddings = [embedding for embedding in embeddings if embedding is not None]
+
+    def search(work):
+        # Query the nearest neighbors for every embedding in the batch
+        logging.info(f"Querying nearest neighbors for batch {work.number}.")
+        with timed_stage("vector_search", len(work.products)):
+            batch_neighbors = neighbor_search.find_neighbors(work.embeddings, neighbor_count=10)
+        # Rerank with the BM25 ranking of the catalog names, which finds abbreviated names the embeddings miss
+        if bm25_index is not None:
+            with timed_stage("bm25", len(work.products)):
+                rankings = [bm25_index.search(product) for product in work.products]
+                batch_neighbors = fuse_neighbors(neighbor_search, work.embeddings, batch_neighbors, rankings)
+        progress["vector_search"] += len(work.products)
+        report("vector_search", progress["vector_search"], total)
+
+        # Load the metadata of every neighbor above the lowest threshold in one go
+        with timed_stage("catalog", len(work.products)):
+            catalog_store.prefetch(
+                n.datapoint_id for neighbors in batch_neighbors for n in neighbors if n.distance >= 0.7
+            )
+        # Classify every product by its best neighbors; everything but the
+        # semi-confident products is final and reported right away
+        for row, product, neighbors in zip(work.rows, work.products, batch_neighbors):
+            if neighbors:
+                confident_matches = [
+                    {
+                        "datapoint_id": n.datapoint_id,
+                        "long_name": catalog_store.get_long_name(n.datapoint_id)
+                    }
+                    for n in neighbors if n.distance > 0.95
                 ]
+                semi_confident_matches = [
+                    {
+                        "datapoint_id": n.datapoint_id,
+                        "long_name": catalog_store.get_long_name(n.datapoint_id)
+                    }
+                    for n in neighbors if 0.7 <= n.distance <= 0.95
+                ][:5]
+
+                # Drop the semi-confident candidates whose package size contradicts the upload
+                sizes_verified = False
+                candidate_count = len(semi_confident_matches)
+                if size_table is not None and semi_confident_matches:
+                    semi_confident_matches, sizes_verified = size_table.filter_candidates(
+                        product, semi_confident_matches
+                    )
+                    if len(semi_confident_matches) < candidate_count:
+                        logging.info(f"Dropped {candidate_count - len(semi_confident_matches)} size-incompatible candidates for product: {product}")
+
+                if confident_matches:
+                    logging.info(f"Confident match found for product: {product}")
+                    record_classification("confident")
+                    finalize(work, row, "matched", {"uploaded": product, "matchedWith": confident_matches[0]})
+                elif (SIZE_AUTO_ACCEPT and sizes_verified and len(semi_confident_matches) == 1
+                      and candidate_count > 1):
+                    # The size ruled out every competing candidate
+                    logging.info(f"Only size-compatible candidate accepted for product: {product}")
+                    record_classification("size_accepted")
+                    finalize(work, row, "matched", {"uploaded": product, "matchedWith": semi_confident_matches[0]})
+                elif semi_confident_matches:
+                    # Decide the clear-cut cases locally; only the ambiguous ones go to the LLM
+                    similarities = {n.datapoint_id: n.distance for n in neighbors}
+                    decision, datapoint_id = "escalate", None
+                    if reranker is not None:
+                        decision, datapoint_id = reranker.decide(product, [
+                            dict(match, cosine=similarities[match["datapoint_id"]]) for match in semi_confident_matches
+                        ])
+                    if decision == "accept":
+                        logging.info(f"Reranker accepted candidate {datapoint_id} for product: {product}")
+                        record_classification("reranker_accepted")
+                        match = next(m for m in semi_confident_matches if m["datapoint_id"] == datapoint_id)
+                        finalize(work, row, "matched", {"uploaded": product, "matchedWith": match})
+                        continue
+                    if decision == "reject":
+                        logging.info(f"Reranker rejected every candidate for product: {product}")
+                        record_classification("reranker_rejected")
+                        finalize(work, row, "uncertain", {"uploaded": product, "possibleMatches": semi_confident_matches})
+                        continue
+                    record_classification("semi_confident")
+                    work.semi_confident_items.append((product, semi_confident_matches, sizes_verified))
+                    work.similarities[product] = similarities
+                    # Keeps the product's place in the results until the LLM has decided
+                    work.finals.append(("semi", row))
+                else:
+                    logging.info(f"No matches found for product: {product}")
+                    record_classification("none")
+                    finalize(work, row, "none", {"uploaded": product})
+            else:
+                logging.info(f"No neighbors found for product: {product}")
+                record_classification("none")
+                finalize(work, row, "none", {"uploaded": product})
+
+    def adjudicate(work):
+        # Process the semi-confident matches with the LLM concurrently
+        if not work.semi_confident_items:
+            return
+        progress["llm_total"] += len(work.semi_confident_items)
+        with timed_stage("llm", len(work.semi_confident_items)):
+            work.llm_results = adjudicate_semi_confident_matches(work.semi_confident_items)
+        progress["llm"] += len(work.semi_confident_items)
+        report("llm", progress["llm"], progress["llm_total"])
+
+    def assemble(work):
+        # Add the batch to the results in upload order, once every stage is done with it
+        semi_confident_items = iter(work.semi_confident_items)
+        llm_results = iter(work.llm_results)
+        for status, entry in work.finals:
+            if status != "semi":
+                result_lists[status].append(entry)
+                continue
+            if work.error is not None:
+                # Not adjudicated; reported as failed below
+                continue
+            # The placeholder of a product adjudicated by the LLM holds its row
+            row = entry
+            product, possible_matches, _ = next(semi_confident_items)
+            result = next(llm_results)
+            if result and "error" not in result:
+                # Promote to confident using same structure
+                status = "matched"
+                entry = {
+                    "uploaded": product,
+                    "matchedWith": {"datapoint_id": result["datapoint_id"], "long_name": result["long_name"]}
+                }
+                logging.info(f"LLM confirmed match: {product}")
+            else:
+                status = "uncertain"
+                entry = {"uploaded": product, "possibleMatches": possible_matches}
+                logging.info(f"Uncertain matches found for product: {product}")
+            notify(work, row, status, entry)
+            result_lists[status].append(entry)
+            # A failed LLM call is not a verdict, so the product is adjudicated again next time
+            if not (result and "error" in result):
+                work.to_cache[product] = (status, entry.get("matchedWith") or entry.get("possibleMatches"))
+                if verdict_log is not None:
+                    similarities = work.similarities[product]
+                    verdict_log.write(
+                        product,
+                        [dict(match, cosine=similarities[match["datapoint_id"]]) for match in possible_matches],
+                        result["datapoint_id"] if result else None,
+                    )
 
-                request = aiplatform_v1.FindNeighborsRequest(
-                    index_endpoint=INDEX_ENDPOINT,
-                    deployed_index_id=DEPLOYED_INDEX_ID,
-                    queries=queries,
-                    return_full_datapoint=False,
-                )
-
-                # Query the Vertex AI Matching Engine
-                logging.info(f"Querying Vertex AI Matching Engine for batch {i // batch_size + 1}.")
-                response = vector_search_client.find_neighbors(request)
-                # Log the raw response for debugging
-                #logging.info(f"Raw response from Matching Engine: {response}")
-                # Inside the loop where neighbors are processed
-                for product, query_result in zip(batch, response.nearest_neighbors):
-                    if query_result.neighbors:
-                        neighbors = query_result.neighbors
-                        confident_matches = [
-                            {
-                                "datapoint_id": n.datapoint.datapoint_id,
-                                "long_name": get_long_name_by_datapoint_id(n.datapoint.datapoint_id)
-                            }
-                            for n in neighbors if n.distance > 0.95
-                        ]
-                        semi_confident_matches = [
-                            {
-                                "datapoint_id": n.datapoint.datapoint_id,
-                                "long_name": get_long_name_by_datapoint_id(n.datapoint.datapoint_id)
-                            }
-                            for n in neighbors if 0.7 <= n.distance <= 0.95
-                        ][:5]
-
-                        if confident_matches:
-                            matched_products.append({"uploaded": product, "matchedWith": confident_matches[0]})
-                            logging.info(f"Confident match found for product: {product}")
-                        elif semi_confident_matches:
-                            # Process semi-confident matches with the LLM
-                            logging.info(f"Processing semi-confident matches for product: {product}")
-                            result = process_semi_confident_matches(product, semi_confident_matches)
-                            if result:
-                                # Promote to confident using same structure
-                                matched_products.append({
-                                    "uploaded": product,
-                                    "matchedWith": {"datapoint_id": result["datapoint_id"], "long_name": result["long_name"]}
-                                })
-                                logging.info(f"LLM confirmed match: {product}")
-                            else:
-                                uncertain_matches.append({"uploaded": product, "possibleMatches": semi_confident_matches})
-                                logging.info(f"Uncertain matches found for product: {product}")
-                        else:
-                            no_matches.append({"uploaded": product})
-                            logging.info(f"No matches found for product: {product}")
-                    else:
-                        no_matches.append({"uploaded": product})
-                        logging.info(f"No neighbors found for product: {product}")
-            except Exception as e:
-                logging.error(f"Error processing batch {i // batch_size + 1}: {str(e)}")
-                for product in batch:
-                    no_matches.append({"uploaded": product, "error": str(e)})
-
-            # Respect the API rate limit
-            if i + batch_size < len(external_products):
-                logging.info(f"Throttling: Waiting {delay_between_calls} seconds before the next batch...")
-                time.sleep(delay_between_calls)
+        if work.error is not None:
+            for row, product in zip(work.rows, work.products):
+                if row not in work.reported:
+                    entry = {"uploaded": product, "error": str(work.error)}
+                    no_matches.append(entry)
+                    notify(work, row, "none", entry)
+        elif result_cache is not None:
+            result_cache.put_many(work.to_cache, cache_version)
+
+        # Duplicates take the result of their cluster representative, from this batch or an earlier one
+        for row, product in work.members:
+            if row in work.reported:
+                continue
+            status, decided = cluster_results[work.cluster_ids[product]]
+            entry = dict(decided, uploaded=product)
+            notify(work, row, status, entry)
+            result_lists[status].append(entry)
+
+    products = iter(external_products)
+    batches = (
+        MatchBatch(number, batch)
+        for number, batch in enumerate(iter(lambda: list(islice(products, batch_size)), []), start=1)
+    )
+    stages = [
+        ("prepare", guarded(prepare)),
+        ("embedding", guarded(embed)),
+        ("vector_search", guarded(search)),
+        ("llm", guarded(adjudicate)),
+    ]
+    try:
+        # Embedding batch N+1 overlaps with the neighbor search of batch N and the LLM adjudication of batch N-1
+        for work in run_pipeline(batches, stages, threaded=MATCH_PIPELINE):
+            assemble(work)
 
         return {
             "matchedProducts": matched_products,
@@ -321,5 +983,5 @@ def match_products_with_vector_search_in_batches(
         }
 
     except Exception as e:
-        logging.error(f"Failed to match products with Vertex AI Matching Engine: {str(e)}")
-        raise
\ No newline at end of file
+        logging.error(f"Failed to match products with the configured neighbor-search backend: {str(e)}")
+        raise
@@ -0,0 +1,245 @@
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# Attach a per-request trace summary to /api/match responses by default (otherwise only with ?trace=true)
+MATCH_TRACE = os.environ.get("MATCH_TRACE", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 50000)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency.", ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "match_stage_seconds", "Time spent in each stage of the matching flow.", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ITEMS = Histogram(
+    "match_stage_items", "Number of products handled by each stage call (batch size).", ["stage"], buckets=SIZE_BUCKETS
+)
+UPSTREAM_CALLS = Counter(
+    "upstream_calls_total", "Calls to upstream services by outcome.", ["upstream", "outcome"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_call_seconds", "Latency of upstream calls, throttling excluded.", ["upstream"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Retried upstream calls.", ["upstream"])
+RATE_LIMIT_WAIT_SECONDS = Counter(
+    "rate_limit_wait_seconds_total", "Time callers were told to wait by the rate limiters.", ["upstream"]
+)
+RATE_LIMIT_THROTTLED = Counter("rate_limit_throttled_total", "Calls delayed by the rate limiters.", ["upstream"])
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens reported by the model.", ["kind"])
+LLM_BATCH_FALLBACKS = Counter(
+    "llm_batch_fallbacks_total", "Products re-sent as single-product LLM calls after a batched call failed."
+)
+EMBEDDING_CACHE_LOOKUPS = Counter("embedding_cache_lookups_total", "Embedding cache lookups.", ["result"])
+MATCH_CLASSIFICATIONS = Counter(
+    "match_classifications_total",
+    "Products by how their neighbors classified them (lexical, confident, semi_confident, none).",
+    ["classification"],
+)
+MATCH_RESULTS = Counter("match_results_total", "Final product results by status.", ["status"])
+MICRO_BATCH_ITEMS = Histogram(
+    "micro_batch_items", "Items per micro-batched upstream call.", ["upstream"], buckets=SIZE_BUCKETS
+)
+MICRO_BATCH_CALLERS = Histogram(
+    "micro_batch_callers", "Callers sharing a micro-batched upstream call.", ["upstream"], buckets=SIZE_BUCKETS
+)
+CATALOG_RELOADS = Counter("catalog_reloads_total", "Catalog snapshot reloads by outcome.", ["outcome"])
+CATALOG_RELOAD_SECONDS = Histogram(
+    "catalog_reload_seconds", "Time to build a catalog snapshot.", buckets=LATENCY_BUCKETS
+)
+
+_current_trace = contextvars.ContextVar("match_trace", default=None)
+
+
+class Trace:
+    """
+    Per-request summary of the time spent in each stage and of the upstream activity.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(lambda: {"seconds": 0.0, "calls": 0, "items": 0})
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds, items=None):
+        with self._lock:
+            entry = self.stages[stage]
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            entry["items"] += items or 0
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def summary(self):
+        with self._lock:
+            return {
+                "totalSeconds": round(time.perf_counter() - self.started, 4),
+                "stages": {
+                    stage: dict(entry, seconds=round(entry["seconds"], 4)) for stage, entry in self.stages.items()
+                },
+                "counters": {name: round(value, 4) for name, value in self.counters.items()},
+            }
+
+
+@contextmanager
+def start_trace():
+    """
+    Collect a Trace for everything recorded in the current context (request thread and its asyncio tasks).
+    """
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    """
+    Return the Trace of the current context, or None outside a traced request.
+    """
+    return _current_trace.get()
+
+
+class _TraceGroup:
+    """
+    Forwards everything recorded to several traces.
+    """
+
+    def __init__(self, traces):
+        self.traces = traces
+
+    def add_stage(self, stage, seconds, items=None):
+        for trace in self.traces:
+            trace.add_stage(stage, seconds, items)
+
+    def increment(self, name, amount=1):
+        for trace in self.traces:
+            trace.increment(name, amount)
+
+
+@contextmanager
+def shared_trace(traces):
+    """
+    Record into each of `traces` for everything in the current context, e.g. in the thread making an upstream
+    call on behalf of several requests: each of their traces sees the call, its retries and its throttling.
+    Args:
+        traces (iterable): Traces of the participating requests; None entries and repeats are ignored.
+    """
+    traces = list({id(trace): trace for trace in traces if trace is not None}.values())
+    token = _current_trace.set(_TraceGroup(traces) if traces else None)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+def _trace_increment(name, amount=1):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.increment(name, amount)
+
+
+@contextmanager
+def timed_stage(stage, items=None):
+    """
+    Time a stage of the matching flow into match_stage_seconds (and the current trace).
+    Args:
+        stage (str): Stage name, e.g. "embedding" or "vector_search".
+        items (int): Number of products handled, recorded as the batch size.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        if items is not None:
+            STAGE_ITEMS.labels(stage).observe(items)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, seconds, items)
+
+
+def record_upstream_call(upstream, outcome, seconds=None):
+    """
+    Count an upstream call by outcome ("success", "quota_error", "error" or "timeout") and record its latency.
+    """
+    UPSTREAM_CALLS.labels(upstream, outcome).inc()
+    if seconds is not None:
+        UPSTREAM_SECONDS.labels(upstream).observe(seconds)
+    _trace_increment(f"{upstream}_calls")
+    if outcome != "success":
+        _trace_increment(f"{upstream}_{outcome}s")
+
+
+def record_retry(upstream):
+    UPSTREAM_RETRIES.labels(upstream).inc()
+    _trace_increment(f"{upstream}_retries")
+
+
+def record_rate_limit_wait(upstream, seconds):
+    RATE_LIMIT_THROTTLED.labels(upstream).inc()
+    RATE_LIMIT_WAIT_SECONDS.labels(upstream).inc(seconds)
+    _trace_increment(f"{upstream}_throttle_seconds", seconds)
+
+
+def record_llm_tokens(response):
+    """
+    Count the prompt and completion tokens of a LangChain chat model response, when reported.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    for kind, key in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+        if usage.get(key):
+            LLM_TOKENS.labels(kind).inc(usage[key])
+            _trace_increment(f"llm_{kind}_tokens", usage[key])
+
+
+def record_llm_batch_fallback(count):
+    LLM_BATCH_FALLBACKS.inc(count)
+    _trace_increment("llm_batch_fallbacks", count)
+
+
+def record_embedding_cache(hits, misses):
+    if hits:
+        EMBEDDING_CACHE_LOOKUPS.labels("hit").inc(hits)
+    if misses:
+        EMBEDDING_CACHE_LOOKUPS.labels("miss").inc(misses)
+    _trace_increment("embedding_cache_hits", hits)
+    _trace_increment("embedding_cache_misses", misses)
+
+
+def record_classification(classification, count=1):
+    if count:
+        MATCH_CLASSIFICATIONS.labels(classification).inc(count)
+        _trace_increment(f"classified_{classification}", count)
+
+
+def record_result(status):
+    MATCH_RESULTS.labels(status).inc()
+
+
+def record_micro_batch(upstream, items, callers):
+    MICRO_BATCH_ITEMS.labels(upstream).observe(items)
+    MICRO_BATCH_CALLERS.labels(upstream).observe(callers)
+
+
+def record_catalog_reload(outcome, seconds):
+    CATALOG_RELOADS.labels(outcome).inc()
+    CATALOG_RELOAD_SECONDS.observe(seconds)
+
+
+def metrics_response():
+    """
+    Return the Prometheus exposition of every metric as (body, content type).
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from metrics import current_trace, record_micro_batch, shared_trace
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Coalesce the embedding and neighbor queries of concurrent requests into shared upstream calls
+MICRO_BATCHING = os.environ.get("MICRO_BATCHING", "true").lower() == "true"
+# Maximum number of items per upstream call (the embedding API accepts up to 250 texts)
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", 250))
+# Milliseconds an item waits for others to join its call before a partial batch is sent
+MICRO_BATCH_MAX_WAIT_MS = float(os.environ.get("MICRO_BATCH_MAX_WAIT_MS", 20))
+# Upstream calls of one batcher in flight at once; while they are all busy (e.g. waiting for the
+# rate limiter), new items keep accumulating into the next, larger call
+MICRO_BATCH_CONCURRENCY = int(os.environ.get("MICRO_BATCH_CONCURRENCY", 4))
+
+
+class _Request:
+    """
+    The items one caller submitted, the future its results are delivered through, and the caller's trace.
+    """
+
+    def __init__(self, size):
+        self.future = Future()
+        self.trace = current_trace()
+        self.results = [None] * size
+        self.remaining = size
+        self._lock = threading.Lock()
+
+    def set(self, index, result):
+        with self._lock:
+            self.results[index] = result
+            self.remaining -= 1
+            if self.remaining == 0 and not self.future.done():
+                self.future.set_result(self.results)
+
+    def fail(self, error):
+        with self._lock:
+            if self.future.done():
+                return
+            self.future.set_exception(error)
+
+
+class MicroBatcher:
+    """
+    Collects the items submitted by concurrent callers and sends them upstream together.
+    A call is made as soon as `max_batch_size` items are pending, or when the oldest pending item
+    has waited `max_wait` seconds; each caller gets its own results back, in order, through a future.
+    Items are only grouped with items submitted under the same key (e.g. the same index).
+    The calls run on the batcher's threads; what they record (upstream calls, retries, throttling) goes to
+    the trace of every request with items in the call.
+    """
+
+    def __init__(self, name, process, max_batch_size=MICRO_BATCH_MAX_SIZE, max_wait=MICRO_BATCH_MAX_WAIT_MS / 1000,
+                 max_concurrency=MICRO_BATCH_CONCURRENCY):
+        """
+        Args:
+            name (str): Name of the upstream, used in metrics and thread names.
+            process (callable): process(key, items) makes one upstream call and returns one result per item.
+            max_batch_size (int): Maximum number of items per call.
+            max_wait (float): Seconds an item waits for others before a partial batch is sent.
+            max_concurrency (int): Calls in flight at once.
+        """
+        self.name = name
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        # key -> pending (item, request, index) entries, and when the oldest of them was submitted
+        self._pending = OrderedDict()
+        self._oldest = {}
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix=f"micro-batch-{name}")
+
+    def submit(self, items, key=None):
+        """
+        Queue items for the next upstream calls.
+        Returns:
+            Future: Resolves to the list of results of the items, or to the exception of a failed call.
+        """
+        request = _Request(len(items))
+        if not items:
+            request.future.set_result([])
+            return request.future
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name=f"micro-batch-{self.name}", daemon=True)
+                self._thread.start()
+            queue = self._pending.setdefault(key, [])
+            if not queue:
+                self._oldest[key] = time.monotonic()
+            queue.extend((item, request, index) for index, item in enumerate(items))
+            self._condition.notify()
+        return request.future
+
+    def map(self, items, key=None, timeout=None):
+        """
+        Submit items and wait for their results.
+        """
+        return self.submit(items, key).result(timeout)
+
+    def _next_batch(self):
+        # Return (key, entries) ready to be sent, or (None, seconds until one may be ready)
+        if self._in_flight >= self.max_concurrency or not self._pending:
+            return None, None
+        now = time.monotonic()
+        wait = None
+        for key, queue in self._pending.items():
+            if len(queue) >= self.max_batch_size or now - self._oldest[key] >= self.max_wait:
+                entries = queue[:self.max_batch_size]
+                del queue[:self.max_batch_size]
+                if not queue:
+                    del self._pending[key]
+                    del self._oldest[key]
+                return key, entries
+            remaining = self._oldest[key] + self.max_wait - now
+            wait = remaining if wait is None else min(wait, remaining)
+        return None, wait
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                key, entries = self._next_batch()
+                while not isinstance(entries, list):
+                    self._condition.wait(entries)
+                    key, entries = self._next_batch()
+                self._in_flight += 1
+            self._executor.submit(self._send, key, entries)
+
+    def _send(self, key, entries):
+        try:
+            with shared_trace(request.trace for _, request, _ in entries):
+                results = self.process(key, [item for item, _, _ in entries])
+            if len(results) != len(entries):
+                raise ValueError(f"{self.name} returned {len(results)} results for {len(entries)} items.")
+        except Exception as e:
+            logging.error(f"Micro-batched {self.name} call with {len(entries)} items failed: {str(e)}")
+            for _, request, _ in entries:
+                request.fail(e)
+        else:
+            for (_, request, index), result in zip(entries, results):
+                request.set(index, result)
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify()
+            record_micro_batch(self.name, len(entries), len({id(request) for _, request, _ in entries}))
+
+
+_micro_batchers = {}
+_micro_batchers_lock = threading.Lock()
+
+
+def get_micro_batcher(name, process):
+    """
+    Return the process-wide micro-batcher of an upstream, creating it with `process` on first use.
+    Returns:
+        MicroBatcher: The batcher, or None when MICRO_BATCHING is off.
+    """
+    if not MICRO_BATCHING:
+        return None
+    with _micro_batchers_lock:
+        if name not in _micro_batchers:
+            _micro_batchers[name] = MicroBatcher(name, process)
+        return _micro_batchers[name]
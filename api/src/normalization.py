@@ -0,0 +1,75 @@
+import re
+import unicodedata
+
+# Units that are glued to their quantity ("1.93 oz" -> "1.93oz"); longer spellings first
+UNIT_PATTERN = r"fl\s*oz|floz|oz|lbs|lb|gal|pt|qt|kg|mg|g|liters|litres|liter|litre|ltr|l|ml|ct|pk|pc|pcs"
+
+_NON_WORD = re.compile(r"[^\w.]+")
+_STRAY_DOT = re.compile(r"(?<!\d)\.|\.(?!\d)")
+_LEADING_DOT = re.compile(r"(?<![\d.])\.(\d)")
+_UNIT_SPACING = re.compile(rf"(\d)\s+({UNIT_PATTERN})\b")
+_FLUID_OUNCE = re.compile(r"(\d)fl\s*oz\b")
+
+
+def normalize_product_text(text):
+    """
+    Normalize a product name for lexical comparison.
+    Lowercases, drops punctuation and brackets, and glues units to their quantity,
+    so "5 Hour Energy Grape (1.93oz)" and "5 hour energy grape 1.93 OZ" give the same key.
+    Args:
+        text (str): The product name.
+
+    Returns:
+        str: The normalized product name.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _LEADING_DOT.sub(r"0.\1", text)
+    text = _NON_WORD.sub(" ", text.replace("_", " "))
+    text = _STRAY_DOT.sub(" ", text)
+    text = " ".join(text.split())
+    text = _UNIT_SPACING.sub(r"\1\2", text)
+    text = _FLUID_OUNCE.sub(r"\1floz", text)
+    return text
+
+
+def tokenize(text):
+    """
+    Split a product name into normalized tokens.
+    """
+    return normalize_product_text(text).split()
+
+
+def char_ngrams(text, n=3):
+    """
+    Return the set of character n-grams of an already normalized string, padded with spaces.
+    """
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def numeric_tokens(text):
+    """
+    Return the tokens of a normalized string that contain a digit (sizes, counts, percentages).
+    """
+    return {token for token in text.split() if any(c.isdigit() for c in token)}
+
+
+# Abbreviations common in vendor product names, expanded before comparing words
+ABBREVIATIONS = {
+    "choc": "chocolate", "xtra": "extra", "orig": "original", "strwb": "strawberry", "straw": "strawberry",
+    "pnut": "peanut", "pb": "peanut butter", "chs": "cheese", "van": "vanilla", "bnna": "banana",
+    "rasp": "raspberry", "blu": "blue", "bry": "berry", "grn": "green", "wht": "white", "blk": "black",
+    "dk": "dark", "mlk": "milk", "crm": "cream", "sgr": "sugar", "sf": "sugar free", "ff": "fat free",
+    "lt": "light", "reg": "regular", "asst": "assorted", "org": "organic", "nat": "natural", "ckie": "cookie",
+    "ckies": "cookies", "drk": "dark", "cin": "cinnamon", "hny": "honey", "mnt": "mint",
+}
+
+
+def expand_abbreviations(words):
+    """
+    Replace the known abbreviations in a list of normalized words by their spelled-out words.
+    """
+    expanded = []
+    for word in words:
+        expanded.extend(ABBREVIATIONS.get(word, word).split())
+    return expanded
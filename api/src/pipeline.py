@@ -0,0 +1,112 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Number of batches that may wait between two pipeline stages before the upstream stage blocks
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 2))
+
+_END = object()
+
+
+class _StageFailure:
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+def run_pipeline(items, stages, queue_size=PIPELINE_QUEUE_SIZE, threaded=True):
+    """
+    Pass every item through a sequence of stages, each running in its own thread and connected to the
+    next one by a bounded queue. While stage 2 works on item N, stage 1 already works on item N+1;
+    a full queue blocks the stage feeding it, so a slow stage holds back the faster ones instead of
+    letting work pile up. Every stage handles one item at a time, so items come out in input order.
+    Args:
+        items (iterable): The items to process.
+        stages (list): List of (name, function) pairs; each function takes an item and returns the item
+            passed to the next stage. An exception raised by a stage stops the pipeline and is re-raised.
+        queue_size (int): Maximum number of items waiting in front of each stage.
+        threaded (bool): False runs every stage in the calling thread, one item after the other.
+
+    Yields:
+        The output of the last stage for every item, in input order.
+    """
+    if not threaded:
+        for item in items:
+            for _, function in stages:
+                item = function(item)
+            yield item
+        return
+
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def put(target, item):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source):
+        while not stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def feed():
+        try:
+            for item in items:
+                if not put(queues[0], item):
+                    return
+        except Exception as e:
+            put(queues[0], _StageFailure("input", e))
+            return
+        put(queues[0], _END)
+
+    def work(index, name, function):
+        source, target = queues[index], queues[index + 1]
+        while True:
+            item = get(source)
+            if item is _END or isinstance(item, _StageFailure):
+                put(target, item)
+                return
+            try:
+                item = function(item)
+            except Exception as e:
+                logging.error(f"Pipeline stage '{name}' failed: {str(e)}")
+                item = _StageFailure(name, e)
+            if not put(target, item):
+                return
+
+    # Each thread runs in a copy of the caller's context, so per-request state such as the trace follows the work
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(feed,), name="pipeline-input", daemon=True)]
+    for index, (name, function) in enumerate(stages):
+        threads.append(threading.Thread(
+            target=contextvars.copy_context().run, args=(work, index, name, function),
+            name=f"pipeline-{name}", daemon=True,
+        ))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _END:
+                return
+            if isinstance(item, _StageFailure):
+                raise item.error
+            yield item
+    finally:
+        # Also reached when the consumer stops early: unblock and end every stage
+        stop.set()
+        for thread in threads:
+            thread.join()
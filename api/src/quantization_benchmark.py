@@ -0,0 +1,127 @@
+import argparse
+import logging
+import time
+import numpy as np
+from embedding_store import load_embedding_store
+from quantized_index import ProductQuantizer, QuantizedNeighborSearch, ScalarQuantizer
+from vector_search import LocalNeighborSearch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def synthetic_catalog(count=16000, dimensionality=768, clusters=2000, seed=0):
+    """
+    Clustered random unit vectors standing in for the catalog when no store is given:
+    product families (flavors, sizes) form tight groups, as they do in the real embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensionality))
+    members = centers[rng.integers(0, clusters, count)] + 0.4 * rng.standard_normal((count, dimensionality))
+    return [str(i) for i in range(count)], _normalize_rows(members)
+
+
+def perturbed_queries(catalog, count=1000, noise=0.03, seed=1):
+    """
+    Queries made of catalog vectors plus noise, mimicking external names of catalog products.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(catalog), min(count, len(catalog)), replace=False)
+    queries = np.asarray(catalog[rows], dtype=np.float32)
+    return _normalize_rows(queries + noise * rng.standard_normal(queries.shape))
+
+
+def embed_external_sample(csv_path, limit):
+    """
+    Embed the PRODUCT_NAME column of an external sample with the production embedding model.
+    """
+    import pandas as pd
+    from matching_engine import generate_embeddings_in_batches
+
+    names = pd.read_csv(csv_path)["PRODUCT_NAME"].dropna().astype(str).tolist()[:limit]
+    embeddings = [embedding for embedding in generate_embeddings_in_batches(names) if embedding is not None]
+    return _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+
+def recall_at_k(exact, approximate, k):
+    """
+    Fraction of the exact top-k ids that the approximate search also returns in its top-k.
+    """
+    found = 0
+    for truth, result in zip(exact, approximate):
+        found += len({n.datapoint_id for n in truth[:k]} & {n.datapoint_id for n in result[:k]})
+    return found / (k * len(exact))
+
+
+def _timed(search, queries, k):
+    start = time.perf_counter()
+    results = search.find_neighbors(queries, neighbor_count=k)
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def run_benchmark(ids, catalog, queries, k=10, shortlist_sizes=(50, 100, 200), pq_subspaces=(48, 96, 192)):
+    """
+    Compare exact float32 search with int8 and product-quantized search.
+    Returns:
+        list: One dict per configuration with recall@k, queries per second and bytes per vector.
+    """
+    exact_search = LocalNeighborSearch(ids, catalog, normalized=True)
+    exact, exact_qps = _timed(exact_search, queries, k)
+    rows = [{"index": "float32 exact", "shortlist": "-", "recall": 1.0, "qps": exact_qps,
+             "bytes_per_vector": catalog.shape[1] * 4}]
+
+    quantizers = [("int8", ScalarQuantizer)]
+    quantizers += [(f"pq{m}", lambda m=m: ProductQuantizer(subspaces=m))
+                   for m in pq_subspaces if catalog.shape[1] % m == 0]
+    for name, make_quantizer in quantizers:
+        start = time.perf_counter()
+        search = QuantizedNeighborSearch(ids, catalog, make_quantizer())
+        build_seconds = time.perf_counter() - start
+        for shortlist_size in shortlist_sizes:
+            search.shortlist_size = shortlist_size
+            results, qps = _timed(search, queries, k)
+            rows.append({"index": name, "shortlist": shortlist_size, "recall": recall_at_k(exact, results, k),
+                         "qps": qps, "bytes_per_vector": search.codes.nbytes / len(ids),
+                         "build_seconds": build_seconds})
+    return rows
+
+
+def print_report(rows, catalog_size, query_count, k):
+    print(f"Catalog: {catalog_size} vectors, {query_count} queries, recall@{k} against exact cosine")
+    print(f"{'index':<14}{'shortlist':>10}{'recall':>9}{'queries/s':>11}{'bytes/vec':>11}{'MB @1M':>9}{'build s':>9}")
+    for row in rows:
+        megabytes = row["bytes_per_vector"] * 1_000_000 / 2**20
+        build = f"{row['build_seconds']:.1f}" if "build_seconds" in row else "-"
+        print(f"{row['index']:<14}{row['shortlist']:>10}{row['recall']:>9.3f}{row['qps']:>11.0f}"
+              f"{row['bytes_per_vector']:>11.0f}{megabytes:>9.0f}{build:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall and speed of quantized catalog search versus exact cosine.")
+    parser.add_argument("--store", help="Catalog .npy store written by embedding_store.py (synthetic catalog if omitted)")
+    parser.add_argument("--queries", help=".npy store of query embeddings, e.g. the embedded external sample")
+    parser.add_argument("--external-csv", help="External sample CSV with PRODUCT_NAME, embedded with the production model")
+    parser.add_argument("--query-count", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.store:
+        ids, matrix, _ = load_embedding_store(args.store, mmap=False)
+        catalog = np.asarray(matrix, dtype=np.float32)
+    else:
+        ids, catalog = synthetic_catalog()
+    if args.queries:
+        _, queries, _ = load_embedding_store(args.queries, mmap=False)
+        queries = np.asarray(queries[:args.query_count], dtype=np.float32)
+    elif args.external_csv:
+        queries = embed_external_sample(args.external_csv, args.query_count)
+    else:
+        queries = perturbed_queries(catalog, args.query_count)
+
+    print_report(run_benchmark(ids, catalog, queries, args.k), len(ids), len(queries), args.k)
@@ -0,0 +1,196 @@
+import logging
+import numpy as np
+from vector_search import Neighbor, exact_similarities
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class ScalarQuantizer:
+    """
+    Per-dimension int8 scalar quantization: each dimension is mapped linearly from its
+    [min, max] range in the catalog to 256 levels. 4x smaller than float32.
+    """
+
+    def __init__(self):
+        self.minimum = None
+        self.scale = None
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.minimum = vectors.min(axis=0)
+        self.scale = (vectors.max(axis=0) - self.minimum) / 255
+        self.scale[self.scale == 0] = 1.0
+        return self
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        levels = np.clip(np.rint((vectors - self.minimum) / self.scale), 0, 255)
+        return (levels - 128).astype(np.int8)
+
+    def decode(self, codes):
+        return self.minimum + self.scale * (codes.astype(np.float32) + 128)
+
+    def scores(self, queries, codes, block_size=8192):
+        """
+        Approximate dot products between queries and encoded vectors, computed on the codes:
+        q . x ~= q . min + (q * scale) . (code + 128)
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        offset = queries @ self.minimum
+        scaled = queries * self.scale
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), block_size):
+            block = codes[start:start + block_size].astype(np.float32) + 128
+            scores[:, start:start + len(block)] = scaled @ block.T
+        return scores + offset[:, None]
+
+
+class ProductQuantizer:
+    """
+    Product quantization: vectors are split into `subspaces` chunks and each chunk is replaced by the
+    index of its nearest of 256 k-means centroids, so a 768-dim float32 vector (3072 bytes) is stored
+    in `subspaces` bytes. Scores are computed with per-query lookup tables (asymmetric distance).
+    """
+
+    def __init__(self, subspaces=96, iterations=20, training_size=20000, seed=0):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.training_size = training_size
+        self.seed = seed
+        self.centroids = None
+
+    def _split(self, vectors):
+        count, dimensionality = vectors.shape
+        if dimensionality % self.subspaces:
+            raise ValueError(f"Dimensionality {dimensionality} is not divisible by {self.subspaces} subspaces.")
+        return vectors.reshape(count, self.subspaces, dimensionality // self.subspaces)
+
+    @staticmethod
+    def _assign(data, centroids):
+        # argmin ||x - c||^2 == argmax (x . c - ||c||^2 / 2)
+        return np.argmax(data @ centroids.T - 0.5 * np.einsum("ij,ij->i", centroids, centroids), axis=1)
+
+    def fit(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > self.training_size:
+            vectors = vectors[rng.choice(len(vectors), self.training_size, replace=False)]
+        chunks = self._split(vectors)
+        k = min(256, len(vectors))
+        self.centroids = np.zeros((self.subspaces, k, chunks.shape[2]), dtype=np.float32)
+        for m in range(self.subspaces):
+            data = chunks[:, m, :]
+            centroids = data[rng.choice(len(data), k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._assign(data, centroids)
+                counts = np.bincount(assignment, minlength=k)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, data)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            self.centroids[m] = centroids
+        logging.info(f"Trained product quantizer with {self.subspaces} subspaces of {k} centroids.")
+        return self
+
+    def encode(self, vectors, block_size=8192):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), block_size):
+            chunks = self._split(vectors[start:start + block_size])
+            for m in range(self.subspaces):
+                codes[start:start + len(chunks), m] = self._assign(chunks[:, m, :], self.centroids[m])
+        return codes
+
+    def decode(self, codes):
+        parts = [self.centroids[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def scores(self, queries, codes):
+        """
+        Approximate dot products between queries and encoded vectors using per-query lookup tables.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        chunks = self._split(queries)
+        # tables[q, m, c] = query q's chunk m . centroid c of subspace m
+        tables = np.einsum("qmd,mcd->qmc", chunks, self.centroids)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for m in range(self.subspaces):
+            scores += np.take(tables[:, m, :], codes[:, m], axis=1)
+        return scores
+
+
+class QuantizedNeighborSearch:
+    """
+    Neighbor search ranking the catalog on compressed codes, then re-scoring a shortlist exactly
+    against the full-precision (typically memory-mapped) embeddings.
+    Exposes the same find_neighbors interface as LocalNeighborSearch.
+    """
+
+    def __init__(self, ids, embeddings, quantizer, shortlist_size=100, query_block_size=64):
+        """
+        Args:
+            ids (list): Datapoint ids, one per row of `embeddings`.
+            embeddings (ndarray): L2-normalized catalog embeddings, used to train the quantizer and for re-scoring.
+            quantizer (ScalarQuantizer or ProductQuantizer): An untrained quantizer.
+            shortlist_size (int): Number of candidates re-scored exactly per query.
+            query_block_size (int): Number of queries scored together.
+        """
+        self.ids = list(ids)
+        self.embeddings = embeddings
+        self.quantizer = quantizer.fit(embeddings)
+        self.codes = self.quantizer.encode(embeddings)
+        self.shortlist_size = shortlist_size
+        self.query_block_size = query_block_size
+        self._rows = None
+        logging.info(f"Encoded {len(self.ids)} embeddings into {self.codes.nbytes} bytes of codes.")
+
+    def find_neighbors(self, embeddings, neighbor_count=10):
+        """
+        Return the top-k catalog entries for each query embedding by cosine similarity.
+        Args:
+            embeddings (list): List of query embeddings.
+            neighbor_count (int): Number of nearest neighbors to retrieve per query.
+
+        Returns:
+            list: One list of Neighbor tuples per query, closest first.
+        """
+        if len(embeddings) == 0:
+            return []
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+        shortlist_size = min(max(self.shortlist_size, neighbor_count), len(self.ids))
+        k = min(neighbor_count, shortlist_size)
+
+        results = []
+        for start in range(0, len(queries), self.query_block_size):
+            block = queries[start:start + self.query_block_size]
+            approximate = self.quantizer.scores(block, self.codes)
+            shortlists = np.argpartition(-approximate, shortlist_size - 1, axis=1)[:, :shortlist_size]
+            for query, shortlist in zip(block, shortlists):
+                shortlist = np.sort(shortlist)
+                exact = np.asarray(self.embeddings[shortlist], dtype=np.float32) @ query
+                order = np.argsort(-exact)[:k]
+                results.append([Neighbor(self.ids[shortlist[j]], float(exact[j])) for j in order])
+        return results
+
+    def similarities(self, embeddings, candidate_ids):
+        """
+        Return the exact cosine similarity of every query embedding with its own list of catalog ids.
+        """
+        if self._rows is None:
+            self._rows = {datapoint_id: row for row, datapoint_id in enumerate(self.ids)}
+        return exact_similarities(self.embeddings, self._rows, embeddings, candidate_ids)
+
+
+def build_quantizer(kind):
+    """
+    Create an untrained quantizer: "int8" (scalar) or "pq" (product quantization).
+    """
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer()
+    raise ValueError(f"Unknown quantization: {kind}")
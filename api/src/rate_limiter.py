@@ -0,0 +1,226 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from metrics import record_rate_limit_wait
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Per-upstream quotas: (calls per minute, burst). Shared by every thread and request of the process.
+RATE_LIMITS = {
+    "embeddings": (
+        int(os.environ.get("EMBEDDING_CALLS_PER_MINUTE", 5)),
+        int(os.environ.get("EMBEDDING_BURST", 5)),
+    ),
+    "vector_search": (
+        int(os.environ.get("VECTOR_SEARCH_CALLS_PER_MINUTE", 60)),
+        int(os.environ.get("VECTOR_SEARCH_BURST", 10)),
+    ),
+    "llm": (
+        int(os.environ.get("LLM_CALLS_PER_MINUTE", 60)),
+        int(os.environ.get("LLM_BURST", 10)),
+    ),
+}
+
+
+# Exception classes of the client libraries raised when a quota is exceeded
+QUOTA_ERROR_TYPES = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+
+
+def is_quota_error(error):
+    """
+    Return True if an upstream error means the quota was exceeded: a ResourceExhausted / 429 exception,
+    an error whose status code is 429 or RESOURCE_EXHAUSTED, or a message carrying the RESOURCE_EXHAUSTED status.
+    A bare "429" in a message is not enough; ids, row counts or byte sizes can contain it.
+    """
+    if type(error).__name__ in QUOTA_ERROR_TYPES:
+        return True
+    for attribute in ("code", "status_code", "status"):
+        value = getattr(error, attribute, None)
+        if callable(value):
+            # grpc.RpcError.code() returns a grpc.StatusCode
+            try:
+                value = value()
+            except Exception:
+                continue
+        if value == 429 or getattr(value, "name", value) == "RESOURCE_EXHAUSTED":
+            return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting calls to an upstream API.
+    Tokens refill continuously at `calls_per_minute` and up to `burst` calls can be made back to back.
+    On quota errors the rate is halved (down to `min_calls_per_minute`) and it recovers additively
+    on every successful call, so the limiter settles just under the real quota.
+    """
+
+    def __init__(self, calls_per_minute, burst=None, name=None, min_calls_per_minute=None, recovery=0.1):
+        self.name = name
+        self.base_calls_per_minute = calls_per_minute
+        self.calls_per_minute = calls_per_minute
+        self.min_calls_per_minute = min_calls_per_minute or max(calls_per_minute / 8, 0.5)
+        self.recovery = recovery
+        self.burst = burst or calls_per_minute
+        self.calls = 0
+        self.throttled_calls = 0
+        self.quota_errors = 0
+        self.wait_seconds_total = 0.0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        rate = self.calls_per_minute / 60
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """
+        Take tokens from the bucket, going into debt if needed.
+        Returns:
+            float: Seconds the caller must wait before making the call.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            self.calls += 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / (self.calls_per_minute / 60)
+            if wait > 0:
+                self.throttled_calls += 1
+                self.wait_seconds_total += wait
+        if wait > 0:
+            record_rate_limit_wait(self.name or "unnamed", wait)
+        return wait
+
+    def acquire(self, tokens=1):
+        """
+        Block until the call is allowed.
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            logging.info(f"Rate limiter '{self.name}': waiting {wait:.2f} seconds before the next call.")
+            time.sleep(wait)
+        return wait
+
+    def penalize(self):
+        """
+        Slow down after a RESOURCE_EXHAUSTED error: halve the rate and drop the remaining burst.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.calls_per_minute = max(self.min_calls_per_minute, self.calls_per_minute / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self.quota_errors += 1
+        logging.warning(f"Rate limiter '{self.name}': quota exceeded, rate lowered to {self.calls_per_minute:.2f} calls/minute.")
+
+    def reward(self):
+        """
+        Recover part of the configured rate after a successful call.
+        """
+        if self.calls_per_minute >= self.base_calls_per_minute:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.calls_per_minute = min(
+                self.base_calls_per_minute,
+                self.calls_per_minute + self.base_calls_per_minute * self.recovery
+            )
+
+    def stats(self):
+        """
+        Return the counters of the limiter.
+        """
+        return {
+            "calls_per_minute": self.calls_per_minute,
+            "calls": self.calls,
+            "throttled_calls": self.throttled_calls,
+            "quota_errors": self.quota_errors,
+            "wait_seconds_total": self.wait_seconds_total,
+        }
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose tokens and rate live in shared memory, so every process of a pool
+    (e.g. the workers of match_cli.py) draws from one quota and slows down together on quota errors.
+    Created in the parent and handed to the workers at start-up; the counters stay per process.
+    """
+
+    def __init__(self, calls_per_minute, burst=None, name=None, context=None, **kwargs):
+        # tokens, last refill time (time.monotonic is system-wide), current calls per minute
+        self._state = (context or multiprocessing).Array("d", 3)
+        super().__init__(calls_per_minute, burst=burst, name=name, **kwargs)
+        self._lock = self._state.get_lock()
+
+    @property
+    def _tokens(self):
+        return self._state[0]
+
+    @_tokens.setter
+    def _tokens(self, value):
+        self._state[0] = value
+
+    @property
+    def _updated(self):
+        return self._state[1]
+
+    @_updated.setter
+    def _updated(self, value):
+        self._state[1] = value
+
+    @property
+    def calls_per_minute(self):
+        return self._state[2]
+
+    @calls_per_minute.setter
+    def calls_per_minute(self, value):
+        self._state[2] = value
+
+
+def create_shared_rate_limiters(context=None):
+    """
+    Create one shared token bucket per upstream with the configured quotas, to install with
+    set_rate_limiters in every worker process.
+    """
+    return {
+        name: SharedTokenBucket(calls_per_minute, burst=burst, name=name, context=context)
+        for name, (calls_per_minute, burst) in RATE_LIMITS.items()
+    }
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def set_rate_limiters(limiters):
+    """
+    Replace the process-wide rate limiters of the given upstreams, e.g. with shared token buckets.
+    """
+    with _rate_limiters_lock:
+        _rate_limiters.update(limiters)
+
+
+def get_rate_limiter(name):
+    """
+    Return the process-wide rate limiter of an upstream ("embeddings", "vector_search" or "llm").
+    """
+    with _rate_limiters_lock:
+        if name not in _rate_limiters:
+            calls_per_minute, burst = RATE_LIMITS[name]
+            _rate_limiters[name] = TokenBucket(calls_per_minute, burst=burst, name=name)
+        return _rate_limiters[name]
+
+
+def rate_limiter_stats():
+    """
+    Return the counters of every rate limiter created so far.
+    """
+    with _rate_limiters_lock:
+        return {name: limiter.stats() for name, limiter in _rate_limiters.items()}
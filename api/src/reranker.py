@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from normalization import expand_abbreviations, normalize_product_text
+from size_attributes import parse_size, sizes_compatible
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Resolve clear-cut semi-confident products locally instead of escalating them to the LLM
+LOCAL_RERANKER = os.environ.get("LOCAL_RERANKER", "true").lower() == "true"
+# Thresholds written by fit_reranker.py; the built-in defaults below are used when the file does not exist
+RERANKER_THRESHOLDS_PATH = os.environ.get("RERANKER_THRESHOLDS_PATH", "reranker_thresholds.json")
+# JSON Lines file receiving every LLM verdict with its candidates, the input of fit_reranker.py (empty: off)
+RERANKER_VERDICT_LOG = os.environ.get("RERANKER_VERDICT_LOG", "")
+
+# Weights of the candidate score: cosine similarity + word overlap + size agreement
+SCORE_WEIGHTS = {"cosine": 1.0, "token_overlap": 1.0, "size_agreement": 0.5}
+
+# No local decision until fit_reranker.py has fitted thresholds on logged LLM verdicts: every semi-confident
+# product keeps going to the LLM. The margin is the starting point of the fit
+DEFAULT_THRESHOLDS = {"accept_score": None, "accept_margin": 0.35, "reject_score": None}
+
+CandidateFeatures = namedtuple(
+    "CandidateFeatures", ["datapoint_id", "cosine", "token_overlap", "size_agreement", "score"]
+)
+
+
+# A number with its optional unit, cut out of glued tokens ("mayolt2oz", "2%milk")
+_QUANTITY = re.compile(r"\d+(?:\.\d+)?(?:floz|lbs|lb|oz|gal|pt|qt|kg|mg|g|liters|litres|liter|litre|ltr|l|ml|ct|pk|%)?(?![a-z])|\d+(?:\.\d+)?")
+
+
+def _words(text):
+    # Expanded words of a product name, in order, without sizes and counts (size agreement scores those)
+    words = []
+    for token in normalize_product_text(text).split():
+        words.extend(_QUANTITY.sub(" ", token).split() if any(c.isdigit() for c in token) else [token])
+    return list(dict.fromkeys(expand_abbreviations(words)))
+
+
+_VOWELS = set("aeiou")
+
+
+def _is_subsequence(word, text):
+    remaining = iter(text)
+    return all(char in remaining for char in word)
+
+
+def _abbreviates_word(piece, candidate_word):
+    # A piece of at least two letters stands for a candidate word if it is a prefix of it ("choc", "muffin"),
+    # or if it only keeps consonants after the first letter and they appear in the word in order ("rsn", "dbl")
+    if len(piece) < 2 or piece[0] != candidate_word[0]:
+        return False
+    if candidate_word.startswith(piece):
+        return True
+    return not (set(piece[1:]) & _VOWELS) and _is_subsequence(piece, candidate_word)
+
+
+def cover(word, candidate_words):
+    """
+    Find the candidate words an uploaded word stands for: the word itself, or consecutive pieces of it
+    that each abbreviate a later candidate word (a prefix of it, or its consonants in order).
+    Handles shortened words ("rsn" for "raisins") and glued ones ("dblchocmuffin" for "double chocolate muffin"),
+    but not a different word that happens to share letters ("grape" is not "green apple").
+    Returns:
+        tuple: Indexes of the covered candidate words, or None if the word is not covered.
+    """
+    if word in candidate_words:
+        return (candidate_words.index(word),)
+
+    @lru_cache(maxsize=None)
+    def covered(start, first_word):
+        if start == len(word):
+            return ()
+        for index in range(first_word, len(candidate_words)):
+            for end in range(start + 2, len(word) + 1):
+                if not _abbreviates_word(word[start:end], candidate_words[index]):
+                    continue
+                rest = covered(end, index + 1)
+                if rest is not None:
+                    return (index,) + rest
+        return None
+
+    return covered(0, 0)
+
+
+def abbreviates(word, candidate_words):
+    """
+    Return True if an uploaded word is one of the candidate words or abbreviates some of them (see cover).
+    """
+    return cover(word, candidate_words) is not None
+
+
+def token_overlap(uploaded_words, candidate_words):
+    """
+    Two-sided word agreement: the harmonic mean of the share of uploaded words found in the candidate name
+    (spelled out or abbreviated) and the share of candidate words they account for, so a candidate with
+    words the upload does not mention ("Diet", "Vanilla") scores below 1.
+    """
+    if not uploaded_words or not candidate_words:
+        return 0.0
+    found = 0
+    used = set()
+    for word in uploaded_words:
+        indexes = cover(word, candidate_words)
+        if indexes is not None:
+            found += 1
+            used.update(indexes)
+    uploaded_share = found / len(uploaded_words)
+    candidate_share = len(used) / len(candidate_words)
+    if not uploaded_share or not candidate_share:
+        return 0.0
+    return 2 * uploaded_share * candidate_share / (uploaded_share + candidate_share)
+
+
+def size_agreement(uploaded_size, candidate_name):
+    """
+    Return 1 if the sizes agree, -1 if they contradict each other, 0 if one is unknown or they cannot be compared.
+    """
+    candidate_size = parse_size(candidate_name)
+    if uploaded_size is None or candidate_size is None:
+        return 0
+    compatible = sizes_compatible(uploaded_size, candidate_size)
+    return 0 if compatible is None else 1 if compatible else -1
+
+
+def candidate_features(uploaded_product, candidates, weights=SCORE_WEIGHTS):
+    """
+    Score the candidates of an uploaded product.
+    Args:
+        uploaded_product (str): The uploaded product name.
+        candidates (list): Dicts with 'datapoint_id', 'long_name' and 'cosine' (the neighbor similarity).
+        weights (dict): Weight of every feature in the score.
+
+    Returns:
+        list: CandidateFeatures, best score first.
+    """
+    uploaded_words = _words(uploaded_product)
+    uploaded_size = parse_size(uploaded_product)
+    features = []
+    for candidate in candidates:
+        overlap = token_overlap(uploaded_words, _words(candidate["long_name"] or ""))
+        size = size_agreement(uploaded_size, candidate["long_name"] or "")
+        score = (weights["cosine"] * candidate["cosine"] + weights["token_overlap"] * overlap
+                 + weights["size_agreement"] * size)
+        features.append(CandidateFeatures(candidate["datapoint_id"], candidate["cosine"], overlap, size, score))
+    return sorted(features, key=lambda feature: -feature.score)
+
+
+def score_margin(features):
+    """
+    Score difference between the best candidate and the runner-up (the best score if there is only one).
+    """
+    if not features:
+        return 0.0
+    return features[0].score - (features[1].score if len(features) > 1 else 0.0)
+
+
+def decide(features, thresholds):
+    """
+    Decide an uploaded product from its scored candidates.
+    Args:
+        features (list): CandidateFeatures, best score first.
+        thresholds (dict): `accept_score`, `accept_margin` and `reject_score`; a None score disables its decision.
+
+    Returns:
+        tuple: ("accept", datapoint_id), ("reject", None) or ("escalate", None).
+    """
+    if not features:
+        return "reject", None
+    best = features[0]
+    if (thresholds["accept_score"] is not None and best.score >= thresholds["accept_score"]
+            and score_margin(features) >= thresholds["accept_margin"] and best.size_agreement >= 0):
+        return "accept", best.datapoint_id
+    if thresholds["reject_score"] is not None and best.score < thresholds["reject_score"]:
+        return "reject", None
+    return "escalate", None
+
+
+def load_thresholds(path=RERANKER_THRESHOLDS_PATH):
+    """
+    Load the thresholds fitted by fit_reranker.py, falling back to the defaults.
+    """
+    if path and os.path.exists(path):
+        with open(path, mode="r", encoding="utf-8") as thresholds_file:
+            fitted = json.load(thresholds_file)
+        logging.info(f"Loaded reranker thresholds from {path}: {fitted['thresholds']}")
+        return dict(DEFAULT_THRESHOLDS, **fitted["thresholds"])
+    return dict(DEFAULT_THRESHOLDS)
+
+
+class LocalReranker:
+    """
+    Accepts, rejects or escalates to the LLM the semi-confident candidates of an uploaded product.
+    """
+
+    def __init__(self, thresholds=None):
+        self.thresholds = thresholds or load_thresholds()
+
+    def decide(self, uploaded_product, candidates):
+        """
+        Args:
+            uploaded_product (str): The uploaded product name.
+            candidates (list): Dicts with 'datapoint_id', 'long_name' and 'cosine'.
+
+        Returns:
+            tuple: ("accept", datapoint_id), ("reject", None) or ("escalate", None).
+        """
+        return decide(candidate_features(uploaded_product, candidates), self.thresholds)
+
+
+class VerdictLog:
+    """
+    Appends LLM verdicts to a JSON Lines file: the uploaded product, its candidates with their cosine
+    similarity, and the datapoint_id the LLM confirmed (or None).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, uploaded_product, candidates, verdict):
+        record = {"time": time.time(), "uploaded": uploaded_product, "candidates": candidates, "verdict": verdict}
+        with self._lock:
+            with open(self.path, mode="a", encoding="utf-8") as log_file:
+                log_file.write(json.dumps(record) + "\n")
+
+
+_reranker = None
+_verdict_log = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Return the process-wide local reranker, or None when it is disabled.
+    """
+    global _reranker
+    if not LOCAL_RERANKER:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = LocalReranker()
+        return _reranker
+
+
+def get_verdict_log():
+    """
+    Return the process-wide LLM verdict log, or None when RERANKER_VERDICT_LOG is not set.
+    """
+    global _verdict_log
+    if not RERANKER_VERDICT_LOG:
+        return None
+    with _reranker_lock:
+        if _verdict_log is None:
+            _verdict_log = VerdictLog(RERANKER_VERDICT_LOG)
+        return _verdict_log
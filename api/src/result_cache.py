@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from embedding_cache import normalize_cache_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Reuse final match results across requests; ":memory:" keeps them in RAM only, a file path survives restarts
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "true").lower() == "true"
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", ":memory:")
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 200000))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.environ.get("RESULT_CACHE_MEMORY_ENTRIES", 20000))
+
+# Bumped when the matching logic changes in a way that makes older results stale; the settings that change
+# decisions (thresholds, switches, model, prompts) are hashed into the version by the matching engine
+RESULT_CACHE_SCHEMA = "1"
+
+
+def make_result_key(text):
+    """
+    Key of an uploaded product: its text as produced by iter_uploaded_products (stripped, lowercased),
+    with Unicode and whitespace normalized.
+    """
+    return hashlib.sha256(normalize_cache_text(text.strip().lower()).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of final match results (status and matchedWith / possibleMatches payload) per uploaded text.
+    Every entry is tagged with the catalog/index version it was computed against; entries of another
+    version or older than the TTL are misses. An in-memory LRU sits in front of a SQLite table.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+                 max_entries=RESULT_CACHE_MAX_ENTRIES, memory_entries=RESULT_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            # Worker processes of match_cli.py may share the file: let readers and one writer work concurrently
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self._connection.commit()
+        # Upper bound of the row count, as in EmbeddingCache: the table is only counted again past max_entries
+        self._rows = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _valid(self, entry, version, now):
+        return entry[0] == version and now - entry[3] < self.ttl_seconds
+
+    def get_many(self, texts, version):
+        """
+        Look up the cached results of several uploaded texts.
+        Args:
+            texts (list): Uploaded product names.
+            version (str): Current catalog/index version.
+
+        Returns:
+            dict: text -> (status, payload) for every text with a valid cached result.
+        """
+        now = time.time()
+        keys = {make_result_key(text): text for text in texts}
+        found = {}
+        with self._lock:
+            disk_keys = []
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and self._valid(entry, version, now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry
+                else:
+                    disk_keys.append(key)
+
+            for start in range(0, len(disk_keys), 500):
+                chunk = disk_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, version, status, payload, created FROM results WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                fresh = []
+                for key, entry_version, status, payload, created in rows:
+                    entry = (entry_version, status, json.loads(payload) if payload else None, created)
+                    if self._valid(entry, version, now):
+                        found[key] = entry
+                        fresh.append(key)
+                        self._remember(key, entry)
+                if fresh:
+                    self._connection.executemany(
+                        "UPDATE results SET last_access = ? WHERE key = ?", [(now, key) for key in fresh]
+                    )
+            self._connection.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return {keys[key]: (entry[1], entry[2]) for key, entry in found.items()}
+
+    def put_many(self, results, version):
+        """
+        Store final results and evict the least recently used rows above the size limit.
+        Args:
+            results (dict): text -> (status, payload).
+            version (str): Catalog/index version the results were computed against.
+        """
+        if not results:
+            return
+        now = time.time()
+        rows = [
+            (make_result_key(text), version, status, json.dumps(payload) if payload is not None else None, now, now)
+            for text, (status, payload) in results.items()
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO results (key, version, status, payload, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            for key, _, status, _, _, _ in rows:
+                self._memory.pop(key, None)
+            self._rows += len(rows)
+            if self._rows > self.max_entries:
+                self._rows = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                if self._rows > self.max_entries:
+                    # Trim 5% below the limit so the next count is thousands of inserts away
+                    excess = self._rows - (self.max_entries - self.max_entries // 20)
+                    self._connection.execute(
+                        "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                        (excess,)
+                    )
+                    self._rows -= excess
+                    self.evictions += excess
+                    logging.info(f"Evicted {excess} results from the result cache.")
+            self._connection.commit()
+
+    def stats(self):
+        """
+        Return the hit/miss counters of the cache.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Return the process-wide result cache, or None when it is disabled.
+    """
+    global _result_cache
+    if not RESULT_CACHE:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
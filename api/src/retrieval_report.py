@@ -0,0 +1,145 @@
+import argparse
+import logging
+import random
+import time
+import numpy as np
+from benchmark_fakes import FakeEmbedder
+from hybrid_retrieval import HYBRID_LEXICAL_K, BM25Index, fuse_neighbors
+from match_benchmark import INTERNAL_CSV, load_catalog
+from normalization import normalize_product_text
+from vector_search import LocalNeighborSearch, Neighbor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Thresholds of the matching flow (matching_engine.py)
+CONFIDENT_THRESHOLD = 0.95
+SEMI_CONFIDENT_THRESHOLD = 0.7
+
+
+def labeled_queries(records, count, seed=0):
+    """
+    Labeled queries from the bundled catalog: the abbreviated NAME / OCS_NAME of an entry
+    (e.g. "3 Mskt DkChocMnt 1.24oz") must retrieve that entry, whose LONG_NAME is the only indexed name.
+    Returns:
+        list: (query, datapoint_id) pairs.
+    """
+    pairs = []
+    for datapoint_id, record in records.items():
+        long_key = normalize_product_text(record["long_name"])
+        for field in ("name", "ocs_name"):
+            if record.get(field) and normalize_product_text(record[field]) != long_key:
+                pairs.append((record[field], datapoint_id))
+    pairs = list(dict.fromkeys(pairs))
+    random.Random(seed).shuffle(pairs)
+    return pairs[:count]
+
+
+def embed(texts, embedder):
+    if embedder == "vertex":
+        from matching_engine import generate_embeddings_in_batches
+
+        return np.asarray(generate_embeddings_in_batches(texts), dtype=np.float32)
+    return FakeEmbedder().embed(texts)
+
+
+def outcome(neighbors, truth):
+    """
+    Classify one query the way the matching flow does and tell whether the result is right.
+    Returns:
+        str: "confident_correct", "confident_wrong", "llm_with_truth" (semi-confident, the right entry is
+        among the 5 candidates sent to the LLM), "llm_without_truth" or "none".
+    """
+    confident = [n for n in neighbors if n.distance > CONFIDENT_THRESHOLD]
+    if confident:
+        return "confident_correct" if confident[0].datapoint_id == truth else "confident_wrong"
+    semi = [n for n in neighbors if SEMI_CONFIDENT_THRESHOLD <= n.distance <= CONFIDENT_THRESHOLD][:5]
+    if semi:
+        return "llm_with_truth" if truth in {n.datapoint_id for n in semi} else "llm_without_truth"
+    return "none"
+
+
+def evaluate(rankings, truths):
+    """
+    Accuracy of a list of rankings (one list of Neighbor tuples per query) against the labels.
+    """
+    row = {"top1": 0.0, "recall@5": 0.0, "recall@10": 0.0}
+    outcomes = {}
+    for neighbors, truth in zip(rankings, truths):
+        ids = [n.datapoint_id for n in neighbors]
+        row["top1"] += ids[:1] == [truth]
+        row["recall@5"] += truth in ids[:5]
+        row["recall@10"] += truth in ids[:10]
+        result = outcome(neighbors, truth)
+        outcomes[result] = outcomes.get(result, 0) + 1
+    row = {name: value / len(truths) for name, value in row.items()}
+    row.update({name: count / len(truths) for name, count in outcomes.items()})
+    return row
+
+
+def run_report(records, queries, embedder="fake", k=10, lexical_k=HYBRID_LEXICAL_K):
+    """
+    Compare dense-only, BM25-only and fused retrieval on labeled queries.
+    Returns:
+        list: One dict per method with accuracy, classification outcomes and milliseconds per query.
+    """
+    ids = list(records)
+    texts = [query for query, _ in queries]
+    truths = [truth for _, truth in queries]
+    dense = LocalNeighborSearch(ids, embed([records[i]["long_name"] for i in ids], embedder), normalized=True)
+    bm25 = BM25Index(records, fields=("long_name",))
+    query_embeddings = embed(texts, embedder)
+
+    start = time.perf_counter()
+    dense_rankings = dense.find_neighbors(query_embeddings, neighbor_count=k)
+    dense_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    start = time.perf_counter()
+    lexical_rankings = [bm25.search(text, lexical_k) for text in texts]
+    bm25_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    start = time.perf_counter()
+    fused_rankings = fuse_neighbors(dense, query_embeddings, dense_rankings, lexical_rankings)
+    fusion_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    # BM25 alone has no cosine similarity: score its candidates with the dense model for the thresholds
+    similarities = dense.similarities(query_embeddings, [[i for i, _ in ranking] for ranking in lexical_rankings])
+    bm25_rankings = [
+        [Neighbor(datapoint_id, similarity) for (datapoint_id, _), similarity in zip(ranking, ranking_similarities)]
+        for ranking, ranking_similarities in zip(lexical_rankings, similarities)
+    ]
+
+    return [
+        dict(evaluate(dense_rankings, truths), method="vector", ms_per_query=dense_ms),
+        dict(evaluate(bm25_rankings, truths), method="bm25", ms_per_query=bm25_ms),
+        dict(evaluate(fused_rankings, truths), method="hybrid (rrf)", ms_per_query=dense_ms + bm25_ms + fusion_ms),
+    ]
+
+
+def print_report(rows, catalog_size, query_count, embedder):
+    print(f"Catalog: {catalog_size} entries (LONG_NAME indexed), {query_count} NAME/OCS_NAME queries, {embedder} embeddings")
+    columns = ("top1", "recall@5", "recall@10", "confident_correct", "confident_wrong", "llm_with_truth",
+               "llm_without_truth", "none")
+    print(f"{'method':<14}" + "".join(f"{column:>19}" for column in columns) + f"{'ms/query':>10}")
+    for row in rows:
+        print(f"{row['method']:<14}" + "".join(f"{row.get(column, 0.0):>19.3f}" for column in columns)
+              + f"{row['ms_per_query']:>10.3f}")
+    if embedder == "fake":
+        print("The 0.95 / 0.7 thresholds are calibrated for text-embedding-005: with fake embeddings, "
+              "only the ranking columns (top1, recall@k) are meaningful.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy and latency of vector, BM25 and fused retrieval on the bundled catalog.")
+    parser.add_argument("--internal-csv", default=INTERNAL_CSV, help="Catalog with NAME, OCS_NAME and LONG_NAME")
+    parser.add_argument("--query-count", type=int, default=2000)
+    parser.add_argument("--embedder", choices=("fake", "vertex"), default="fake",
+                        help="fake: offline hashed features; vertex: the production embedding model")
+    parser.add_argument("--k", type=int, default=10, help="Dense neighbors per query")
+    parser.add_argument("--lexical-k", type=int, default=HYBRID_LEXICAL_K, help="BM25 entries per query")
+    args = parser.parse_args()
+
+    records = load_catalog(args.internal_csv)
+    queries = labeled_queries(records, args.query_count)
+    rows = run_report(records, queries, args.embedder, args.k, args.lexical_k)
+    print_report(rows, len(records), len(queries), args.embedder)
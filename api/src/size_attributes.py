@@ -0,0 +1,248 @@
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+import numpy as np
+from bigquery_client import get_catalog_store
+from normalization import normalize_product_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Accept the only size-compatible semi-confident candidate without asking the LLM
+SIZE_AUTO_ACCEPT = os.environ.get("SIZE_AUTO_ACCEPT", "true").lower() == "true"
+# Relative difference under which two sizes are considered equal (rounding on labels)
+SIZE_TOLERANCE = float(os.environ.get("SIZE_TOLERANCE", 0.02))
+
+# Dimensions of a net quantity stored in the size table
+UNKNOWN, MASS, VOLUME, OUNCE = 0, 1, 2, 3
+
+# unit -> (dimension, factor to the base unit: grams, milliliters or ounces)
+# A bare "oz" is kept as its own dimension because labels use it for both weight and fluid ounces.
+UNITS = {
+    "mg": (MASS, 0.001),
+    "g": (MASS, 1.0),
+    "kg": (MASS, 1000.0),
+    "lb": (MASS, 453.592),
+    "lbs": (MASS, 453.592),
+    "ml": (VOLUME, 1.0),
+    "l": (VOLUME, 1000.0),
+    "ltr": (VOLUME, 1000.0),
+    "liter": (VOLUME, 1000.0),
+    "liters": (VOLUME, 1000.0),
+    "litre": (VOLUME, 1000.0),
+    "litres": (VOLUME, 1000.0),
+    "floz": (VOLUME, 29.5735),
+    "pt": (VOLUME, 473.176),
+    "qt": (VOLUME, 946.353),
+    "gal": (VOLUME, 3785.41),
+    "oz": (OUNCE, 1.0),
+}
+GRAMS_PER_OUNCE = 28.3495
+MILLILITERS_PER_FLUID_OUNCE = 29.5735
+
+# A package size: the net quantity (None if unknown) with its dimension, and the pack count (None if unknown)
+PackageSize = namedtuple("PackageSize", ["quantity", "dimension", "count"])
+
+_NET = re.compile(r"(\d+(?:\.\d+)?)(floz|lbs|lb|oz|gal|pt|qt|kg|mg|g|liters|litres|liter|litre|ltr|l|ml)\b")
+# "13/16oz", "1/2 gal", "1 1/2lb": a fraction, optionally after a whole number (but not after "pack of 2")
+_FRACTION = re.compile(r"(?:(?<!of )(?<![\d./])(\d{1,2})[ -])?(?<![\d./])(\d+)/(\d+)(?![\d/])")
+# "16ct", "6pk", "12 count", "pack of 16", "box of 60", "2 pack"
+_COUNT = re.compile(
+    r"(\d+)(?:ct|pk|pc|pcs)\b|(?<![a-z\d])(\d+) (?:count|pack)\b(?! of)|\b(?:pack|box|bag|case|carton|tray|set) of (\d+)\b"
+)
+# "1lb 2oz", "7lb8oz": pounds and ounces of one net weight
+_POUNDS_OUNCES = re.compile(r"(\d+(?:\.\d+)?)lbs? ?(\d+(?:\.\d+)?)oz\b")
+
+
+def _fraction_to_decimal(match):
+    # A proper fraction with a label-sized denominator is a quantity ("3/4oz" -> "0.75oz"); anything else
+    # ("40/50ct", "24/12oz", "#88/70") is a range or a case layout, and is dropped so its numbers are not
+    # read as a size
+    whole, numerator, denominator = match.group(1), int(match.group(2)), int(match.group(3))
+    if not 0 < numerator < denominator <= 32:
+        return " "
+    value = (int(whole) if whole else 0) + numerator / denominator
+    return f"{round(value, 4):g}"
+
+
+def parse_size(text):
+    """
+    Parse the package size of a product name: its net quantity and its pack count, separately.
+    Args:
+        text (str): The product name, e.g. "Kraft Singles American Cheese Slices (12oz, Pack of 16)",
+            "KraftSinglAmerChs16ct", "DIET MOUNTAIN DEW 20 OZ" or "Honey Nut Cheerios (13/16oz)".
+
+    Returns:
+        PackageSize: The parsed size, or None if neither a net quantity nor a count is found.
+        When several net quantities or counts appear, the last one of each is used.
+    """
+    # Fractions are resolved first: normalization turns the slash into a space ("13/16oz" -> "13 16oz")
+    text = normalize_product_text(_FRACTION.sub(_fraction_to_decimal, text))
+    quantity, dimension, count = None, UNKNOWN, None
+    pounds_ounces = _POUNDS_OUNCES.findall(text)
+    if pounds_ounces:
+        pounds, ounces = pounds_ounces[-1]
+        quantity, dimension = float(pounds) * UNITS["lb"][1] + float(ounces) * GRAMS_PER_OUNCE, MASS
+    else:
+        matches = _NET.findall(text)
+        if matches:
+            value, unit = matches[-1]
+            dimension, factor = UNITS[unit]
+            quantity = float(value) * factor
+    counts = _COUNT.findall(text)
+    if counts:
+        count = int(next(value for value in counts[-1] if value))
+    if quantity is None and count is None:
+        return None
+    return PackageSize(quantity, dimension, count)
+
+
+def _as_dimension(quantity, dimension, target):
+    # Bare ounces convert to grams or milliliters depending on what they are compared with
+    if dimension == target:
+        return quantity
+    if dimension == OUNCE and target == MASS:
+        return quantity * GRAMS_PER_OUNCE
+    if dimension == OUNCE and target == VOLUME:
+        return quantity * MILLILITERS_PER_FLUID_OUNCE
+    return None
+
+
+def _quantities_equal(first, second, tolerance=SIZE_TOLERANCE):
+    # None when the two net quantities cannot be compared (e.g. grams against milliliters)
+    target = first.dimension if first.dimension != OUNCE else second.dimension
+    a = _as_dimension(first.quantity, first.dimension, target)
+    b = _as_dimension(second.quantity, second.dimension, target)
+    if a is None or b is None:
+        return None
+    return abs(a - b) <= tolerance * max(a, b)
+
+
+def sizes_compatible(first, second, tolerance=SIZE_TOLERANCE):
+    """
+    Compare two parsed package sizes.
+    Net quantities are compared when both are known and in comparable dimensions, pack counts when both are known.
+    Returns:
+        bool: True if at least one comparison agrees and none disagrees, False if one disagrees,
+        None if nothing could be compared (e.g. a count against a weight), in which case the sizes are unknown.
+    """
+    results = []
+    if first.quantity is not None and second.quantity is not None:
+        results.append(_quantities_equal(first, second, tolerance))
+    if first.count is not None and second.count is not None:
+        results.append(first.count == second.count)
+    if False in results:
+        return False
+    return True if True in results else None
+
+
+class SizeTable:
+    """
+    Parsed package sizes of every catalog entry, stored column-wise in NumPy arrays.
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records (dict): datapoint_id -> dict with `name`, `ocs_name` and `long_name`.
+        """
+        self.row_by_id = {}
+        quantities = np.zeros(len(records), dtype=np.float32)
+        dimensions = np.zeros(len(records), dtype=np.int8)
+        # Pack counts, 0 when unknown
+        counts = np.zeros(len(records), dtype=np.int32)
+        for row, (datapoint_id, record) in enumerate(records.items()):
+            self.row_by_id[datapoint_id] = row
+            # The net quantity and the count each come from the first field that has one
+            for field in ("long_name", "name", "ocs_name"):
+                size = parse_size(record[field]) if record.get(field) else None
+                if size is None:
+                    continue
+                if size.quantity is not None and dimensions[row] == UNKNOWN:
+                    quantities[row], dimensions[row] = size.quantity, size.dimension
+                if size.count is not None and counts[row] == 0:
+                    counts[row] = size.count
+        self.quantities = quantities
+        self.dimensions = dimensions
+        self.counts = counts
+        known = int(np.count_nonzero((dimensions != UNKNOWN) | (counts != 0)))
+        logging.info(f"Parsed sizes for {known} of {len(records)} catalog entries.")
+
+    def get(self, datapoint_id):
+        """
+        Return the parsed PackageSize of a catalog entry, or None if unknown.
+        """
+        row = self.row_by_id.get(datapoint_id)
+        if row is None or (self.dimensions[row] == UNKNOWN and self.counts[row] == 0):
+            return None
+        known_quantity = self.dimensions[row] != UNKNOWN
+        return PackageSize(
+            float(self.quantities[row]) if known_quantity else None,
+            int(self.dimensions[row]),
+            int(self.counts[row]) if self.counts[row] else None,
+        )
+
+    def filter_candidates(self, uploaded_product, candidates):
+        """
+        Drop the candidates whose size contradicts the uploaded product's size.
+        Candidates whose size is unknown or cannot be compared (a count against a weight) are kept.
+        Args:
+            uploaded_product (str): The uploaded product name.
+            candidates (list): Candidate matches (dicts with 'datapoint_id').
+
+        Returns:
+            tuple: (kept candidates, True if every kept candidate has a size equal to the uploaded one).
+        """
+        uploaded_size = parse_size(uploaded_product)
+        if uploaded_size is None:
+            return candidates, False
+        kept = []
+        all_verified = True
+        for candidate in candidates:
+            size = self.get(candidate["datapoint_id"])
+            compatible = sizes_compatible(uploaded_size, size) if size is not None else None
+            if compatible is False:
+                continue
+            if compatible is None:
+                all_verified = False
+            kept.append(candidate)
+        return kept, all_verified
+
+
+_size_table = None
+_size_table_lock = threading.Lock()
+
+
+def create_size_table(store):
+    """
+    Build a new size table from a catalog metadata store, loading the store if needed.
+    Returns None when the store is not fully loaded.
+    """
+    store.prefetch([])
+    if not store.preload:
+        logging.warning("Catalog metadata is not preloaded; size filtering is disabled.")
+        return None
+    return SizeTable(store.records())
+
+
+def get_size_table():
+    """
+    Return the process-wide size table, built from the catalog metadata store on first use.
+    Returns None when the catalog is not fully loaded.
+    """
+    global _size_table
+    with _size_table_lock:
+        if _size_table is None:
+            _size_table = create_size_table(get_catalog_store())
+        return _size_table
+
+
+def set_size_table(table):
+    """
+    Replace the process-wide size table, e.g. with the one of a newly loaded catalog snapshot.
+    """
+    global _size_table
+    with _size_table_lock:
+        _size_table = table
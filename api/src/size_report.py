@@ -0,0 +1,85 @@
+import argparse
+import logging
+import sys
+from match_benchmark import INTERNAL_CSV, load_catalog
+from size_attributes import MASS, OUNCE, UNKNOWN, VOLUME, PackageSize, parse_size, sizes_compatible
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Product names whose parsed size has been wrong before, with the size they must parse to
+SIZE_CASES = [
+    ("DIET MOUNTAIN DEW 20 OZ", PackageSize(20.0, OUNCE, None)),
+    ("Kraft Singles American Cheese Slices (12oz, Pack of 16)", PackageSize(12.0, OUNCE, 16)),
+    ("KraftSinglAmerChs16ct", PackageSize(None, UNKNOWN, 16)),
+    ("Similac 7lb8oz", PackageSize(7 * 453.592 + 8 * 28.3495, MASS, None)),
+    ("Honey Nut Cheerios (13/16oz)", PackageSize(0.8125, OUNCE, None)),
+    ("Kraft Philadelphia Cream Cheese 1/3 Less Fat (3/4oz, Box of 100)", PackageSize(0.75, OUNCE, 100)),
+    ("Southern Recipe Sweet BBQ Pork Rinds (7/8oz)", PackageSize(0.875, OUNCE, None)),
+    ("Milk 1/2 gal", PackageSize(0.5 * 3785.41, VOLUME, None)),
+    ("Milk 1 1/2 gal", PackageSize(1.5 * 3785.41, VOLUME, None)),
+    ("Middletown 4500 1/4 lb. Bacon Cheeseburger (6.5oz)", PackageSize(6.5, OUNCE, None)),
+    ("MGF 0650 1/4lb Cheeseburger", PackageSize(0.25 * 453.592, MASS, None)),
+    ("Coca Cola 2 Liter", PackageSize(2000.0, VOLUME, None)),
+    ("Fanta 1.5 litres", PackageSize(1500.0, VOLUME, None)),
+    # Ranges and case layouts are not sizes
+    ("Baldor Peaches #PCH1 (Pack of 40/50)", None),
+    ("Seajoy 55/65 Tail On Cooked Shrimp (1lb)", PackageSize(453.592, MASS, None)),
+]
+
+
+def check_cases(cases=SIZE_CASES):
+    """
+    Parse every regression case.
+    Returns:
+        list: (text, expected, parsed) for every case that does not parse to its expected size.
+    """
+    failures = []
+    for text, expected in cases:
+        parsed = parse_size(text)
+        if expected is None or parsed is None:
+            ok = parsed == expected
+        else:
+            ok = parsed.count == expected.count and (
+                parsed.quantity == expected.quantity if expected.quantity is None
+                else parsed.dimension == expected.dimension and sizes_compatible(parsed, expected) is True
+            )
+        if not ok:
+            failures.append((text, expected, parsed))
+    return failures
+
+
+def catalog_contradictions(records):
+    """
+    Catalog entries whose NAME or OCS_NAME size contradicts the size of their LONG_NAME.
+    Returns:
+        list: (field value, LONG_NAME) pairs.
+    """
+    contradictions = []
+    for record in records.values():
+        long_size = parse_size(record["long_name"])
+        if long_size is None:
+            continue
+        for field in ("name", "ocs_name"):
+            size = parse_size(record[field]) if record.get(field) else None
+            if size is not None and sizes_compatible(size, long_size) is False:
+                contradictions.append((record[field], record["long_name"]))
+    return contradictions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Size parser regression cases and catalog size contradictions.")
+    parser.add_argument("--internal-csv", default=INTERNAL_CSV, help="Catalog with NAME, OCS_NAME and LONG_NAME")
+    parser.add_argument("--show", type=int, default=20, help="Catalog contradictions to print")
+    args = parser.parse_args()
+
+    failures = check_cases()
+    print(f"Regression cases: {len(SIZE_CASES) - len(failures)} of {len(SIZE_CASES)} pass")
+    for text, expected, parsed in failures:
+        print(f"  {text!r}: expected {expected}, parsed {parsed}")
+
+    contradictions = catalog_contradictions(load_catalog(args.internal_csv))
+    print(f"Catalog entries whose NAME/OCS_NAME size contradicts the LONG_NAME: {len(contradictions)}")
+    for value, long_name in contradictions[:args.show]:
+        print(f"  {value!r} vs {long_name!r}")
+    sys.exit(1 if failures else 0)
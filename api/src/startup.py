@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+from bigquery_client import get_catalog_store
+from catalog import get_catalog
+from hybrid_retrieval import get_bm25_index
+from lexical_index import get_lexical_index
+from matching_engine import get_genai_client, get_llm
+from size_attributes import get_size_table
+from vector_search import get_neighbor_search
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Warm up in a background thread when the app starts, and how long to wait before retrying failed steps
+WARM_UP_ON_START = os.environ.get("WARM_UP_ON_START", "true").lower() == "true"
+WARM_UP_RETRY_SECONDS = int(os.environ.get("WARM_UP_RETRY_SECONDS", 30))
+
+
+def _load_catalog():
+    get_catalog_store().prefetch([])
+
+
+# (name, function, required for readiness). Every function is idempotent: the underlying
+# singletons are created on first use and reused afterwards.
+WARM_UP_STEPS = [
+    ("catalog", _load_catalog, True),
+    ("lexical_index", get_lexical_index, False),
+    ("bm25_index", get_bm25_index, False),
+    ("size_table", get_size_table, False),
+    ("neighbor_search", get_neighbor_search, True),
+    ("catalog_snapshot", get_catalog, True),
+    ("genai_client", get_genai_client, True),
+    ("llm", get_llm, True),
+]
+
+
+class WarmUp:
+    """
+    Initializes the clients and indexes ahead of the first request and tracks their readiness.
+    A failed step is logged and retried later instead of stopping the process.
+    """
+
+    def __init__(self, steps=WARM_UP_STEPS, retry_seconds=WARM_UP_RETRY_SECONDS):
+        self.steps = steps
+        self.retry_seconds = retry_seconds
+        self.status = {name: {"status": "pending", "seconds": None, "error": None} for name, _, _ in steps}
+        self._last_attempt = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Run every step that is not ready yet, in order.
+        """
+        self._last_attempt = time.monotonic()
+        for name, function, _ in self.steps:
+            if self.status[name]["status"] == "ready":
+                continue
+            self.status[name] = {"status": "running", "seconds": None, "error": None}
+            start = time.perf_counter()
+            try:
+                function()
+                self.status[name] = {"status": "ready", "seconds": round(time.perf_counter() - start, 3), "error": None}
+                logging.info(f"Warm-up step '{name}' ready in {time.perf_counter() - start:.2f} seconds.")
+            except Exception as e:
+                self.status[name] = {"status": "failed", "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+                logging.error(f"Warm-up step '{name}' failed: {str(e)}")
+
+    def start(self):
+        """
+        Run the warm-up in a background thread, unless one is already running.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Start the warm-up if needed and wait for it to finish.
+        """
+        self.start()
+        self._thread.join(timeout)
+
+    def readiness(self):
+        """
+        Return whether every required step is ready, with the status of each step.
+        Failed steps are retried in the background once `retry_seconds` have passed.
+        """
+        ready = all(self.status[name]["status"] == "ready" for name, _, required in self.steps if required)
+        failed = any(step["status"] == "failed" for step in self.status.values())
+        if failed and time.monotonic() - (self._last_attempt or 0) >= self.retry_seconds:
+            self.start()
+        return {"ready": ready, "steps": {name: dict(step) for name, step in self.status.items()}}
+
+
+_warm_up = WarmUp()
+
+
+def get_warm_up():
+    """
+    Return the process-wide warm-up tracker.
+    """
+    return _warm_up
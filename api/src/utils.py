@@ -1,8 +1,69 @@
+import json
+import logging
+import os
 from google.cloud import storage
+from clients import get_client, mount_http_pool, register_client
+
+# Local directory keeping downloaded GCS objects between requests (and restarts, if it is a mounted volume)
+GCS_CACHE_DIR = os.environ.get("GCS_CACHE_DIR", "/tmp/gcs_cache")
+GCS_PROJECT_ID = os.environ.get("GCS_PROJECT_ID", "genai-product-matching")
+
+register_client("storage", lambda: mount_http_pool(storage.Client(project=GCS_PROJECT_ID)))
+
+
+def get_storage_client():
+    """
+    Return the process-wide Cloud Storage client, creating it on first use.
+    """
+    return get_client("storage")
+
+
+def download_gcs_file_cached(bucket_name, file_name, cache_dir=GCS_CACHE_DIR):
+    """
+    Download a GCS object to the local cache, unless the cached copy has the same generation.
+    Only the object metadata is fetched when the copy is current. If GCS cannot be reached,
+    an existing cached copy is returned as is.
+    Args:
+        bucket_name (str): The name of the GCS bucket.
+        file_name (str): The name of the file in the bucket.
+        cache_dir (str): Local cache directory.
+
+    Returns:
+        str: The path of the local copy.
+    """
+    local_path = os.path.join(cache_dir, bucket_name, file_name)
+    meta_path = local_path + ".meta.json"
+    cached_generation = None
+    if os.path.exists(local_path) and os.path.exists(meta_path):
+        with open(meta_path, mode="r", encoding="utf-8") as meta_file:
+            cached_generation = json.load(meta_file).get("generation")
+
+    try:
+        blob = get_storage_client().bucket(bucket_name).get_blob(file_name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{bucket_name}/{file_name} does not exist.")
+        if cached_generation is not None and str(blob.generation) == cached_generation:
+            logging.info(f"Using cached gs://{bucket_name}/{file_name} (generation {cached_generation}).")
+            return local_path
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        # Download next to the cached copy and swap, so readers never see a partial file
+        blob.download_to_filename(local_path + ".part")
+        os.replace(local_path + ".part", local_path)
+        with open(meta_path, mode="w", encoding="utf-8") as meta_file:
+            json.dump({"generation": str(blob.generation), "etag": blob.etag}, meta_file)
+        logging.info(f"Downloaded gs://{bucket_name}/{file_name} (generation {blob.generation}) to {local_path}.")
+        return local_path
+    except Exception as e:
+        if cached_generation is None:
+            raise
+        logging.warning(f"Could not revalidate gs://{bucket_name}/{file_name}, using the cached copy: {str(e)}")
+        return local_path
+
 
 def load_internal_products_from_gcs(project_id, bucket_name, file_name):
     """
     Load internal products from a file in Google Cloud Storage.
+    The file is cached locally and only downloaded again when its generation changes.
     Args:
         bucket_name (str): The name of the GCS bucket.
         file_name (str): The name of the file in the bucket.
@@ -10,8 +71,6 @@ def load_internal_products_from_gcs(project_id, bucket_name, file_name):
     Returns:
         list: A list of internal product names.
     """
-    client = storage.Client(project=project_id)  # Replace with your GCP project ID
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(file_name)
-    content = blob.download_as_text()
-    return content.splitlines()
\ No newline at end of file
+    local_path = download_gcs_file_cached(bucket_name, file_name)
+    with open(local_path, mode="r", encoding="utf-8") as file:
+        return file.read().splitlines()
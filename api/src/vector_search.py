@@ -0,0 +1,328 @@
+import csv
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from google.cloud import aiplatform_v1
+from embedding_store import load_embedding_store
+from rate_limiter import get_rate_limiter, is_quota_error
+from metrics import record_upstream_call
+from micro_batcher import get_micro_batcher
+from clients import GRPC_KEEPALIVE_OPTIONS, ClientPool, get_client, grpc_channel_ready, register_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Set variables for the current deployed index; a catalog reload can point at another index endpoint
+# or deployment on the same API endpoint (see catalog.py)
+API_ENDPOINT = os.environ.get("VECTOR_SEARCH_API_ENDPOINT", "8241972.northamerica-northeast1-123728674703.vdb.vertexai.goog")
+INDEX_ENDPOINT = os.environ.get(
+    "VECTOR_SEARCH_INDEX_ENDPOINT",
+    "projects/123728674703/locations/northamerica-northeast1/indexEndpoints/4730925855436439552",
+)
+DEPLOYED_INDEX_ID = os.environ.get("VECTOR_SEARCH_DEPLOYED_INDEX_ID", "product_matching_deployment")
+
+# Backend selection ("vertex" or "local") and the embeddings used by the local index:
+# either the id/embedding CSV table or a binary `.npy` store written by embedding_store.py
+VECTOR_SEARCH_BACKEND = os.environ.get("VECTOR_SEARCH_BACKEND", "vertex")
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "id_embedding_table.csv")
+# Number of gRPC channels to the index endpoint shared by all request threads
+VECTOR_SEARCH_CHANNELS = int(os.environ.get("VECTOR_SEARCH_CHANNELS", 2))
+# Compression of the local index: "none" (exact float search), "int8" or "pq" (see quantized_index.py),
+# and the number of candidates re-scored exactly against the full vectors
+LOCAL_INDEX_QUANTIZATION = os.environ.get("LOCAL_INDEX_QUANTIZATION", "none")
+LOCAL_INDEX_SHORTLIST = int(os.environ.get("LOCAL_INDEX_SHORTLIST", 100))
+
+# A single nearest neighbor, independent of the backend that produced it.
+# `distance` follows the Vertex index semantics (dot product, higher is closer).
+Neighbor = namedtuple("Neighbor", ["datapoint_id", "distance"])
+
+
+def exact_similarities(matrix, rows, embeddings, candidate_ids):
+    """
+    Cosine similarity of every query embedding with its own list of catalog ids.
+    Args:
+        matrix (ndarray): L2-normalized catalog embeddings.
+        rows (dict): datapoint_id -> row of `matrix`.
+        embeddings (list): Query embeddings.
+        candidate_ids (list): One list of datapoint ids per query.
+
+    Returns:
+        list: One list of similarities per query, None for ids that are not in the index.
+    """
+    results = []
+    for embedding, query_ids in zip(embeddings, candidate_ids):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        known = [rows[datapoint_id] for datapoint_id in query_ids if datapoint_id in rows]
+        scores = iter(np.asarray(matrix[known], dtype=np.float32) @ query if known else [])
+        results.append([float(next(scores)) if datapoint_id in rows else None for datapoint_id in query_ids])
+    return results
+
+
+def create_match_service_client(api_endpoint=API_ENDPOINT):
+    """
+    Create a MatchServiceClient whose gRPC channel sends keepalive pings.
+    """
+    from google.cloud.aiplatform_v1.services.match_service.transports import MatchServiceGrpcTransport
+
+    def create_channel(*args, options=(), **kwargs):
+        return MatchServiceGrpcTransport.create_channel(*args, options=list(options) + GRPC_KEEPALIVE_OPTIONS, **kwargs)
+
+    transport = MatchServiceGrpcTransport(host=api_endpoint, channel=create_channel)
+    return aiplatform_v1.MatchServiceClient(transport=transport)
+
+
+# The index endpoint is reached through a small pool of long-lived channels shared by every request
+register_client(
+    "vector_search",
+    lambda: ClientPool(create_match_service_client() for _ in range(VECTOR_SEARCH_CHANNELS)),
+    lambda client: grpc_channel_ready(client.transport.grpc_channel),
+)
+
+
+class VertexNeighborSearch:
+    """
+    Neighbor search backed by the deployed Vertex AI Vector Search index.
+    Calls go through the pooled "vector_search" client and are paced by the shared "vector_search" rate limiter.
+    """
+
+    def __init__(self, index_endpoint=INDEX_ENDPOINT, deployed_index_id=DEPLOYED_INDEX_ID):
+        self.index_endpoint = index_endpoint
+        self.deployed_index_id = deployed_index_id
+        # Identifies the index contents for caches; a re-embed is deployed under a new index endpoint
+        self.version = f"vertex:{index_endpoint}/{deployed_index_id}"
+
+    def find_neighbors(self, embeddings, neighbor_count=10):
+        """
+        Query the deployed index for the nearest neighbors of each embedding.
+        With MICRO_BATCHING, the queries join those of concurrent requests in shared calls.
+        Args:
+            embeddings (list): List of query embeddings.
+            neighbor_count (int): Number of nearest neighbors to retrieve per query.
+
+        Returns:
+            list: One list of Neighbor tuples per query, closest first.
+        """
+        batcher = get_micro_batcher("vector_search", _find_neighbors_micro_batch)
+        if batcher is not None:
+            return batcher.map(list(embeddings), key=(self, neighbor_count))
+        return self.query(embeddings, neighbor_count)
+
+    def query(self, embeddings, neighbor_count=10):
+        """
+        Send the queries of every embedding in one find_neighbors call.
+        """
+        queries = [
+            aiplatform_v1.FindNeighborsRequest.Query(
+                datapoint=aiplatform_v1.IndexDatapoint(feature_vector=embedding),
+                neighbor_count=neighbor_count
+            )
+            for embedding in embeddings
+        ]
+        request = aiplatform_v1.FindNeighborsRequest(
+            index_endpoint=self.index_endpoint,
+            deployed_index_id=self.deployed_index_id,
+            queries=queries,
+            return_full_datapoint=False,
+        )
+        rate_limiter = get_rate_limiter("vector_search")
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = get_client("vector_search").find_neighbors(request)
+        except Exception as e:
+            if is_quota_error(e):
+                rate_limiter.penalize()
+            record_upstream_call("vector_search", "quota_error" if is_quota_error(e) else "error", time.perf_counter() - start)
+            raise
+        record_upstream_call("vector_search", "success", time.perf_counter() - start)
+        rate_limiter.reward()
+        return [
+            [Neighbor(n.datapoint.datapoint_id, n.distance) for n in query_result.neighbors]
+            for query_result in response.nearest_neighbors
+        ]
+
+
+def _find_neighbors_micro_batch(key, embeddings):
+    # Queries are only grouped per index (a catalog reload swaps the instance) and neighbor count
+    search, neighbor_count = key
+    return search.query(embeddings, neighbor_count)
+
+
+class LocalNeighborSearch:
+    """
+    Exact in-process neighbor search over the catalog embeddings.
+    Vectors are L2-normalized once at load time, so a matrix multiply gives the cosine similarity,
+    which is what the Vertex index returns for the normalized text-embedding-005 vectors.
+    Pre-normalized matrices (e.g. a memory-mapped binary store) are used as-is, without a copy.
+    """
+
+    def __init__(self, ids, embeddings, query_block_size=256, normalized=False, catalog_block_size=8192):
+        if normalized:
+            matrix = embeddings
+        else:
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError("Embeddings must be a 2D array with one row per id.")
+        self.ids = list(ids)
+        self.embeddings = matrix
+        self.query_block_size = query_block_size
+        self.catalog_block_size = catalog_block_size
+        self.version = None
+        self._rows = None
+
+    @classmethod
+    def from_store(cls, path):
+        """
+        Build the index from a binary embedding store, memory-mapped so worker processes share it.
+        Args:
+            path (str): Path to the `.npy` matrix written by embedding_store.py.
+
+        Returns:
+            LocalNeighborSearch: The loaded index.
+        """
+        ids, matrix, _ = load_embedding_store(path, mmap=True)
+        index = cls(ids, matrix, normalized=True)
+        index.version = f"file:{os.path.getmtime(path)}"
+        return index
+
+    def _scores(self, queries):
+        if self.embeddings.dtype == np.float32:
+            return queries @ self.embeddings.T
+        # Half-precision stores are scored block by block so the matrix is never upcast as a whole
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), self.catalog_block_size):
+            block = np.asarray(self.embeddings[start:start + self.catalog_block_size], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    @classmethod
+    def from_csv(cls, path=LOCAL_INDEX_PATH):
+        """
+        Build the index from the id/embedding table written by generate_and_upload_embeddings.py.
+        Args:
+            path (str): Path to the CSV file with `id` and `embedding` (JSON list) columns.
+
+        Returns:
+            LocalNeighborSearch: The loaded index.
+        """
+        ids = []
+        embeddings = []
+        with open(path, mode="r", encoding="utf-8") as csv_file:
+            reader = csv.DictReader(csv_file)
+            for row in reader:
+                ids.append(row["id"])
+                embeddings.append(json.loads(row["embedding"]))
+        logging.info(f"Loaded {len(ids)} embeddings into the local index from {path}.")
+        index = cls(ids, embeddings)
+        index.version = f"file:{os.path.getmtime(path)}"
+        return index
+
+    def find_neighbors(self, embeddings, neighbor_count=10):
+        """
+        Return the top-k catalog entries for each query embedding by cosine similarity.
+        Args:
+            embeddings (list): List of query embeddings.
+            neighbor_count (int): Number of nearest neighbors to retrieve per query.
+
+        Returns:
+            list: One list of Neighbor tuples per query, closest first.
+        """
+        if len(embeddings) == 0:
+            return []
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+        k = min(neighbor_count, len(self.ids))
+
+        results = []
+        for start in range(0, len(queries), self.query_block_size):
+            scores = self._scores(queries[start:start + self.query_block_size])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for row_ids, row_scores in zip(top, top_scores):
+                results.append([Neighbor(self.ids[j], float(s)) for j, s in zip(row_ids, row_scores)])
+        return results
+
+    def similarities(self, embeddings, candidate_ids):
+        """
+        Return the cosine similarity of every query embedding with its own list of catalog ids,
+        e.g. candidates found by another retriever (see exact_similarities).
+        """
+        if self._rows is None:
+            self._rows = {datapoint_id: row for row, datapoint_id in enumerate(self.ids)}
+        return exact_similarities(self.embeddings, self._rows, embeddings, candidate_ids)
+
+
+_local_index = None
+_vertex_search = None
+_neighbor_search_override = None
+
+
+def set_neighbor_search(search):
+    """
+    Serve every get_neighbor_search() call without an explicit backend from the given object,
+    e.g. a local stand-in for benchmarks. Pass None to go back to the configured backend.
+    """
+    global _neighbor_search_override
+    _neighbor_search_override = search
+
+
+def load_local_index(path=LOCAL_INDEX_PATH, quantization=LOCAL_INDEX_QUANTIZATION):
+    """
+    Load a new in-process index from a binary embedding store (`.npy`) or an id/embedding CSV.
+    Args:
+        path (str): Path to the embeddings.
+        quantization (str): "none", "int8" or "pq" (see quantized_index.py).
+
+    Returns:
+        LocalNeighborSearch or QuantizedNeighborSearch: The loaded index.
+    """
+    if path.endswith(".npy"):
+        index = LocalNeighborSearch.from_store(path)
+    else:
+        index = LocalNeighborSearch.from_csv(path)
+    if quantization != "none":
+        from quantized_index import QuantizedNeighborSearch, build_quantizer
+
+        quantized = QuantizedNeighborSearch(
+            index.ids, index.embeddings, build_quantizer(quantization), shortlist_size=LOCAL_INDEX_SHORTLIST,
+        )
+        quantized.version = f"{index.version}:{quantization}"
+        index = quantized
+    return index
+
+
+def get_neighbor_search(backend=None):
+    """
+    Return the configured neighbor-search backend.
+    Both backends are created once per process and reused across requests.
+    Args:
+        backend (str): "vertex" or "local". Defaults to the VECTOR_SEARCH_BACKEND environment variable.
+
+    Returns:
+        An object exposing find_neighbors(embeddings, neighbor_count).
+    """
+    global _local_index, _vertex_search
+    if backend is None and _neighbor_search_override is not None:
+        return _neighbor_search_override
+    backend = backend or VECTOR_SEARCH_BACKEND
+    if backend == "local":
+        if _local_index is None:
+            _local_index = load_local_index()
+        return _local_index
+    if backend == "vertex":
+        if _vertex_search is None:
+            _vertex_search = VertexNeighborSearch()
+        return _vertex_search
+    raise ValueError(f"Unknown vector search backend: {backend}")
@@ -1,9 +1,12 @@
+import argparse
 import csv
+import hashlib
 import json
 import uuid
 import logging
 import time
 import os
+from collections import Counter
 from google.cloud import storage
 from google import genai
 from google.genai.types import EmbedContentConfig
@@ -26,6 +29,126 @@ output_csv = "c:\\projects\\genai-product-matching\\data\\processed\\id_embeddin
 bucket_name = "genai-product-matching-data"  # GCS bucket name
 gcs_path = "contents/internal_products.json"  # Path in the GCS bucket
 
+# Incremental mode state: hashes of the last published run, the in-progress checkpoint and the index delta
+manifest_path = "c:\\projects\\genai-product-matching\\data\\processed\\embedding_manifest.json"
+checkpoint_path = "c:\\projects\\genai-product-matching\\data\\processed\\embedding_checkpoint.jsonl"
+delta_dir = "c:\\projects\\genai-product-matching\\data\\processed\\delta"
+gcs_delta_path = "contents/delta"  # Path in the GCS bucket for Vertex AI incremental index updates
+
+# Embedding settings (part of each row's content hash, so changing them re-embeds the catalog)
+EMBEDDING_MODEL = "text-embedding-005"
+EMBEDDING_TASK_TYPE = "SEMANTIC_SIMILARITY"
+EMBEDDING_DIMENSIONALITY = 768
+
+# Namespace of the deterministic datapoint ids
+DATAPOINT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-3d1b-4b8e-9a57-2f0c8d4e7b19")
+CATALOG_COLUMNS = ("NAME", "OCS_NAME", "LONG_NAME")
+
+def row_columns(row):
+    """
+    Stripped NAME, OCS_NAME and LONG_NAME values of a catalog row.
+    """
+    return [(row.get(column) or "").strip() for column in CATALOG_COLUMNS]
+
+def new_datapoint_id(seed, taken):
+    """
+    Derive the id of a row seen for the first time from `seed`, avoiding the ids in `taken`.
+    """
+    datapoint_id = str(uuid.uuid5(DATAPOINT_ID_NAMESPACE, seed))
+    attempt = 0
+    while datapoint_id in taken:
+        attempt += 1
+        datapoint_id = str(uuid.uuid5(DATAPOINT_ID_NAMESPACE, f"{seed}\x1f{attempt}"))
+    return datapoint_id
+
+def assign_datapoint_ids(rows, manifest, key_column=None):
+    """
+    Give every catalog row its datapoint id, keeping the ids of the last run so BigQuery, the vector index
+    and the caches holding ids do not churn when a row is edited.
+    With a key column (e.g. a SKU), the id is derived from the key alone. Without one, a row keeps the id
+    of the previous row it is identical to, or else of the one previous row sharing its NAME, OCS_NAME or
+    LONG_NAME value (so editing one of the three keeps the id). Other rows get an id derived from their values.
+    Args:
+        rows (list): Catalog rows with a LONG_NAME, in file order.
+        manifest (dict): The last run's manifest (see load_manifest).
+        key_column (str): Optional column holding a stable catalog key.
+
+    Returns:
+        dict: datapoint_id -> row, in file order. Duplicate rows (same key, or same values) are kept once.
+    """
+    if key_column:
+        ids = {}
+        for row in rows:
+            key = (row.get(key_column) or "").strip()
+            if not key:
+                logging.warning(f"Skipping row with missing or empty '{key_column}': {row}")
+                continue
+            datapoint_id = str(uuid.uuid5(DATAPOINT_ID_NAMESPACE, f"{key_column}\x1f{key}"))
+            if datapoint_id in ids:
+                logging.warning(f"Skipping row with duplicate '{key_column}': {row}")
+                continue
+            ids[datapoint_id] = row
+        return ids
+
+    unique_rows = {}
+    for row in rows:
+        columns = tuple(row_columns(row))
+        if columns in unique_rows:
+            logging.warning(f"Skipping duplicate row: {row}")
+            continue
+        unique_rows[columns] = row
+
+    # Previous ids by their exact values, and by each single column value
+    previous_by_columns = {}
+    previous_by_value = [{} for _ in CATALOG_COLUMNS]
+    for datapoint_id, entry in manifest.items():
+        if entry["columns"] is None:
+            # Written before the values were recorded; those ids were derived from the values (see below)
+            continue
+        previous_by_columns[tuple(entry["columns"])] = datapoint_id
+        for index, value in enumerate(entry["columns"]):
+            if value:
+                previous_by_value[index].setdefault(value, []).append(datapoint_id)
+
+    assigned = {}
+    for columns in unique_rows:
+        datapoint_id = previous_by_columns.get(columns)
+        if datapoint_id is None:
+            legacy_id = str(uuid.uuid5(DATAPOINT_ID_NAMESPACE, "\x1f".join(columns)))
+            if manifest.get(legacy_id, {}).get("columns", ()) is None:
+                datapoint_id = legacy_id
+        if datapoint_id is not None:
+            assigned[columns] = datapoint_id
+    taken = set(assigned.values())
+
+    # Edited rows: a value shared with exactly one previous row and one unassigned current row
+    unassigned = [columns for columns in unique_rows if columns not in assigned]
+    current_counts = [Counter(columns[index] for columns in unassigned) for index in range(len(CATALOG_COLUMNS))]
+    for columns in unassigned:
+        for index, value in enumerate(columns):
+            candidates = previous_by_value[index].get(value, []) if value else []
+            if len(candidates) == 1 and current_counts[index][value] == 1 and candidates[0] not in taken:
+                assigned[columns] = candidates[0]
+                taken.add(candidates[0])
+                break
+
+    ids = {}
+    taken.update(manifest)
+    for columns, row in unique_rows.items():
+        datapoint_id = assigned.get(columns)
+        if datapoint_id is None:
+            datapoint_id = new_datapoint_id("\x1f".join(columns), taken)
+            taken.add(datapoint_id)
+        ids[datapoint_id] = row
+    return ids
+
+def content_hash(text):
+    """
+    Hash of the embedded text and the embedding settings; a row is re-embedded when it changes.
+    """
+    payload = "\x1f".join([EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, str(EMBEDDING_DIMENSIONALITY), text])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 def save_failed_batches(failed_batches, failed_batches_file="failed_batches.json"):
     """
     Save failed batches to a JSON file, appending to existing ones if the file already exists.
@@ -51,103 +174,261 @@ def exponential_backoff(attempt, base_delay=15, max_delay=300):
     logging.info(f"Retrying in {delay} seconds...")
     time.sleep(delay)
 
-def generate_embeddings_in_batches(texts, batch_size=250, retries=5, delay_between_batches=10):
+def embed_batch(batch, retries=5):
     """
-    Generate embeddings for a list of texts in batches with exponential backoff for retries.
+    Generate embeddings for a single batch of texts (one API call) with exponential backoff.
     Args:
-        texts (list): List of texts to generate embeddings for.
-        batch_size (int): Number of texts per batch.
+        batch (list): Texts to embed, at most 250.
         retries (int): Number of retries for transient errors.
-        delay_between_batches (int): Delay (in seconds) between batches to avoid hitting quotas.
-    """
-    embeddings = []
-    failed_batches = []
-    failed_batches_file = "failed_batches.json"
 
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        for attempt in range(retries):
-            try:
-                logging.info(f"Generating embeddings for batch {i // batch_size + 1} with {len(batch)} texts.")
-                response = genai_client.models.embed_content(
-                    model="text-embedding-005",
-                    contents=batch,
-                    config=EmbedContentConfig(
-                        task_type="SEMANTIC_SIMILARITY",
-                        output_dimensionality=768
-                    )
+    Returns:
+        list: The embeddings of the batch, or None if every attempt failed.
+    """
+    for attempt in range(retries):
+        try:
+            response = genai_client.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=batch,
+                config=EmbedContentConfig(
+                    task_type=EMBEDDING_TASK_TYPE,
+                    output_dimensionality=EMBEDDING_DIMENSIONALITY
                 )
-                embeddings.extend([embedding.values for embedding in response.embeddings])
-                break  # Exit retry loop on success
-            except Exception as e:
-                logging.warning(f"Error generating embeddings for batch {i // batch_size + 1}: {str(e)}")
-                if attempt < retries - 1:
-                    exponential_backoff(attempt)
-                else:
-                    logging.error(f"Failed to generate embeddings for batch {i // batch_size + 1} after {retries} retries.")
-                    failed_batches.append(batch)
-
-        # Wait between batches to avoid hitting quotas
-        if i + batch_size < len(texts):
-            logging.info(f"Waiting {delay_between_batches} seconds before processing the next batch...")
-            time.sleep(delay_between_batches)
-
-    if failed_batches:
-        save_failed_batches(failed_batches, failed_batches_file)
+            )
+            return [embedding.values for embedding in response.embeddings]
+        except Exception as e:
+            logging.warning(f"Error generating embeddings: {str(e)}")
+            if attempt < retries - 1:
+                exponential_backoff(attempt)
+    return None
 
-    return embeddings
+def wait_between_batches(delay_between_batches):
+    """
+    Pause between two embedding calls to stay under the per-minute quota.
+    """
+    logging.info(f"Waiting {delay_between_batches} seconds before processing the next batch...")
+    time.sleep(delay_between_batches)
 
-def csv_to_jsonl_and_csv(input_csv, output_jsonl, output_csv, batch_size=250):
+def read_catalog_rows(input_csv, manifest=None, key_column=None):
     """
-    Convert a CSV file to a JSONL file with embeddings and simultaneously create a CSV file with id, embedding, and other columns.
+    Read the catalog rows that have a LONG_NAME, keyed by their datapoint id.
     Args:
         input_csv (str): Path to the input CSV file.
-        output_jsonl (str): Path to the output JSONL file.
-        output_csv (str): Path to the output CSV file.
-        batch_size (int): Number of rows to process in each batch.
+        manifest (dict): The last run's manifest, whose ids are kept (see assign_datapoint_ids).
+        key_column (str): Optional column holding a stable catalog key.
+
+    Returns:
+        dict: datapoint_id -> row, in file order. Duplicate rows are kept once.
     """
-    texts = []
     rows = []
-
-    # Read the input CSV and collect LONG_NAME values and rows
     with open(input_csv, mode="r", encoding="utf-8") as csv_file:
         reader = csv.DictReader(csv_file)
         for row in reader:
-            if row.get("LONG_NAME"):
-                texts.append(row["LONG_NAME"])
-                rows.append(row)
-            else:
+            if not row.get("LONG_NAME"):
                 logging.warning(f"Skipping row with missing or empty 'LONG_NAME': {row}")
+                continue
+            rows.append(row)
+    return assign_datapoint_ids(rows, manifest or {}, key_column)
 
-    # Open the JSONL and CSV files for writing
-    with open(output_jsonl, mode="a", encoding="utf-8") as jsonl_file, \
-         open(output_csv, mode="w", encoding="utf-8", newline="") as csv_file:
+def manifest_entries(rows, hashes):
+    """
+    Build the manifest of a completed run: datapoint_id -> content hash and NAME, OCS_NAME, LONG_NAME values.
+    """
+    return {datapoint_id: {"hash": hashes[datapoint_id], "columns": row_columns(rows[datapoint_id])} for datapoint_id in hashes}
 
-        # Write the CSV header
+def write_outputs(rows, embeddings, output_jsonl, output_csv):
+    """
+    Write the full JSONL (for the vector index) and CSV (for BigQuery) outputs.
+    Args:
+        rows (dict): datapoint_id -> row.
+        embeddings (dict): datapoint_id -> embedding. Rows without an embedding are left out.
+        output_jsonl (str): Path to the output JSONL file.
+        output_csv (str): Path to the output CSV file.
+    """
+    header = ["id", "embedding"] + list(CATALOG_COLUMNS)
+    with open(output_jsonl, mode="w", encoding="utf-8") as jsonl_file, \
+         open(output_csv, mode="w", encoding="utf-8", newline="") as csv_file:
         csv_writer = csv.writer(csv_file)
-        header = ["id", "embedding"] + list(rows[0].keys())
         csv_writer.writerow(header)
+        for datapoint_id, row in rows.items():
+            embedding = embeddings.get(datapoint_id)
+            if embedding is None:
+                continue
+            jsonl_file.write(json.dumps({"id": datapoint_id, "embedding": embedding}) + "\n")
+            csv_writer.writerow([datapoint_id, json.dumps(embedding)] + [row.get(column, "") for column in CATALOG_COLUMNS])
+
+def csv_to_jsonl_and_csv(input_csv, output_jsonl, output_csv, batch_size=250, manifest_path=manifest_path,
+                         delay_between_batches=10, key_column=None):
+    """
+    Convert a CSV file to a JSONL file with embeddings and simultaneously create a CSV file with id, embedding, and other columns.
+    Every row is re-embedded; use incremental_embeddings to only embed new or changed rows afterwards.
+    Args:
+        input_csv (str): Path to the input CSV file.
+        output_jsonl (str): Path to the output JSONL file.
+        output_csv (str): Path to the output CSV file.
+        batch_size (int): Number of rows to process in each batch.
+        manifest_path (str): Path to the manifest used by later incremental runs; its ids are kept.
+        delay_between_batches (int): Delay (in seconds) between batches to avoid hitting quotas.
+        key_column (str): Optional column holding a stable catalog key, from which the ids are derived.
+    """
+    rows = read_catalog_rows(input_csv, load_manifest(manifest_path), key_column)
+    ids = list(rows)
+    embeddings = {}
+    failed_batches = []
+
+    # Process the data in batches, one embedding call per batch
+    for i in range(0, len(ids), batch_size):
+        if i:
+            wait_between_batches(delay_between_batches)
+        batch_ids = ids[i:i + batch_size]
+        batch_texts = [rows[datapoint_id]["LONG_NAME"] for datapoint_id in batch_ids]
+        batch_embeddings = embed_batch(batch_texts)
+        if batch_embeddings is None:
+            logging.error(f"Failed to process batch {i // batch_size + 1}.")
+            failed_batches.append(batch_texts)
+            continue
+        embeddings.update(zip(batch_ids, batch_embeddings))
+        logging.info(f"Successfully processed batch {i // batch_size + 1}.")
+
+    write_outputs(rows, embeddings, output_jsonl, output_csv)
+    with open(manifest_path, mode="w", encoding="utf-8") as file:
+        hashes = {datapoint_id: content_hash(rows[datapoint_id]["LONG_NAME"]) for datapoint_id in embeddings}
+        json.dump(manifest_entries(rows, hashes), file)
+    if failed_batches:
+        save_failed_batches(failed_batches)
 
-        # Process the data in batches
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            batch_rows = rows[i:i + batch_size]
+def load_manifest(manifest_path):
+    """
+    Load the manifest of the last completed run.
+    Returns:
+        dict: datapoint_id -> {"hash": content hash, "columns": NAME, OCS_NAME, LONG_NAME values}.
+        Manifests of earlier versions only hold hashes; their "columns" are None.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, mode="r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    return {
+        datapoint_id: entry if isinstance(entry, dict) else {"hash": entry, "columns": None}
+        for datapoint_id, entry in manifest.items()
+    }
+
+def load_embeddings_jsonl(path):
+    """
+    Load datapoint_id -> embedding from a JSONL file of {"id", "embedding"} records.
+    Later records win, so an append-only checkpoint can be replayed.
+    """
+    embeddings = {}
+    if not os.path.exists(path):
+        return embeddings
+    with open(path, mode="r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
             try:
-                # Generate embeddings for the current batch
-                embeddings = generate_embeddings_in_batches(batch_texts, batch_size=batch_size)
-
-                # Write to both JSONL and CSV files
-                for row, embedding in zip(batch_rows, embeddings):
-                    unique_id = str(uuid.uuid4())
-                    # Write to JSONL
-                    json_object = {"id": unique_id, "embedding": embedding}
-                    jsonl_file.write(json.dumps(json_object) + "\n")
-                    # Write to CSV
-                    csv_writer.writerow([unique_id, json.dumps(embedding)] + list(row.values()))
-
-                logging.info(f"Successfully processed and saved batch {i // batch_size + 1}.")
-            except Exception as e:
-                logging.error(f"Failed to process batch {i // batch_size + 1}: {str(e)}")
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line in the checkpoint
+                logging.warning(f"Ignoring unreadable line in {path}.")
+                continue
+            embeddings[record["id"]] = record
+    return embeddings
+
+def write_delta(upserts, deletes, delta_dir):
+    """
+    Write the incremental index update in the Vertex AI layout:
+    upserts as JSONL in the update directory and deleted ids in its `delete` subdirectory.
+    Args:
+        upserts (dict): datapoint_id -> embedding of new or changed rows.
+        deletes (list): Datapoint ids that are no longer in the catalog.
+        delta_dir (str): Output directory.
+    """
+    os.makedirs(os.path.join(delta_dir, "delete"), exist_ok=True)
+    with open(os.path.join(delta_dir, "upserts.json"), mode="w", encoding="utf-8") as file:
+        for datapoint_id, embedding in upserts.items():
+            file.write(json.dumps({"id": datapoint_id, "embedding": embedding}) + "\n")
+    with open(os.path.join(delta_dir, "delete", "deletes.txt"), mode="w", encoding="utf-8") as file:
+        for datapoint_id in deletes:
+            file.write(datapoint_id + "\n")
+    logging.info(f"Wrote index delta with {len(upserts)} upserts and {len(deletes)} deletes to {delta_dir}.")
+
+def incremental_embeddings(input_csv, output_jsonl, output_csv, manifest_path=manifest_path,
+                           checkpoint_path=checkpoint_path, delta_dir=delta_dir, batch_size=250, delay_between_batches=10,
+                           key_column=None):
+    """
+    Embed only the catalog rows that are new or whose LONG_NAME changed since the last completed run.
+    Rows keep their datapoint id across edits, so a changed row is re-embedded and upserted under its id.
+    Each embedded batch is appended to a checkpoint file, so a crashed run resumes where it stopped.
+    Once every row is embedded, the full outputs, an index delta and the new manifest are written
+    and the checkpoint is removed.
+    Args:
+        input_csv (str): Path to the input CSV file.
+        output_jsonl (str): Path to the full JSONL output of the previous and current run.
+        output_csv (str): Path to the output CSV file.
+        manifest_path (str): Path to the datapoint_id -> content hash manifest.
+        checkpoint_path (str): Path to the append-only checkpoint of the current run.
+        delta_dir (str): Output directory of the index delta.
+        batch_size (int): Number of rows per embedding call.
+        delay_between_batches (int): Delay (in seconds) between batches to avoid hitting quotas.
+        key_column (str): Optional column holding a stable catalog key, from which the ids are derived.
+
+    Returns:
+        bool: True if every row has an embedding and the run was published.
+    """
+    manifest = load_manifest(manifest_path)
+    rows = read_catalog_rows(input_csv, manifest, key_column)
+    hashes = {datapoint_id: content_hash(row["LONG_NAME"]) for datapoint_id, row in rows.items()}
+
+    # Embeddings of the last completed run, and of the batches already done by a crashed run
+    previous = {k: v["embedding"] for k, v in load_embeddings_jsonl(output_jsonl).items() if k in manifest}
+    checkpoint = load_embeddings_jsonl(checkpoint_path)
+
+    embeddings = {}
+    upserts = {}
+    to_embed = []
+    for datapoint_id, row_hash in hashes.items():
+        if manifest.get(datapoint_id, {}).get("hash") == row_hash and datapoint_id in previous:
+            embeddings[datapoint_id] = previous[datapoint_id]
+        elif checkpoint.get(datapoint_id, {}).get("hash") == row_hash:
+            embeddings[datapoint_id] = upserts[datapoint_id] = checkpoint[datapoint_id]["embedding"]
+        else:
+            to_embed.append(datapoint_id)
+    deletes = [datapoint_id for datapoint_id in manifest if datapoint_id not in hashes]
+    logging.info(
+        f"{len(rows)} catalog rows: {len(rows) - len(to_embed) - len(upserts)} unchanged, "
+        f"{len(upserts)} restored from checkpoint, {len(to_embed)} to embed, {len(deletes)} deleted."
+    )
+
+    failed = False
+    with open(checkpoint_path, mode="a", encoding="utf-8") as checkpoint_file:
+        for i in range(0, len(to_embed), batch_size):
+            if i:
+                wait_between_batches(delay_between_batches)
+            batch_ids = to_embed[i:i + batch_size]
+            batch_embeddings = embed_batch([rows[datapoint_id]["LONG_NAME"] for datapoint_id in batch_ids])
+            if batch_embeddings is None:
+                logging.error(f"Failed to embed batch {i // batch_size + 1}; rerun to resume from the checkpoint.")
+                failed = True
+                continue
+            for datapoint_id, embedding in zip(batch_ids, batch_embeddings):
+                embeddings[datapoint_id] = upserts[datapoint_id] = embedding
+                record = {"id": datapoint_id, "hash": hashes[datapoint_id], "embedding": embedding}
+                checkpoint_file.write(json.dumps(record) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+            logging.info(f"Checkpointed batch {i // batch_size + 1} ({len(batch_ids)} rows).")
+
+    if failed:
+        return False
+
+    write_outputs(rows, embeddings, output_jsonl, output_csv)
+    write_delta(upserts, deletes, delta_dir)
+    with open(manifest_path, mode="w", encoding="utf-8") as file:
+        json.dump(manifest_entries(rows, hashes), file)
+    os.remove(checkpoint_path)
+    logging.info("Incremental embedding run completed.")
+    return True
+
 def upload_to_gcs(output_jsonl, bucket_name, gcs_path):
     """
     Upload a file to Google Cloud Storage.
@@ -167,9 +448,26 @@ def upload_to_gcs(output_jsonl, bucket_name, gcs_path):
             else:
                 logging.error(f"Failed to upload {output_jsonl} to GCS after multiple retries.")
 
+def upload_delta_to_gcs(delta_dir, bucket_name, gcs_delta_path):
+    """
+    Upload the index delta directory to Google Cloud Storage, keeping its layout.
+    """
+    upload_to_gcs(os.path.join(delta_dir, "upserts.json"), bucket_name, f"{gcs_delta_path}/upserts.json")
+    upload_to_gcs(os.path.join(delta_dir, "delete", "deletes.txt"), bucket_name, f"{gcs_delta_path}/delete/deletes.txt")
+
 if __name__ == "__main__":
-    # Generate JSONL and CSV files simultaneously
-    csv_to_jsonl_and_csv(input_csv, output_jsonl, output_csv, batch_size=250)
+    parser = argparse.ArgumentParser(description="Generate catalog embeddings and upload them to GCS.")
+    parser.add_argument("--incremental", action="store_true", help="Only embed new or changed rows and upload an index delta.")
+    parser.add_argument("--key-column", help="Catalog column holding a stable key (e.g. a SKU) to derive the ids from.")
+    args = parser.parse_args()
+
+    if args.incremental:
+        # Embed new or changed rows, resuming from the checkpoint of a crashed run
+        if incremental_embeddings(input_csv, output_jsonl, output_csv, key_column=args.key_column):
+            upload_delta_to_gcs(delta_dir, bucket_name, gcs_delta_path)
+    else:
+        # Generate JSONL and CSV files simultaneously
+        csv_to_jsonl_and_csv(input_csv, output_jsonl, output_csv, batch_size=250, key_column=args.key_column)
 
-    # Upload JSONL to GCS
-    upload_to_gcs(output_jsonl, bucket_name, gcs_path)
\ No newline at end of file
+        # Upload JSONL to GCS
+        upload_to_gcs(output_jsonl, bucket_name, gcs_path)